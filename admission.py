@@ -0,0 +1,266 @@
+import asyncio
+import contextlib
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import config
+import metrics
+from batch import RateLimiter
+
+
+# Lanes by name. Waiting requests of a lower `priority` value are admitted
+# first; `share` caps the fraction of the concurrency budget a lane may hold,
+# so a long batch can't take every slot. ADMISSION_LANES (JSON) overrides
+# fields, e.g. {"batch": {"share": 0.25}}.
+LANES: Dict[str, dict] = {
+    "interactive": {
+        "priority": 0,
+        "share": 1.0,
+        "queue": config.ADMISSION_QUEUE,
+        "queue_timeout": config.ADMISSION_QUEUE_TIMEOUT,
+    },
+    "batch": {
+        "priority": 1,
+        "share": 0.5,
+        "queue": max(1, config.ADMISSION_QUEUE // 4),
+        "queue_timeout": config.ADMISSION_QUEUE_TIMEOUT,
+    },
+}
+for _name, _overrides in json.loads(config.ADMISSION_LANES or "{}").items():
+    LANES[_name] = {**LANES.get(_name, LANES["interactive"]), **_overrides}
+
+# Clients whose token buckets are kept; the least recently seen are dropped
+MAX_CLIENTS = 10000
+
+WAIT_SECONDS = metrics.histogram(
+    "admission_wait_seconds", "Time admitted requests waited for a slot", ("lane",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class AdmissionRejected(Exception):
+    # 429 when a client is over its rate, 503 when the worker is saturated
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class AdmissionController:
+    # Bounds the requests a worker runs at once. Requests over the budget wait
+    # in a short queue per lane and are rejected when it is full or when they
+    # can't start within the lane's queue_timeout, instead of piling up in
+    # front of a slow backend. A released slot goes straight to the next
+    # waiter of the most important lane.
+
+    def __init__(
+        self,
+        max_concurrency: int = config.ADMISSION_MAX_CONCURRENCY,
+        lanes: Optional[Dict[str, dict]] = None,
+        client_rate: float = config.ADMISSION_CLIENT_RATE,
+        client_burst: int = config.ADMISSION_CLIENT_BURST,
+    ):
+        self.max_concurrency = max_concurrency
+        self.lanes = lanes or LANES
+        self.order = sorted(self.lanes, key=lambda name: self.lanes[name]["priority"])
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.in_flight = 0
+        self.lane_in_flight = {name: 0 for name in self.lanes}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in self.lanes}
+        self._clients: "OrderedDict[str, RateLimiter]" = OrderedDict()
+        self.counters: Dict[str, Dict[str, int]] = {
+            name: {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+            for name in self.lanes
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def _lane_limit(self, lane: str) -> int:
+        return max(1, int(self.max_concurrency * self.lanes[lane]["share"]))
+
+    def _can_run(self, lane: str) -> bool:
+        return self.in_flight < self.max_concurrency and self.lane_in_flight[lane] < self._lane_limit(lane)
+
+    def _waiting_ahead(self, lane: str) -> bool:
+        priority = self.lanes[lane]["priority"]
+        return any(
+            self._waiters[name] for name in self.order if self.lanes[name]["priority"] <= priority
+        )
+
+    def _start(self, lane: str) -> None:
+        self.in_flight += 1
+        self.lane_in_flight[lane] += 1
+        self.counters[lane]["admitted"] += 1
+
+    def check_rate(self, lane: str, client: str) -> None:
+        # Charges the client's token bucket; raises AdmissionRejected (429)
+        if self.client_rate <= 0 or not client:
+            return
+        bucket = self._clients.get(client)
+        if bucket is None:
+            bucket = self._clients[client] = RateLimiter(self.client_rate, self.client_burst)
+            if len(self._clients) > MAX_CLIENTS:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client)
+        wait = bucket.try_acquire()
+        if wait:
+            self.counters[lane]["rate_limited"] += 1
+            raise AdmissionRejected(429, "Too many requests from this client", wait)
+
+    async def acquire(self, lane: str, client: str = "") -> None:
+        # Returns once the request holds a slot; raises AdmissionRejected
+        self.check_rate(lane, client)
+        if self._can_run(lane) and not self._waiting_ahead(lane):
+            self._start(lane)
+            WAIT_SECONDS.observe(0.0, lane)
+            return
+        settings = self.lanes[lane]
+        waiters = self._waiters[lane]
+        if len(waiters) >= settings["queue"]:
+            self.counters[lane]["queue_full"] += 1
+            raise AdmissionRejected(503, "Server is overloaded", settings["queue_timeout"])
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiters.append(future)
+        self.counters[lane]["queued"] += 1
+        start = time.perf_counter()
+        timer = loop.call_later(settings["queue_timeout"], self._expire, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the cancellation
+            if future.done() and not future.cancelled():
+                self.release(lane)
+            raise
+        except AdmissionRejected:
+            self.counters[lane]["queue_timeout"] += 1
+            raise
+        finally:
+            timer.cancel()
+            if future in waiters:
+                waiters.remove(future)
+        WAIT_SECONDS.observe(time.perf_counter() - start, lane)
+
+    def _expire(self, future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_exception(AdmissionRejected(503, "Server is overloaded", 1.0))
+
+    def release(self, lane: str) -> None:
+        self.in_flight -= 1
+        self.lane_in_flight[lane] -= 1
+        for name in self.order:
+            waiters = self._waiters[name]
+            while waiters and self._can_run(name):
+                future = waiters.popleft()
+                if not future.done():
+                    self._start(name)
+                    future.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, lane: str, client: str = ""):
+        if not self.enabled:
+            yield
+            return
+        await self.acquire(lane, client)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "clients_tracked": len(self._clients),
+            "lanes": {
+                name: {
+                    **settings,
+                    "limit": self._lane_limit(name),
+                    "in_flight": self.lane_in_flight[name],
+                    "waiting": len(self._waiters[name]),
+                    **self.counters[name],
+                }
+                for name, settings in self.lanes.items()
+            },
+        }
+
+
+def client_id(scope) -> str:
+    for key, value in scope.get("headers", ()):
+        if key == b"x-client-id":
+            return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+class AdmissionMiddleware:
+    # ASGI middleware that runs the requests to `routes` ({path: lane}) through
+    # the controller and answers rejected ones with 429/503 and Retry-After
+    # without reaching the endpoint. Other paths (admin, metrics) pass through.
+
+    def __init__(self, app, controller: AdmissionController, routes: Dict[str, str]):
+        self.app = app
+        self.controller = controller
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        lane = self.routes.get(scope["path"]) if scope["type"] == "http" else None
+        if lane is None or scope["method"] == "OPTIONS" or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.controller.acquire(lane, client_id(scope))
+        except AdmissionRejected as e:
+            await send_rejection(send, e)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(lane)
+
+
+async def send_rejection(send, error: AdmissionRejected) -> None:
+    body = json.dumps({"detail": error.reason}).encode("utf-8")
+    headers: List[Tuple[bytes, bytes]] = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ]
+    headers.extend((key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in error.headers().items())
+    await send({"type": "http.response.start", "status": error.status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def register_admission_metrics(controller: AdmissionController) -> None:
+    metrics.gauge(
+        "admission_events_total", "Requests admitted, queued and rejected per lane",
+        lambda: {
+            (lane, event): value
+            for lane, counters in controller.counters.items()
+            for event, value in counters.items()
+        },
+        ("lane", "event"), kind="counter",
+    )
+    metrics.gauge(
+        "admission_in_flight", "Requests holding an admission slot per lane",
+        lambda: {(lane,): count for lane, count in controller.lane_in_flight.items()},
+        ("lane",),
+    )
+    metrics.gauge(
+        "admission_waiting", "Requests waiting for an admission slot per lane",
+        lambda: {(lane,): len(waiters) for lane, waiters in controller._waiters.items()},
+        ("lane",),
+    )
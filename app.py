@@ -1,38 +1,44 @@
-from fastapi import FastAPI, Form
-from starlette.responses import HTMLResponse
-import requests
-import subprocess
-
-app = FastAPI()
-
-def get_access_token():
-    # Obtain access token from gcloud
-    command = "gcloud auth print-access-token"
-    token = subprocess.check_output(command, shell=True).decode("utf-8").strip()
-    return token
-
-def converse(query):
-    # url = "https://discoveryengine.googleapis.com/v1alpha/projects/477054480627/locations/global/collections/default_collection/dataStores/genai-anytime_1698398847402/conversations/-:converse"
-    url = "https://discoveryengine.googleapis.com/v1alpha/projects/413847466250/locations/global/collections/default_collection/dataStores/kms-agent-datastore/servingConfigs/default_search:search"
-
-    headers = {
-        "Authorization": f"Bearer {get_access_token()}",
-        "Content-Type": "application/json"
-    }
-
-    data = {
-        "query": {"input": query},
-        "summarySpec": {
-            "summaryResultCount": 5,
-            "ignoreAdversarialQuery": True,
-            "includeCitations": True
-        }
-    }
-
-    response = requests.post(url, headers=headers, json=data)
-    return response.json()
-
-@app.get("/", response_class=HTMLResponse)
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, FastAPI, Form, HTTPException
+from starlette.responses import HTMLResponse, PlainTextResponse
+
+import metrics
+from backends import build_search_backend
+from resilience import error_status, retry_headers
+from search_pipeline import DEFAULT_SEARCH_SPEC
+
+router = APIRouter()
+
+project_number = "413847466250"
+location = "global"
+data_store_id = "kms-agent-datastore"
+
+# The endpoint this service has always searched:
+# v1alpha/projects/413847466250/locations/global/collections/default_collection/dataStores/kms-agent-datastore/servingConfigs/default_search:search
+# SEARCH_TRANSPORT=grpc uses the v1 clients and the data store's default_config instead.
+REST_ENDPOINT = {"api_version": "v1alpha", "collection": "default_collection", "serving_config": "default_search"}
+
+# The request this endpoint has always sent: a five-result summary with
+# citations, and the API's defaults for everything else
+QUERY_SPEC = {
+    **DEFAULT_SEARCH_SPEC,
+    "return_snippet": False,
+    "ignore_non_summary_seeking_query": False,
+    "query_expansion": "CONDITION_UNSPECIFIED",
+    "spell_correction": "MODE_UNSPECIFIED",
+}
+
+# REST over pooled keep-alive (HTTP/2 when available) connections unless
+# SEARCH_TRANSPORT=grpc picks the gRPC clients. Opened on startup and closed
+# on shutdown, so each run of the app gets its own connection pool.
+search_backend = None
+
+async def converse(query):
+    # Answers with the API's SearchResponse JSON whichever transport is used
+    return await search_backend.search_json(project_number, location, data_store_id, query, QUERY_SPEC)
+
+@router.get("/", response_class=HTMLResponse)
 def read_root():
     html_content = """
     <html>
@@ -46,8 +52,33 @@ def read_root():
     """
     return HTMLResponse(content=html_content)
 
-@app.post("/query/")
-def get_query_response(q: str = Form(...)):
-    response = converse(q)
-    return response
+@router.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.post("/query/")
+async def get_query_response(q: str = Form(...)):
+    try:
+        return await converse(q)
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=f"An error occurred: {str(e)}", headers=retry_headers(e))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global search_backend
+    search_backend = build_search_backend("rest", rest_options=REST_ENDPOINT)
+    try:
+        yield
+    finally:
+        await search_backend.aclose()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(metrics.ServerTimingMiddleware)
+    app.include_router(router)
+    return app
+
 
+app = create_app()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import config
+from clients import async_clients_available, registry
+from metrics import timed
+from resilience import Resilience, build_resilience
+from search_pipeline import (
+    DEFAULT_SEARCH_SPEC,
+    build_converse_request,
+    seed_conversation,
+    build_search_request,
+    execute_search,
+    execute_search_async,
+    extract_summary,
+    flatten_results,
+)
+
+if TYPE_CHECKING:
+    from google.cloud import discoveryengine_v1 as discoveryengine
+
+
+class AsyncSearchBackend:
+    # Non-blocking access to Discovery Engine for the FastAPI endpoints.
+    # Calls go through the grpc.aio clients when available, otherwise through
+    # the sync clients on a bounded thread pool, so a slow backend call never
+    # stalls the event loop. At most `max_concurrency` calls are in flight and
+    # every call carries a `timeout` second deadline. Each endpoint's calls go
+    # through a Resilience wrapper (retries, hedging, circuit breaker).
+
+    def __init__(
+        self,
+        max_concurrency: int = config.BACKEND_MAX_CONCURRENCY,
+        timeout: float = config.BACKEND_TIMEOUT,
+        use_async_clients: Optional[bool] = None,
+        client_registry=registry,
+        resilience: Optional[Dict[str, Resilience]] = None,
+        converse_field_mask: str = config.CONVERSE_FIELD_MASK,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        # Resolved on first use; checking for grpc.aio imports the client libraries
+        self._use_async_clients = use_async_clients
+        self.registry = client_registry
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.resilience = resilience if resilience is not None else build_resilience(self.timeout)
+        self.converse_field_mask = converse_field_mask
+
+    @property
+    def use_async_clients(self) -> bool:
+        if self._use_async_clients is None:
+            self._use_async_clients = config.BACKEND_ASYNC_CLIENTS and async_clients_available()
+        return self._use_async_clients
+
+    def _run_in_thread(self, func, *args, **kwargs):
+        # The call's own timeout, when given, also bounds the wait for the thread
+        timeout = kwargs.get("timeout") or self.timeout
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency, thread_name_prefix="discoveryengine"
+            )
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+        return asyncio.wait_for(future, timeout)
+
+    async def search_response(
+        self,
+        project_id: str,
+        location: str,
+        data_store_id: str,
+        search_query: str,
+        spec: dict = DEFAULT_SEARCH_SPEC,
+    ) -> discoveryengine.SearchResponse:
+        with timed("search", "client"):
+            client = self.registry.get(location, "search_async" if self.use_async_clients else "search")
+            request = build_search_request(
+                client, project_id, location, data_store_id, search_query, spec
+            )
+
+        async def attempt(timeout: float) -> discoveryengine.SearchResponse:
+            async with self._semaphore:
+                with timed("search", "rpc"):
+                    if self.use_async_clients:
+                        return await execute_search_async(client, request, timeout=timeout)
+                    return await self._run_in_thread(execute_search, client, request, timeout=timeout)
+
+        return await self.resilience["search"].call(attempt)
+
+    async def search(
+        self,
+        project_id: str,
+        location: str,
+        data_store_id: str,
+        search_query: str,
+        spec: dict = DEFAULT_SEARCH_SPEC,
+    ) -> Tuple[List[dict], str]:
+        response = await self.search_response(project_id, location, data_store_id, search_query, spec)
+        with timed("search", "flatten"):
+            results = flatten_results(response)
+        with timed("search", "summary"):
+            summary = extract_summary(response)
+        return results, summary
+
+    async def converse(
+        self,
+        project_id: str,
+        location: str,
+        data_store_id: str,
+        conversation_name: str,
+        current_query: str,
+    ) -> discoveryengine.ConverseConversationResponse:
+        with timed("converse", "client"):
+            client = self.registry.get(
+                location, "conversation_async" if self.use_async_clients else "conversation"
+            )
+            request = build_converse_request(
+                client, project_id, location, data_store_id, conversation_name, current_query
+            )
+
+        # Response fields limited to what we render, without the conversation transcript
+        metadata = (("x-goog-fieldmask", self.converse_field_mask),) if self.converse_field_mask else ()
+
+        async def attempt(timeout: float) -> discoveryengine.ConverseConversationResponse:
+            async with self._semaphore:
+                with timed("converse", "rpc"):
+                    if self.use_async_clients:
+                        return await client.converse_conversation(request, timeout=timeout, metadata=metadata)
+                    return await self._run_in_thread(
+                        client.converse_conversation, request, timeout=timeout, metadata=metadata
+                    )
+
+        return await self.resilience["converse"].call(attempt)
+
+    async def create_conversation(
+        self,
+        project_id: str,
+        location: str,
+        data_store_id: str,
+        context: Optional[List[Tuple[str, str]]] = None,
+    ):
+        # `context` holds (question, reply) pairs that seed the new conversation
+        kind = "conversation_async" if self.use_async_clients else "conversation"
+        client = self.registry.get(location, kind)
+        parent = client.data_store_path(project=project_id, location=location, data_store=data_store_id)
+        conversation = seed_conversation(context or ())
+
+        async def attempt(timeout: float):
+            kwargs = dict(parent=parent, conversation=conversation, timeout=timeout)
+            async with self._semaphore:
+                with timed("converse", "create_conversation"):
+                    if self.use_async_clients:
+                        return await client.create_conversation(**kwargs)
+                    return await self._run_in_thread(client.create_conversation, **kwargs)
+
+        return await self.resilience["create_conversation"].call(attempt)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
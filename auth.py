@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+import threading
+from typing import Callable, Optional
+
+import config
+
+
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+
+def _utcnow() -> datetime.datetime:
+    # google-auth stores credential expiry as a naive UTC datetime
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _default_transport_request():
+    from google.auth.transport.requests import Request
+
+    return Request()
+
+
+class TokenProvider:
+    # Loads application default credentials once and hands out the cached
+    # access token. The token is refreshed under a lock once it is within
+    # `refresh_margin` seconds of expiry, so callers never see an expired token
+    # and concurrent callers trigger a single refresh.
+    #
+    # Pass `credentials` (anything with token, expiry and refresh(request)) and
+    # `transport_request` to use it without google-auth defaults or network.
+
+    def __init__(
+        self,
+        credentials=None,
+        refresh_margin: float = config.TOKEN_REFRESH_MARGIN,
+        transport_request: Optional[Callable[[], object]] = None,
+        now: Callable[[], datetime.datetime] = _utcnow,
+    ):
+        self._credentials = credentials
+        self.refresh_margin = refresh_margin
+        self._transport_request = transport_request or _default_transport_request
+        self._now = now
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def _needs_refresh(self) -> bool:
+        credentials = self._credentials
+        if credentials is None or not credentials.token:
+            return True
+        if credentials.expiry is None:
+            return False
+        remaining = (credentials.expiry - self._now()).total_seconds()
+        return remaining <= self.refresh_margin
+
+    def token(self) -> str:
+        if not self._needs_refresh():
+            return self._credentials.token
+        with self._lock:
+            if self._credentials is None:
+                import google.auth
+
+                self._credentials, _ = google.auth.default(scopes=SCOPES)
+            if self._needs_refresh():
+                self._credentials.refresh(self._transport_request())
+                self.refreshes += 1
+            return self._credentials.token
+
+    async def token_async(self) -> str:
+        # For the event loop: a refresh is a blocking HTTP call, so it runs on
+        # the default executor; the cached token is returned directly
+        if not self._needs_refresh():
+            return self._credentials.token
+        return await asyncio.get_running_loop().run_in_executor(None, self.token)
+
+
+class StaticCredentials:
+    # Fixed token for local stand-ins that do not check credentials
+
+    def __init__(self, token: str = "local-token"):
+        self.token = token
+        self.expiry = None
+
+    def refresh(self, request) -> None:
+        pass
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from async_backend import AsyncSearchBackend
+from auth import StaticCredentials, TokenProvider
+from clients import discoveryengine_module
+from metrics import timed
+from resilience import Resilience, build_resilience
+from search_pipeline import (
+    DEFAULT_SEARCH_SPEC,
+    build_search_body,
+    extract_summary,
+    flatten_result,
+    serving_config_name,
+)
+
+
+class SearchBackend(ABC):
+    # Discovery Engine search over one transport. search_response() returns
+    # the transport's own response object; iter_results() and summary() read
+    # it, so callers can stream results without knowing the transport.
+    # search() gives the flattened (results, summary) of main.py's /search and
+    # search_json() the REST API's JSON, as app.py's /query/ returns it.
+
+    name = ""
+    resilience: Dict[str, Resilience]
+
+    @abstractmethod
+    async def search_response(
+        self,
+        project_id: str,
+        location: str,
+        data_store_id: str,
+        search_query: str,
+        spec: dict = DEFAULT_SEARCH_SPEC,
+    ) -> Any:
+        ...
+
+    @abstractmethod
+    def iter_results(self, response) -> Iterable[dict]:
+        ...
+
+    @abstractmethod
+    def summary(self, response) -> str:
+        ...
+
+    @abstractmethod
+    def to_json(self, response) -> dict:
+        ...
+
+    async def search(
+        self,
+        project_id: str,
+        location: str,
+        data_store_id: str,
+        search_query: str,
+        spec: dict = DEFAULT_SEARCH_SPEC,
+    ) -> Tuple[List[dict], str]:
+        response = await self.search_response(project_id, location, data_store_id, search_query, spec)
+        with timed("search", "flatten"):
+            results = list(self.iter_results(response))
+        return results, self.summary(response)
+
+    async def search_json(
+        self,
+        project_id: str,
+        location: str,
+        data_store_id: str,
+        search_query: str,
+        spec: dict = DEFAULT_SEARCH_SPEC,
+    ) -> dict:
+        response = await self.search_response(project_id, location, data_store_id, search_query, spec)
+        with timed("search", "decode"):
+            return self.to_json(response)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class GrpcSearchBackend(SearchBackend):
+    # The gRPC clients through AsyncSearchBackend
+
+    name = "grpc"
+
+    def __init__(self, backend: Optional[AsyncSearchBackend] = None):
+        self.backend = backend if backend is not None else AsyncSearchBackend()
+        self.resilience = self.backend.resilience
+
+    async def search_response(self, project_id, location, data_store_id, search_query, spec=DEFAULT_SEARCH_SPEC):
+        return await self.backend.search_response(project_id, location, data_store_id, search_query, spec)
+
+    def iter_results(self, response) -> Iterable[dict]:
+        return (flatten_result(item) for item in response.results)
+
+    def summary(self, response) -> str:
+        return extract_summary(response)
+
+    def to_json(self, response) -> dict:
+        return json.loads(discoveryengine_module().SearchResponse.to_json(response))
+
+    async def search(self, project_id, location, data_store_id, search_query, spec=DEFAULT_SEARCH_SPEC):
+        # Flattens in one pass over the raw protobuf
+        return await self.backend.search(project_id, location, data_store_id, search_query, spec)
+
+    async def aclose(self) -> None:
+        self.backend.close()
+
+
+class RestError(Exception):
+    # A non-2xx answer from the REST API; `code` is its HTTP status, as on
+    # GoogleAPICallError, so resilience treats both transports alike
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class RestSearchBackend(SearchBackend):
+    # The REST API through one shared httpx.AsyncClient: connections are kept
+    # alive and, with HTTP/2, concurrent searches are multiplexed over them.
+    # Falls back to HTTP/1.1 when the h2 package is missing. `api_version`,
+    # `collection` and `serving_config` pick the endpoint searched.
+
+    name = "rest"
+
+    def __init__(
+        self,
+        rest_root: str = config.DISCOVERYENGINE_REST_ROOT,
+        max_connections: int = config.HTTP_POOL_SIZE,
+        max_concurrency: int = config.BACKEND_MAX_CONCURRENCY,
+        timeout: float = config.BACKEND_TIMEOUT,
+        http2: bool = config.REST_HTTP2,
+        token_provider: Optional[TokenProvider] = None,
+        resilience: Optional[Dict[str, Resilience]] = None,
+        api_version: str = "v1",
+        collection: str = "",
+        serving_config: str = "default_config",
+    ):
+        try:
+            import httpx
+        except ImportError:
+            raise RuntimeError("SEARCH_TRANSPORT=rest needs the httpx package")
+        self.rest_root = rest_root.rstrip("/")
+        self.api_version = api_version
+        self.collection = collection
+        self.serving_config = serving_config
+        self.timeout = timeout
+        # A plaintext REST root is a local stand-in that does not check tokens
+        self.token_provider = token_provider or TokenProvider(
+            StaticCredentials() if rest_root.startswith("http://") else None
+        )
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        try:
+            self._client = httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+            self.http2 = http2
+        except ImportError:
+            self._client = httpx.AsyncClient(limits=limits, timeout=timeout)
+            self.http2 = False
+        self._httpx = httpx
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.resilience = resilience if resilience is not None else build_resilience(timeout)
+
+    def url(self, project_id: str, location: str, data_store_id: str) -> str:
+        name = serving_config_name(project_id, location, data_store_id, self.serving_config, self.collection)
+        return f"{self.rest_root}/{self.api_version}/{name}:search"
+
+    async def search_response(self, project_id, location, data_store_id, search_query, spec=DEFAULT_SEARCH_SPEC) -> dict:
+        url = self.url(project_id, location, data_store_id)
+        body = build_search_body(search_query, spec)
+
+        async def attempt(timeout: float) -> dict:
+            with timed("rest", "token"):
+                headers = {"Authorization": f"Bearer {await self.token_provider.token_async()}"}
+            async with self._semaphore:
+                with timed("rest", "rpc"):
+                    try:
+                        response = await self._client.post(url, json=body, headers=headers, timeout=timeout)
+                    except self._httpx.TimeoutException as e:
+                        raise asyncio.TimeoutError(str(e))
+                    except self._httpx.TransportError as e:
+                        raise RestError(503, f"{type(e).__name__}: {e}")
+            if response.status_code >= 400:
+                try:
+                    message = response.json().get("error", {}).get("message", response.reason_phrase)
+                except ValueError:
+                    message = response.reason_phrase
+                raise RestError(response.status_code, message)
+            with timed("rest", "decode"):
+                return response.json()
+
+        return await self.resilience["search"].call(attempt)
+
+    def iter_results(self, response: dict) -> Iterable[dict]:
+        return (result.get("document", {}).get("derivedStructData", {}) for result in response.get("results", ()))
+
+    def summary(self, response: dict) -> str:
+        return response.get("summary", {}).get("summaryText", "")
+
+    def to_json(self, response: dict) -> dict:
+        return response
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def build_search_backend(
+    default: str = "grpc",
+    grpc_backend: Optional[AsyncSearchBackend] = None,
+    transport: str = config.SEARCH_TRANSPORT,
+    rest_options: Optional[dict] = None,
+) -> SearchBackend:
+    # SEARCH_TRANSPORT wins over the service's `default`. `rest_options` are
+    # RestSearchBackend arguments.
+    transport = transport or default
+    if transport == "grpc":
+        return GrpcSearchBackend(grpc_backend)
+    if transport == "rest":
+        return RestSearchBackend(**(rest_options or {}))
+    raise ValueError(f"Unsupported SEARCH_TRANSPORT: {transport}")
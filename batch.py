@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import config
+
+
+SearchFn = Callable[[str], Awaitable[Tuple[List[dict], str]]]
+
+
+class RateLimiter:
+    # Token bucket: on average `rate` acquisitions per second, with bursts of
+    # up to `burst`. Waiters are served in arrival order.
+
+    def __init__(self, rate: float = config.BATCH_RATE_PER_SECOND, burst: int = config.BATCH_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def try_acquire(self) -> float:
+        # Takes a token without waiting; returns 0 on success, otherwise the
+        # seconds until one is available
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+def batch_item(index: int, query: str, response=None, error: Optional[BaseException] = None) -> Dict:
+    if error is not None:
+        return {"index": index, "query": query, "ok": False, "error": f"{type(error).__name__}: {error}"}
+    results, summary = response
+    return {"index": index, "query": query, "ok": True, "results": results, "summary": summary}
+
+
+async def iter_search_batch(
+    queries: Sequence[str],
+    search: SearchFn,
+    max_concurrency: int = config.BATCH_CONCURRENCY,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> AsyncIterator[Dict]:
+    # Yields one item per query as it completes; "index" gives its position.
+    # A failing query yields an error item and does not stop the batch.
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(index: int, query: str) -> Dict:
+        async with semaphore:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            try:
+                return batch_item(index, query, await search(query))
+            except Exception as e:
+                return batch_item(index, query, error=e)
+
+    tasks = [asyncio.ensure_future(run(i, query)) for i, query in enumerate(queries)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def search_batch(
+    queries: Sequence[str],
+    search: SearchFn,
+    max_concurrency: int = config.BATCH_CONCURRENCY,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> List[Dict]:
+    # Same as iter_search_batch, collected in input order
+    items: List[Optional[Dict]] = [None] * len(queries)
+    async for item in iter_search_batch(queries, search, max_concurrency, rate_limiter):
+        items[item["index"]] = item
+    return items
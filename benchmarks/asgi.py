@@ -0,0 +1,107 @@
+# Minimal in-process ASGI driver for the benchmarks: no sockets and no HTTP
+# client dependency, so measurements cover our own request handling only.
+
+import asyncio
+import json
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+
+class Response:
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.status = status
+        self.headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in headers}
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+async def request(
+    app,
+    method: str,
+    path: str,
+    json_body=None,
+    form: Optional[Dict[str, str]] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    body = b""
+    request_headers = dict(headers or {})
+    if json_body is not None:
+        body = json.dumps(json_body).encode("utf-8")
+        request_headers.setdefault("content-type", "application/json")
+    elif form is not None:
+        body = urlencode(form).encode("utf-8")
+        request_headers.setdefault("content-type", "application/x-www-form-urlencoded")
+    request_headers["content-length"] = str(len(body))
+    path, _, query_string = path.partition("?")
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": query_string.encode("utf-8"),
+        "root_path": "",
+        "headers": [
+            (key.lower().encode("latin-1"), value.encode("latin-1"))
+            for key, value in request_headers.items()
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    status = 500
+    response_headers: List[Tuple[bytes, bytes]] = []
+    chunks: List[bytes] = []
+
+    async def send(message):
+        nonlocal status, response_headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+    return Response(status, response_headers, b"".join(chunks))
+
+
+class Lifespan:
+    # Runs the app's startup handlers on enter and shutdown handlers on exit
+
+    def __init__(self, app):
+        self.app = app
+        self._incoming: asyncio.Queue = asyncio.Queue()
+        self._outgoing: asyncio.Queue = asyncio.Queue()
+        self._task = None
+
+    async def __aenter__(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._task = asyncio.ensure_future(self.app(scope, self._incoming.get, self._outgoing.put))
+        await self._incoming.put({"type": "lifespan.startup"})
+        message = await self._outgoing.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"Startup failed: {message}")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._incoming.put({"type": "lifespan.shutdown"})
+        await self._outgoing.get()
+        await self._task
@@ -0,0 +1,125 @@
+# Overload benchmark for admission control.
+#
+# Sends requests at a fixed arrival rate above what a slow backend stub can
+# serve (--capacity calls at once, --latency-ms each) through
+# AdmissionMiddleware, and reports latency percentiles of the requests that
+# were served next to the share that was rejected. Without admission every
+# request is admitted and waits in front of the backend, so latency grows for
+# the whole run; with it, served requests stay near the queue timeout plus the
+# backend latency. A mixed phase sends a quarter of the traffic as batch
+# requests and a last one adds a client over its rate limit.
+#
+#   python -m benchmarks.bench_admission --rate 800 --duration 5
+
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from admission import LANES, AdmissionController, AdmissionMiddleware
+from benchmarks import asgi
+from latency_stats import summarize
+
+
+ROUTES = {"/search": "interactive", "/search/batch": "batch"}
+
+
+def slow_backend(capacity: int, latency_ms: float):
+    # ASGI app standing in for the search endpoints: each request makes one
+    # call to a backend that serves `capacity` calls at a time
+    backend = asyncio.Semaphore(capacity)
+
+    async def app(scope, receive, send):
+        async with backend:
+            await asyncio.sleep(latency_ms / 1000)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"results": []}'})
+
+    return app
+
+
+async def run_phase(controller: AdmissionController, args, batch_share: float = 0.0, noisy_share: float = 0.0) -> Dict:
+    app = AdmissionMiddleware(slow_backend(args.capacity, args.latency_ms), controller, ROUTES)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    tasks = []
+
+    async def one(kind: str, path: str, client: str) -> None:
+        start = time.perf_counter()
+        response = await asgi.request(app, "POST", path, json_body={"message": "apa itu sisa kuota"}, headers={"x-client-id": client})
+        statuses[kind][response.status] += 1
+        if response.status == 200:
+            latencies[kind].append((time.perf_counter() - start) * 1000)
+
+    total = int(args.rate * args.duration)
+    start = time.perf_counter()
+    for i in range(total):
+        # Open loop: arrivals keep their schedule however slow responses get
+        delay = start + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        position = (i % 100) / 100
+        if position < batch_share:
+            kind, path, client = "batch", "/search/batch", "batch-job"
+        elif position < batch_share + noisy_share:
+            kind, path, client = "noisy", "/search", "noisy-client"
+        else:
+            kind, path, client = "interactive", "/search", f"user-{i % 500}"
+        tasks.append(asyncio.ensure_future(one(kind, path, client)))
+    await asyncio.gather(*tasks)
+
+    return {
+        kind: {
+            "served_latency_ms": summarize(latencies[kind]),
+            "statuses": dict(statuses[kind]),
+            "rejected": 1 - statuses[kind].get(200, 0) / max(1, sum(statuses[kind].values())),
+        }
+        for kind in sorted(statuses)
+    }
+
+
+async def run(args) -> Dict:
+    lanes = {name: {**settings, "queue_timeout": args.queue_timeout} for name, settings in LANES.items()}
+    phases = {
+        "no_admission": (AdmissionController(max_concurrency=0), {}),
+        "admission": (AdmissionController(args.max_concurrency, lanes), {}),
+        "admission+batch": (AdmissionController(args.max_concurrency, lanes), {"batch_share": 0.25}),
+        "admission+rate_limit": (
+            AdmissionController(args.max_concurrency, lanes, client_rate=args.client_rate, client_burst=args.client_rate),
+            {"noisy_share": 0.25},
+        ),
+    }
+    report = {"settings": vars(args), "phases": {}}
+    for name, (controller, mix) in phases.items():
+        result = await run_phase(controller, args, **mix)
+        report["phases"][name] = result
+        for kind, outcome in result.items():
+            latency = outcome["served_latency_ms"]
+            print(
+                f"{name:22s} {kind:12s} p50 {latency.get('p50', 0):8.1f}  p99 {latency.get('p99', 0):8.1f} ms"
+                f"  rejected {outcome['rejected']:6.1%}  {outcome['statuses']}"
+            )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=800.0, help="Arrivals per second")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--capacity", type=int, default=32, help="Backend calls served at once")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Backend latency per call")
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--queue-timeout", type=float, default=0.5)
+    parser.add_argument("--client-rate", type=float, default=20.0, help="Per-client requests per second")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Load benchmark for AsyncSearchBackend against a stubbed Discovery Engine.
+#
+# Fires N concurrent searches at a backend whose every call takes LATENCY
+# seconds. If calls overlap, wall time approaches ceil(N / concurrency) *
+# LATENCY instead of N * LATENCY.
+#
+#   python -m benchmarks.bench_async --requests 64 --latency 0.2
+
+import argparse
+import asyncio
+import json
+import time
+
+from google.cloud import discoveryengine_v1 as discoveryengine
+
+from async_backend import AsyncSearchBackend
+
+
+class StubSearchClient:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    @staticmethod
+    def serving_config_path(project, location, data_store, serving_config):
+        return f"projects/{project}/locations/{location}/dataStores/{data_store}/servingConfigs/{serving_config}"
+
+    def search(self, request, timeout=None):
+        time.sleep(self.latency)
+        return discoveryengine.SearchResponse(summary={"summary_text": request.query})
+
+
+class StubAsyncSearchClient(StubSearchClient):
+    async def search(self, request, timeout=None):
+        await asyncio.sleep(self.latency)
+        return discoveryengine.SearchResponse(summary={"summary_text": request.query})
+
+
+class StubRegistry:
+    def __init__(self, latency: float):
+        self.clients = {
+            "search": StubSearchClient(latency),
+            "search_async": StubAsyncSearchClient(latency),
+        }
+
+    def get(self, location, client_type="search"):
+        return self.clients[client_type]
+
+
+async def run(backend: AsyncSearchBackend, requests: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        backend.search("project", "global", "data-store", f"query {i}")
+        for i in range(requests)
+    ))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    serial = args.requests * args.latency
+    report = {"requests": args.requests, "latency": args.latency, "serial_seconds": serial}
+    for mode, use_async in (("async_clients", True), ("thread_pool", False)):
+        backend = AsyncSearchBackend(
+            max_concurrency=args.concurrency,
+            use_async_clients=use_async,
+            client_registry=StubRegistry(args.latency),
+        )
+        elapsed = asyncio.run(run(backend, args.requests))
+        backend.close()
+        report[mode] = {"seconds": round(elapsed, 3), "overlap": round(serial / elapsed, 1)}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
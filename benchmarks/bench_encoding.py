@@ -0,0 +1,109 @@
+# Search response encoding benchmark.
+#
+# Encodes [results, summary] payloads shaped like our data store's, with
+# snippets and extractive answers repeated --scale times, along each response
+# path: FastAPI's jsonable_encoder + json (returning the tuple from the route,
+# when fastapi is installed), json.dumps as Starlette's JSONResponse does (the
+# previous /search path), and encoding.encode_json with each coding. Reports
+# CPU time per response and bytes on the wire, including a repeated
+# GET /search revalidated with If-None-Match.
+#
+#   python -m benchmarks.bench_encoding --results 10 --scale 1,4,16
+
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+
+import encoding
+
+
+def sample_response(results: int, scale: int) -> List:
+    snippet = "Sisa kuota adalah jumlah kuota internet yang masih dapat digunakan sampai masa aktif paket berakhir. "
+    answer = "Untuk cek sisa kuota, tekan *888# atau buka aplikasi MyTelkomsel lalu pilih menu Kuota Saya. "
+    documents = [
+        {
+            "link": f"gs://kms-agent-datastore/faq/kuota-{i}.pdf",
+            "title": f"FAQ Kuota Internet {i}",
+            "snippets": [
+                {"snippet": f"{snippet} Paket {i}-{j}: {snippet[j % 40:]}", "snippet_status": "SUCCESS"}
+                for j in range(scale)
+            ],
+            "extractive_answers": [
+                {"content": f"{answer[j % 30:]} Halaman {j}. {answer} {snippet[i:]}", "pageNumber": str(i + 1)}
+                for j in range(scale)
+            ],
+            "score": 0.5 + i / 100,
+        }
+        for i in range(results)
+    ]
+    return [documents, "Sisa kuota dapat dicek melalui *888# atau aplikasi MyTelkomsel [1][2]."]
+
+
+def json_dumps(content) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def paths(accept_encoding: Dict[str, str]) -> Dict[str, Callable]:
+    candidates = {}
+    try:
+        from fastapi.encoders import jsonable_encoder
+
+        candidates["fastapi_default"] = lambda content: json_dumps(jsonable_encoder(tuple(content)))
+    except ImportError:
+        pass
+    candidates["json_response"] = json_dumps
+    for name, header in accept_encoding.items():
+        candidates[f"encode_json/{name}"] = (
+            lambda content, header=header: encoding.encode_json(content, header, etags=True)[1]
+        )
+    return candidates
+
+
+def measure(encode: Callable, content, iterations: int) -> Dict:
+    body = encode(content)
+    start = time.process_time()
+    for _ in range(iterations):
+        encode(content)
+    cpu = time.process_time() - start
+    return {"cpu_us": cpu / iterations * 1e6, "bytes": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=int, default=10)
+    parser.add_argument("--scale", default="1,4,16", help="Comma-separated snippet repeat factors")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    accept_encoding = {"identity": ""}
+    if "gzip" in encoding.CODINGS:
+        accept_encoding["gzip"] = "gzip"
+    if "br" in encoding.CODINGS:
+        accept_encoding["br"] = "br"
+    report = {
+        "settings": vars(args),
+        "json_encoder": "orjson" if encoding.orjson is not None else "json",
+        "codings": encoding.CODINGS,
+        "scales": {},
+    }
+    for scale in (int(value) for value in args.scale.split(",")):
+        content = sample_response(args.results, scale)
+        results = {name: measure(encode, content, args.iterations) for name, encode in paths(accept_encoding).items()}
+        # A repeated query from a client that kept the ETag
+        _, _, headers = encoding.encode_json(content)
+        results["revalidated_304"] = measure(
+            lambda content: encoding.encode_json(content, "gzip", headers["etag"])[1], content, args.iterations
+        )
+        report["scales"][scale] = results
+        print(f"scale {scale}:")
+        for name, result in results.items():
+            print(f"  {name:22s} {result['cpu_us']:9.1f} us  {result['bytes'] / 1024:8.1f} KiB")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+# Benchmark harness for the search and conversation endpoints.
+#
+# Drives /search in main.py, /search in followup_api.py and /query/ in app.py
+# in-process against the fake Discovery Engine, over a grid of concurrency,
+# payload size and cache hit ratio. Reports throughput, latency percentiles,
+# response size, CPU time per request and the RSS each scenario added as JSON,
+# and fails when a scenario regresses against a baseline file by more than the
+# threshold.
+#
+#   python -m benchmarks.bench_endpoints --output bench.json
+#   python -m benchmarks.bench_endpoints --baseline bench.json --threshold 0.15
+#   python -m benchmarks.bench_endpoints --targets main --modes lookup,fast,full --summary-ms 200
+#
+# CPU time is process-wide: for app.py it includes the stand-in REST server
+# threads running in the same process.
+
+import os
+
+# Route every Discovery Engine call to the in-process stand-in; must happen
+# before config is imported
+os.environ.setdefault("DISCOVERYENGINE_BACKEND", "fake")
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+REST_PORT = free_port()
+os.environ.setdefault("DISCOVERYENGINE_REST_ROOT", f"http://127.0.0.1:{REST_PORT}")
+
+import fake_discoveryengine  # noqa: E402
+from benchmarks import asgi  # noqa: E402
+from latency_stats import summarize  # noqa: E402
+
+
+TARGETS = ("main", "followup", "app")
+
+
+def query_sequence(requests: int, hit_ratio: float, rng: random.Random) -> List[str]:
+    # After warm-up, roughly `hit_ratio` of the queries repeat an earlier one
+    queries, seen = [], []
+    for i in range(requests):
+        if seen and rng.random() < hit_ratio:
+            queries.append(rng.choice(seen))
+        else:
+            query = f"apa itu sisa kuota paket {i}"
+            seen.append(query)
+            queries.append(query)
+    return queries
+
+
+def load_app(target: str):
+    if target == "main":
+        import main
+
+        return main.app
+    if target == "followup":
+        import followup_api
+
+        return followup_api.app
+    import app
+
+    return app.app
+
+
+def reset_state(target: str) -> None:
+    if target == "main":
+        import main
+
+        if main.response_cache is not None:
+            main.response_cache.clear()
+
+
+async def call(app, target: str, query: str, session_id: str, mode: str = "") -> asgi.Response:
+    if target == "main":
+        body = {"message": query, "mode": mode} if mode else {"message": query}
+        response = await asgi.request(app, "POST", "/search", json_body=body)
+    elif target == "followup":
+        response = await asgi.request(
+            app, "POST", "/search", json_body={"message": query, "session_id": session_id}
+        )
+    else:
+        # app.py's handler searches over REST (SEARCH_TRANSPORT picks gRPC)
+        response = await asgi.request(app, "POST", "/query/", form={"q": query})
+    return response
+
+
+def current_rss_mb() -> float:
+    # Resident set size right now. ru_maxrss is the high-water mark of the
+    # whole process, so later scenarios would report the earlier ones' peak.
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0.0
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+async def run_scenario(target: str, concurrency: int, queries: List[str], mode: str = "") -> Dict:
+    app = load_app(target)
+    reset_state(target)
+    latencies: List[float] = []
+    errors = 0
+    response_bytes = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, query in enumerate(queries):
+        queue.put_nowait((i, query))
+
+    async def worker(worker_id: int) -> None:
+        nonlocal errors, response_bytes
+        # One follow-up session per simulated client
+        session_id = f"bench-session-{worker_id:04d}"
+        while not queue.empty():
+            _, query = queue.get_nowait()
+            start = time.perf_counter()
+            response = await call(app, target, query, session_id, mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            response_bytes += len(response.body)
+            if response.status != 200:
+                errors += 1
+
+    async with asgi.Lifespan(app):
+        rss_start = current_rss_mb()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        # Measured before shutdown, while caches and sessions are still held
+        rss_end = current_rss_mb()
+
+    return {
+        "requests": len(queries),
+        "errors": errors,
+        "throughput_rps": len(queries) / wall if wall else 0.0,
+        "latency_ms": summarize(latencies),
+        "response_bytes_avg": response_bytes / len(queries),
+        "cpu_ms_per_request": cpu / len(queries) * 1000,
+        "rss_mb": rss_end,
+        "rss_delta_mb": rss_end - rss_start,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {result['throughput_rps']:.1f} < {before['throughput_rps']:.1f} rps"
+            )
+        p95, p95_before = result["latency_ms"].get("p95", 0), before["latency_ms"].get("p95", 0)
+        if p95_before and p95 > p95_before * (1 + threshold):
+            regressions.append(f"{name}: p95 {p95:.1f} > {p95_before:.1f} ms")
+        cpu, cpu_before = result["cpu_ms_per_request"], before["cpu_ms_per_request"]
+        if cpu_before and cpu > cpu_before * (1 + threshold):
+            regressions.append(f"{name}: CPU {cpu:.2f} > {cpu_before:.2f} ms/request")
+    return regressions
+
+
+async def run_grid(args, fake) -> Dict:
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "backend_latency_ms": args.backend_latency_ms,
+        "scenarios": {},
+    }
+    for target in args.targets:
+        for payload_scale in args.payload_scale:
+            fake.snippet_repeat = payload_scale
+            for hit_ratio in args.hit_ratio:
+                queries = query_sequence(args.requests, hit_ratio, random.Random(args.seed))
+                for concurrency in args.concurrency:
+                    # Request policies only apply to main.py's /search
+                    for mode in args.modes if target == "main" else [""]:
+                        name = f"{target}/c{concurrency}/p{payload_scale}/h{hit_ratio}"
+                        if mode:
+                            name += f"/m{mode}"
+                        result = await run_scenario(target, concurrency, queries, mode)
+                        report["scenarios"][name] = result
+                        print(
+                            f"{name:40s} {result['throughput_rps']:8.1f} rps"
+                            f"  p50 {result['latency_ms'].get('p50', 0):7.1f} ms"
+                            f"  p99 {result['latency_ms'].get('p99', 0):7.1f} ms"
+                            f"  {result['response_bytes_avg'] / 1024:7.1f} KiB"
+                            f"  cpu {result['cpu_ms_per_request']:6.2f} ms/req"
+                            f"  rss +{result['rss_delta_mb']:.1f} MiB"
+                            f"  errors {result['errors']}",
+                            file=sys.stderr,
+                        )
+    return report
+
+
+def parse_list(kind):
+    return lambda value: [kind(item) for item in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=parse_list(str), default=list(TARGETS))
+    parser.add_argument("--concurrency", type=parse_list(int), default=[1, 16, 64])
+    parser.add_argument("--payload-scale", type=parse_list(int), default=[1, 8],
+                        help="Multiplier of synthetic snippet length")
+    parser.add_argument("--hit-ratio", type=parse_list(float), default=[0.0, 0.8])
+    parser.add_argument("--modes", type=parse_list(str), default=[""],
+                        help="Request policies to run main.py's /search with, e.g. lookup,fast,full")
+    parser.add_argument("--summary-ms", type=float, default=0.0,
+                        help="Extra stand-in latency of searches that request a summary")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--backend-latency-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="bench_endpoints.json")
+    parser.add_argument("--baseline", help="Earlier --output file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed relative regression before failing")
+    args = parser.parse_args()
+
+    fake = fake_discoveryengine.default_fake()
+    fake.latency_ms = args.backend_latency_ms
+    fake.jitter_ms = args.backend_latency_ms / 5
+    fake.summary_ms = args.summary_ms
+    rest_server = fake_discoveryengine.serve_rest(fake, REST_PORT)
+
+    # One event loop for the whole run: the apps keep loop-bound primitives
+    # (semaphores, locks) in module globals
+    report = asyncio.run(run_grid(args, fake))
+    rest_server.shutdown()
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            regressions = compare(report, json.load(file), args.threshold)
+        if regressions:
+            print("Regressions beyond threshold:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Follow-up turn latency and response size against conversation length.
+#
+# Drives followup_api.multi_turn_search in-process against the stand-in, whose
+# converse latency grows with the number of messages already in the
+# conversation (--history-ms per message). Compares an unbounded history, the
+# response field mask alone, and field mask plus rollover after --max-turns.
+#
+#   python -m benchmarks.bench_followup_history --turns 20 --max-turns 4
+
+import os
+
+os.environ.setdefault("DISCOVERYENGINE_BACKEND", "fake")
+
+import argparse
+import asyncio
+import contextvars
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import config  # noqa: E402
+import fake_discoveryengine  # noqa: E402
+import followup_api  # noqa: E402
+from latency_stats import summarize  # noqa: E402
+from sessions import SessionStore  # noqa: E402
+
+
+def scenarios(max_turns: int) -> Dict[str, Dict]:
+    return {
+        "unbounded": {"field_mask": "", "max_turns": 0},
+        "field_mask": {"field_mask": config.CONVERSE_FIELD_MASK, "max_turns": 0},
+        "field_mask+rollover": {"field_mask": config.CONVERSE_FIELD_MASK, "max_turns": max_turns},
+    }
+
+
+async def run_scenario(settings: Dict, sessions_count: int, turns: int) -> Dict[str, List]:
+    backend = followup_api.backend
+    backend.converse_field_mask = settings["field_mask"]
+    followup_api.sessions = SessionStore(
+        lambda context: backend.create_conversation(
+            followup_api.project_id, followup_api.location, followup_api.data_store_id, context
+        ),
+        max_turns=settings["max_turns"],
+    )
+    latencies = defaultdict(list)
+    sizes = defaultdict(list)
+    converse = backend.converse
+    current_turn: contextvars.ContextVar = contextvars.ContextVar("turn")
+
+    async def measured_converse(*args, **kwargs):
+        response = await converse(*args, **kwargs)
+        sizes[current_turn.get()].append(type(response).pb(response).ByteSize())
+        return response
+
+    backend.converse = measured_converse
+
+    async def dialog(index: int) -> None:
+        session_id = f"bench-history-{index:04d}"
+        for turn in range(turns):
+            current_turn.set(turn)
+            start = time.perf_counter()
+            await followup_api.multi_turn_search(f"pertanyaan lanjutan {turn}", session_id)
+            latencies[turn].append((time.perf_counter() - start) * 1000)
+
+    try:
+        await asyncio.gather(*(dialog(i) for i in range(sessions_count)))
+    finally:
+        del backend.converse
+
+    return {
+        "p50_ms": [summarize(latencies[turn]).get("p50", 0.0) for turn in range(turns)],
+        "response_bytes": [sum(sizes[turn]) / max(1, len(sizes[turn])) for turn in range(turns)],
+        "rollovers": followup_api.sessions.metrics["rollovers"],
+    }
+
+
+async def run(args) -> Dict:
+    fake = fake_discoveryengine.default_fake()
+    fake.latency_ms = args.latency_ms
+    fake.jitter_ms = 0
+    fake.history_ms = args.history_ms
+    report = {"settings": vars(args), "scenarios": {}}
+    for name, settings in scenarios(args.max_turns).items():
+        result = await run_scenario(settings, args.sessions, args.turns)
+        report["scenarios"][name] = result
+        print(f"{name}:")
+        for turn in range(args.turns):
+            print(f"  turn {turn + 1:3d}  p50 {result['p50_ms'][turn]:7.1f} ms  {result['response_bytes'][turn] / 1024:7.1f} KiB")
+    await followup_api.close_clients()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--max-turns", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--history-ms", type=float, default=2.0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
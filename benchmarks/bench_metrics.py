@@ -0,0 +1,44 @@
+# Overhead of the stage timing instrumentation.
+#
+# Measures the cost of one metrics.timed() span with Server-Timing collection
+# off and on, against an empty loop, and the cost of rendering /metrics.
+#
+#   python -m benchmarks.bench_metrics
+
+import json
+import timeit
+
+import metrics
+
+
+def bare():
+    pass
+
+
+def span():
+    with metrics.timed("bench", "stage"):
+        pass
+
+
+def main():
+    number = 200_000
+    report = {}
+    baseline = timeit.timeit(bare, number=number)
+    report["span_ns"] = round((timeit.timeit(span, number=number) - baseline) / number * 1e9)
+
+    token = metrics._spans.set([])
+    try:
+        report["span_with_server_timing_ns"] = round(
+            (timeit.timeit(span, number=number) - baseline) / number * 1e9
+        )
+    finally:
+        metrics._spans.reset(token)
+
+    report["render_us"] = round(timeit.timeit(metrics.render, number=1000) / 1000 * 1e6, 1)
+    # A search request records about six spans; compare with its backend latency
+    report["per_request_us"] = round(report["span_with_server_timing_ns"] * 6 / 1000, 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
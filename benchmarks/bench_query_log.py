@@ -0,0 +1,122 @@
+# Request latency with and without the query log.
+#
+# Simulates request handlers that each log one record, under four sinks: no
+# logging, QueryLog to a file, QueryLog to a slow stream (each write sleeps
+# --sink-ms) and a synchronous print() to the same slow stream, which is what
+# the handlers did before. Reports per-request latency percentiles and the
+# records the query log dropped.
+#
+#   python -m benchmarks.bench_query_log --requests 5000 --sink-ms 2
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from latency_stats import summarize
+from query_log import QueryLog
+
+
+class SlowStream:
+    # File-like sink whose writes take `delay` seconds, like a congested
+    # terminal or log shipper
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, data: str) -> int:
+        time.sleep(self.delay)
+        self.writes += 1
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def sample_record(i: int) -> Dict:
+    return {
+        "service": "main",
+        "endpoint": "/search",
+        "query": f"apa itu paket combo sakti {i}",
+        "policy": "fast",
+        "cache": "miss",
+        "status": 200,
+        "latency_ms": 42.0,
+        "result_count": 5,
+    }
+
+
+async def run_requests(requests: int, concurrency: int, work_ms: float, log: Callable[[Dict], None]) -> List[float]:
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await asyncio.sleep(work_ms / 1000)
+            log(sample_record(i))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+async def run(args) -> Dict:
+    report = {"settings": vars(args), "sinks": {}}
+    directory = tempfile.mkdtemp(prefix="bench-query-log-")
+
+    def query_log_sink(query_log: QueryLog) -> Callable[[Dict], None]:
+        return lambda record: query_log.log(**record)
+
+    def print_sink(stream: SlowStream) -> Callable[[Dict], None]:
+        return lambda record: print(json.dumps(record), file=stream, flush=True)
+
+    logs = {
+        "file": QueryLog(os.path.join(directory, "query_log.jsonl"), max_queue=args.queue),
+        "slow_sink": QueryLog("slow", max_queue=args.queue, stream=SlowStream(args.sink_ms / 1000)),
+    }
+    sinks = {
+        "none": lambda record: None,
+        "query_log_file": query_log_sink(logs["file"]),
+        "query_log_slow_sink": query_log_sink(logs["slow_sink"]),
+        "print_slow_sink": print_sink(SlowStream(args.sink_ms / 1000)),
+    }
+    for name, sink in sinks.items():
+        start = time.perf_counter()
+        latencies = await run_requests(args.requests, args.concurrency, args.work_ms, sink)
+        elapsed = time.perf_counter() - start
+        result = {"latency_ms": summarize(latencies), "throughput_rps": args.requests / elapsed}
+        report["sinks"][name] = result
+        print(
+            f"{name:20s} p50 {result['latency_ms'].get('p50', 0):8.2f}"
+            f"  p99 {result['latency_ms'].get('p99', 0):8.2f} ms"
+            f"  {result['throughput_rps']:8.0f} req/s"
+        )
+    for name, query_log in logs.items():
+        query_log.close()
+        report["sinks"][f"query_log_{name}"]["log"] = query_log.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--work-ms", type=float, default=5.0, help="Simulated handler time per request")
+    parser.add_argument("--sink-ms", type=float, default=2.0, help="Time each write to the slow sink takes")
+    parser.add_argument("--queue", type=int, default=10000, help="Query log queue size")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    print(json.dumps({name: sink.get("log") for name, sink in report["sinks"].items() if "log" in sink}, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
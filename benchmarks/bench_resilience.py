@@ -0,0 +1,122 @@
+# Resilience benchmark against the in-process Discovery Engine stand-in.
+#
+# Runs the same search workload with injected tail latency and errors under
+# several resilience settings and reports latency percentiles, the share of
+# failed requests and backend attempts per request. A last phase fails every
+# call to show the circuit breaker short-circuiting.
+#
+#   python -m benchmarks.bench_resilience --tail-rate 0.05 --tail-ms 500 --error-rate 0.02
+
+import os
+
+os.environ.setdefault("DISCOVERYENGINE_BACKEND", "fake")
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+import fake_discoveryengine  # noqa: E402
+from async_backend import AsyncSearchBackend  # noqa: E402
+from latency_stats import summarize  # noqa: E402
+from resilience import DEFAULT_SETTINGS, CircuitOpenError, Resilience, build_resilience  # noqa: E402
+
+
+SCENARIOS = {
+    "plain": {"retries": 0, "hedge": False},
+    "retries": {"retries": 2, "hedge": False},
+    "retries+hedge": {"retries": 2, "hedge": True},
+}
+
+
+def backend_for(overrides: Dict, deadline: float) -> AsyncSearchBackend:
+    resilience = build_resilience(deadline)
+    resilience["search"] = Resilience("search", {**DEFAULT_SETTINGS, **overrides}, deadline)
+    return AsyncSearchBackend(max_concurrency=256, timeout=deadline, resilience=resilience)
+
+
+async def run_workload(backend: AsyncSearchBackend, requests: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await backend.search("project", "global", "data-store", f"apa itu sisa kuota {i}")
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    stats = backend.resilience["search"].stats()
+    return {
+        "latency_ms": summarize(latencies),
+        "error_rate": sum(errors.values()) / requests,
+        "errors": errors,
+        "attempts_per_request": stats["attempts"] / requests,
+        "retries": stats["retries"],
+        "hedges": stats["hedges"],
+        "hedge_wins": stats["hedge_wins"],
+    }
+
+
+async def run(args) -> Dict:
+    fake = fake_discoveryengine.default_fake()
+    fake.latency_ms = args.latency_ms
+    fake.jitter_ms = args.latency_ms / 5
+    fake.tail_rate = args.tail_rate
+    fake.tail_ms = args.tail_ms
+    fake.error_rate = args.error_rate
+
+    report = {"settings": vars(args), "scenarios": {}}
+    for name, overrides in SCENARIOS.items():
+        backend = backend_for(overrides, args.deadline)
+        report["scenarios"][name] = result = await run_workload(backend, args.requests, args.concurrency)
+        backend.close()
+        print(
+            f"{name:14s} p50 {result['latency_ms'].get('p50', 0):7.1f}"
+            f"  p99 {result['latency_ms'].get('p99', 0):7.1f} ms"
+            f"  errors {result['error_rate']:6.2%}"
+            f"  attempts/request {result['attempts_per_request']:.2f}",
+        )
+
+    # Backend fully down: the breaker should stop calling it after a few failures
+    fake.error_rate = 1.0
+    backend = backend_for({"retries": 0, "breaker_reset": 60.0}, args.deadline)
+    start = time.perf_counter()
+    short_circuited = 0
+    for i in range(100):
+        try:
+            await backend.search("project", "global", "data-store", f"down {i}")
+        except CircuitOpenError:
+            short_circuited += 1
+        except Exception:
+            pass
+    report["breaker"] = {
+        "requests": 100,
+        "short_circuited": short_circuited,
+        "backend_attempts": backend.resilience["search"].counters["attempts"],
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
+    backend.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--tail-ms", type=float, default=500.0)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--deadline", type=float, default=5.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Micro-benchmark of search result flattening.
+#
+# Compares the original proto-plus loop from main.search_sample, protobuf's
+# MessageToDict, and serializer.results_to_dicts over the same responses.
+# Responses come from recorded SearchResponse JSON files (one per argument) or,
+# without arguments, from a synthetic response shaped like our data store's.
+#
+#   python -m benchmarks.bench_serializer [recorded_response.json ...]
+
+import argparse
+import json
+import timeit
+
+from google.cloud import discoveryengine_v1 as discoveryengine
+from google.protobuf.json_format import MessageToDict
+from proto.marshal.collections import repeated
+
+from serializer import results_to_dicts
+
+
+def legacy_flatten(response):
+    # The loop previously inlined in main.search_sample
+    json_list = []
+    for item in response.results:
+        doc = item.document
+        item_dict = {}
+        for key, value in doc.derived_struct_data.items():
+            if isinstance(value, str) or isinstance(value, int):
+                item_dict[key] = value
+            elif isinstance(value, repeated.RepeatedComposite):
+                item_dict[key] = type(value)
+                nested_dict = {}
+                for sub_key, sub_value in value[0].items():
+                    nested_dict[sub_key] = sub_value
+                item_dict[key] = nested_dict
+        json_list.append(item_dict)
+    return json_list
+
+
+def message_to_dict(response):
+    pb = type(response).pb(response)
+    return [
+        MessageToDict(result.document.derived_struct_data)
+        for result in pb.results
+    ]
+
+
+def synthetic_response(results: int = 10) -> discoveryengine.SearchResponse:
+    snippet = "Sisa kuota adalah jumlah kuota internet yang masih dapat digunakan " * 4
+    return discoveryengine.SearchResponse(
+        results=[
+            {
+                "id": str(i),
+                "document": {
+                    "derived_struct_data": {
+                        "link": f"gs://kms-agent/docs/faq-{i}.pdf",
+                        "title": f"FAQ {i}",
+                        "snippets": [
+                            {"snippet": snippet, "snippet_status": "SUCCESS"} for _ in range(3)
+                        ],
+                        "extractive_answers": [
+                            {"content": snippet, "pageNumber": str(page)} for page in range(2)
+                        ],
+                    }
+                },
+            }
+            for i in range(results)
+        ],
+        summary={"summary_text": snippet},
+    )
+
+
+def load_responses(paths):
+    if not paths:
+        return [synthetic_response()]
+    responses = []
+    for path in paths:
+        with open(path, "r") as file:
+            responses.append(discoveryengine.SearchResponse.from_json(file.read(), ignore_unknown_fields=True))
+    return responses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recordings", nargs="*")
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args()
+
+    responses = load_responses(args.recordings)
+    report = {}
+    for name, flatten in (
+        ("legacy_loop", legacy_flatten),
+        ("message_to_dict", message_to_dict),
+        ("serializer", results_to_dicts),
+    ):
+        seconds = timeit.timeit(
+            lambda: [flatten(response) for response in responses], number=args.number
+        )
+        report[name] = {"us_per_response": round(seconds / args.number / len(responses) * 1e6, 1)}
+
+    # The new output keeps every nested element and encodes without a fallback
+    report["serializer"]["json_bytes"] = len(json.dumps(results_to_dicts(responses[0])))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Cold-boot benchmark for the FastAPI services.
+#
+# For each service, measures in fresh interpreters:
+#   import_s - time to import the module (what every uvicorn worker pays)
+#   ready_s  - time from spawning `uvicorn <module>:app` to its first 200 on /
+#
+# --before <git ref> runs the same measurements on a worktree of that ref, so
+# the report shows cold boot before and after a change. Runs use the in-process
+# fake backend; a ref that still does network work at import fails or times out
+# without credentials, which is reported as an error.
+#
+#   python -m benchmarks.bench_startup --before <ref>
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+SERVICES = ("main", "followup_api")
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def service_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("DISCOVERYENGINE_BACKEND", "fake")
+    return env
+
+
+def measure_import(tree: str, module: str) -> float:
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        cwd=tree, env=service_env(), stderr=subprocess.DEVNULL, timeout=120,
+    )
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def measure_ready(tree: str, module: str, timeout: float) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=tree, env=service_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.01)
+        raise TimeoutError(f"not ready after {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def measure_tree(tree: str, repeat: int, timeout: float) -> Dict:
+    report = {}
+    for module in SERVICES:
+        samples: Dict[str, List[float]] = {"import_s": [], "ready_s": []}
+        error: Optional[str] = None
+        try:
+            for _ in range(repeat):
+                samples["import_s"].append(measure_import(tree, module))
+                samples["ready_s"].append(measure_ready(tree, module, timeout))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        report[module] = {
+            name: round(statistics.median(values), 4) for name, values in samples.items() if values
+        }
+        if error:
+            report[module]["error"] = error
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--before", help="git ref to compare against, e.g. a commit before the change")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report = {"after": measure_tree(root, args.repeat, args.timeout)}
+
+    if args.before:
+        with tempfile.TemporaryDirectory() as tmp:
+            tree = os.path.join(tmp, "before")
+            subprocess.check_call(["git", "worktree", "add", "--detach", tree, args.before], cwd=root,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                report["before"] = measure_tree(tree, args.repeat, args.timeout)
+            finally:
+                subprocess.call(["git", "worktree", "remove", "--force", tree], cwd=root)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# gRPC against REST for Discovery Engine searches.
+#
+# Starts the stand-in's gRPC and REST servers on local ports and runs the same
+# searches through each SearchBackend: gRPC (AsyncSearchBackend over the
+# emulator channel), REST over httpx with and without HTTP/2, and the previous
+# app.py path (requests.Session on a thread pool) when requests is installed.
+# Reports throughput, latency percentiles and client CPU per request at each
+# concurrency level.
+#
+# The stand-in's REST server speaks HTTP/1.1 only and httpx does not upgrade
+# plaintext connections, so the HTTP/2 variant measures its overhead here;
+# multiplexing only shows against the real (TLS) endpoint.
+#
+#   python -m benchmarks.bench_transports --concurrency 1,16,64 --requests 500
+
+import os
+import socket
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+GRPC_PORT, REST_PORT = free_port(), free_port()
+# Real clients against the local servers, instead of the in-process stand-in
+os.environ["DISCOVERYENGINE_BACKEND"] = "google"
+os.environ["DISCOVERYENGINE_EMULATOR_HOST"] = f"127.0.0.1:{GRPC_PORT}"
+os.environ["DISCOVERYENGINE_REST_ROOT"] = f"http://127.0.0.1:{REST_PORT}"
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+from typing import Callable, Dict, List  # noqa: E402
+
+import config  # noqa: E402
+import fake_discoveryengine  # noqa: E402
+from async_backend import AsyncSearchBackend  # noqa: E402
+from backends import GrpcSearchBackend, RestSearchBackend  # noqa: E402
+from latency_stats import summarize  # noqa: E402
+from search_pipeline import build_search_body, serving_config_name  # noqa: E402
+
+
+PROJECT, LOCATION, DATA_STORE = "project", "global", "data-store"
+
+
+def requests_search(max_workers: int) -> Callable:
+    # app.py before the change: a pooled requests.Session called from
+    # Starlette's thread pool
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE, pool_maxsize=config.HTTP_POOL_SIZE))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    url = f"{config.DISCOVERYENGINE_REST_ROOT}/v1/{serving_config_name(PROJECT, LOCATION, DATA_STORE)}:search"
+
+    def post(query: str) -> dict:
+        return session.post(url, json=build_search_body(query), headers={"Authorization": "Bearer local-token"}).json()
+
+    async def search(query: str) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(executor, post, query)
+
+    return search
+
+
+async def run_scenario(search: Callable, concurrency: int, requests: int) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(f"apa itu sisa kuota paket {i}")
+
+    async def worker() -> None:
+        nonlocal errors
+        while not queue.empty():
+            query = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                await search(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    return {
+        "throughput_rps": requests / wall,
+        "latency_ms": summarize(latencies),
+        "errors": errors,
+        # Includes the stand-in servers' threads running in this process
+        "cpu_ms_per_request": cpu / requests * 1000,
+    }
+
+
+async def run(args) -> Dict:
+    backends = {
+        "grpc": GrpcSearchBackend(AsyncSearchBackend(max_concurrency=max(args.concurrency))),
+        "rest_http1": RestSearchBackend(max_concurrency=max(args.concurrency), http2=False),
+        "rest_http2": RestSearchBackend(max_concurrency=max(args.concurrency), http2=True),
+    }
+    searches = {
+        name: (lambda query, backend=backend: backend.search_json(PROJECT, LOCATION, DATA_STORE, query))
+        for name, backend in backends.items()
+    }
+    try:
+        searches["requests_sync"] = requests_search(max(args.concurrency))
+    except ImportError:
+        pass
+
+    report = {"settings": vars(args), "scenarios": {}}
+    for name, search in searches.items():
+        # Warm-up: connections, channels and tokens
+        await run_scenario(search, 4, 20)
+        for concurrency in args.concurrency:
+            result = await run_scenario(search, concurrency, args.requests)
+            report["scenarios"][f"{name}/c{concurrency}"] = result
+            print(
+                f"{name:14s} c{concurrency:<4d} {result['throughput_rps']:8.1f} rps"
+                f"  p50 {result['latency_ms'].get('p50', 0):7.1f}  p99 {result['latency_ms'].get('p99', 0):7.1f} ms"
+                f"  cpu {result['cpu_ms_per_request']:6.2f} ms/req  errors {result['errors']}"
+            )
+    for backend in backends.values():
+        await backend.aclose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=lambda value: [int(item) for item in value.split(",")], default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--snippet-repeat", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    fake = fake_discoveryengine.FakeDiscoveryEngine(
+        latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5, snippet_repeat=args.snippet_repeat
+    )
+    grpc_server = fake_discoveryengine.serve_grpc(fake, GRPC_PORT)
+    rest_server = fake_discoveryengine.serve_rest(fake, REST_PORT)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        rest_server.shutdown()
+        grpc_server.stop(None)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
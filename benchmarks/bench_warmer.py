@@ -0,0 +1,131 @@
+# Refresh-ahead cache warmer benchmark.
+#
+# Simulates user traffic with Zipf-distributed queries against a cache with a
+# short TTL in front of a slow search stub, with and without a CacheWarmer
+# tracking the traffic and refreshing the top queries on a short interval.
+# Reports the hit ratio and latency users saw, the coverage of the top queries
+# and the backend calls each side spent.
+#
+#   python -m benchmarks.bench_warmer --duration 20 --ttl 5 --interval 1
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+
+from cache import MemoryCache, ResponseCache
+from latency_stats import summarize
+from warmer import CacheWarmer, QueryFrequency
+
+
+def zipf_queries(count: int, distinct: int, skew: float, rng: random.Random) -> List[str]:
+    weights = [1 / (rank + 1) ** skew for rank in range(distinct)]
+    return rng.choices([f"apa itu paket {rank}" for rank in range(distinct)], weights, k=count)
+
+
+async def run_scenario(args, with_warmer: bool) -> Dict:
+    cache = ResponseCache([MemoryCache(100000)], ttl=args.ttl)
+    calls = {"user": 0, "warmer": 0}
+
+    async def search(query: str) -> list:
+        await asyncio.sleep(args.latency_ms / 1000)
+        return [[{"link": query}], "summary"]
+
+    async def refresh(query: str, policy: str) -> bool:
+        calls["warmer"] += 1
+        cache.set(query, await search(query))
+        return True
+
+    warmer = CacheWarmer(
+        refresh,
+        lambda query, policy: cache.remaining(query),
+        QueryFrequency(half_life=args.duration),
+        top_n=args.top,
+        interval=args.interval,
+        refresh_before=args.interval * 1.5,
+        budget=args.budget,
+        concurrency=args.concurrency,
+        rate=args.rate,
+    )
+    if with_warmer:
+        warmer.start()
+
+    rng = random.Random(args.seed)
+    queries = zipf_queries(int(args.rate_rps * args.duration), args.distinct, args.skew, rng)
+    latencies: List[float] = []
+    outcomes: List = []
+
+    async def user(query: str) -> None:
+        start = time.perf_counter()
+        warmer.frequency.record(query, "full")
+
+        async def compute():
+            calls["user"] += 1
+            return await search(query)
+
+        _, status = await cache.get_or_compute(query, compute)
+        outcomes.append((query, status == "hit"))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    tasks = []
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        delay = start + i / args.rate_rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(user(query)))
+    await asyncio.gather(*tasks)
+    coverage = warmer.coverage()
+    await warmer.stop()
+    top = {query for query, _, _ in warmer.frequency.top(args.top)}
+    top_outcomes = [hit for query, hit in outcomes if query in top]
+    return {
+        "hit_ratio": sum(hit for _, hit in outcomes) / len(outcomes),
+        "top_hit_ratio": sum(top_outcomes) / max(1, len(top_outcomes)),
+        "latency_ms": summarize(latencies),
+        "top_coverage": coverage,
+        "backend_calls": calls,
+        "warmer": {event: warmer.counters[event] for event in ("runs", "refreshed", "fresh", "over_budget")},
+    }
+
+
+async def run(args) -> Dict:
+    report = {"settings": vars(args), "scenarios": {}}
+    for name, with_warmer in (("no_warmer", False), ("warmer", True)):
+        result = await run_scenario(args, with_warmer)
+        report["scenarios"][name] = result
+        print(
+            f"{name:10s} hits {result['hit_ratio']:6.1%}  top-N hits {result['top_hit_ratio']:6.1%}"
+            f"  p50 {result['latency_ms'].get('p50', 0):7.1f}"
+            f"  p99 {result['latency_ms'].get('p99', 0):7.1f} ms  top coverage {result['top_coverage']:6.1%}"
+            f"  backend calls {result['backend_calls']}"
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--rate-rps", type=float, default=100.0, help="User requests per second")
+    parser.add_argument("--distinct", type=int, default=2000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--ttl", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=100.0, help="Warmer backend calls per second")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
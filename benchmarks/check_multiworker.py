@@ -0,0 +1,118 @@
+# Multi-worker check for the follow-up service.
+#
+# Starts the Discovery Engine stand-in as a server and two followup_api worker
+# processes that share STATE_STORE_URL, then sends the first turn of a session
+# to one worker and the follow-up to the other. Passes when both turns landed
+# in one conversation and the second worker created none of its own.
+#
+#   python -m benchmarks.check_multiworker
+#   python -m benchmarks.check_multiworker --store memory://   # shows the failure mode
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+from benchmarks.bench_startup import free_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def http_json(url: str, payload: Optional[Dict] = None, timeout: float = 10.0) -> Dict:
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(
+        url, data=data, headers={"Content-Type": "application/json"} if data else {}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args[1:])} exited with {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except urllib.error.HTTPError:
+            # Any HTTP answer means the server is up
+            return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.05)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", help="STATE_STORE_URL for the workers (default: a temporary SQLite file)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    processes: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = args.store or f"sqlite:///{os.path.join(tmp, 'state.db')}"
+        grpc_port, rest_port = free_port(), free_port()
+        worker_ports = [free_port(), free_port()]
+        env = dict(
+            os.environ,
+            STATE_STORE_URL=store,
+            DISCOVERYENGINE_BACKEND="google",
+            DISCOVERYENGINE_EMULATOR_HOST=f"127.0.0.1:{grpc_port}",
+        )
+        try:
+            fake = subprocess.Popen(
+                [sys.executable, "fake_discoveryengine.py", "--grpc-port", str(grpc_port),
+                 "--rest-port", str(rest_port), "--latency-ms", "5", "--jitter-ms", "0"],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+            )
+            processes.append(fake)
+            wait_ready(f"http://127.0.0.1:{rest_port}/_fake/stats", fake, args.timeout)
+            for port in worker_ports:
+                worker = subprocess.Popen(
+                    [sys.executable, "-m", "uvicorn", "followup_api:app", "--port", str(port),
+                     "--log-level", "warning"],
+                    cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                )
+                processes.append(worker)
+                wait_ready(f"http://127.0.0.1:{port}/admin/sessions", worker, args.timeout)
+
+            worker_a, worker_b = (f"http://127.0.0.1:{port}" for port in worker_ports)
+            first = http_json(f"{worker_a}/search", {"message": "apa itu sisa kuota"})
+            session_id = first["session_id"]
+            http_json(f"{worker_b}/search", {"message": "bagaimana cara dapatnya", "session_id": session_id})
+
+            fake_stats = http_json(f"http://127.0.0.1:{rest_port}/_fake/stats")
+            stats_a = http_json(f"{worker_a}/admin/sessions")
+            stats_b = http_json(f"{worker_b}/admin/sessions")
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait(timeout=10)
+
+    # Each turn appends a user message and a reply to its conversation
+    used = {name: count for name, count in fake_stats["conversations"].items() if count}
+    checks = {
+        "one_conversation_used": len(used) == 1,
+        "both_turns_in_it": list(used.values()) == [4],
+        "worker_b_created_none": stats_b["created"] == 0,
+    }
+    print(json.dumps({
+        "store": store,
+        "session_id": session_id,
+        "conversations": fake_stats["conversations"],
+        "worker_a": {key: stats_a[key] for key in ("created", "shared_hits", "create_races")},
+        "worker_b": {key: stats_b[key] for key in ("created", "shared_hits", "create_races")},
+        "checks": checks,
+    }, indent=2))
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
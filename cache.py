@@ -0,0 +1,315 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import config
+from shared_store import shared_store
+
+
+# Sentinel for a cache miss, since None is a valid cached value
+MISS = object()
+
+# SqliteCache trims itself back to max_entries once every this many writes
+TRIM_EVERY = 100
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    # "Apa itu sisa kuota?" and "apa itu  sisa kuota" share one entry
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = _PUNCTUATION.sub(" ", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def cache_key(query: str, serving_config: str, spec: dict) -> str:
+    payload = json.dumps([normalize_query(query), serving_config, spec], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    # In-process LRU tier with per-entry expiry
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int = config.CACHE_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            expires, value = entry
+            if expires <= time.time():
+                del self._entries[key]
+                return MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def remaining(self, key: str) -> Optional[float]:
+        # Seconds until the entry expires, 0 when absent
+        entry = self._entries.get(key)
+        return max(0.0, entry[0] - time.time()) if entry is not None else 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteCache:
+    # Local-disk tier that survives restarts. Values must be JSON serializable.
+    # Every call takes a lock and may write (hits update `accessed`), so async
+    # callers make them on a thread.
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = config.CACHE_SQLITE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self.evictions = 0
+        self._writes = 0
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return MISS
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return MISS
+            self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, payload, now + ttl, now),
+            )
+            self._writes += 1
+            trim = self._writes % TRIM_EVERY == 0
+        if trim:
+            self.trim()
+
+    def trim(self) -> int:
+        # Drops the least recently used entries beyond max_entries. Counting
+        # is a full scan, so set() only does it every TRIM_EVERY writes and
+        # the table may briefly hold up to that many extra entries.
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            overflow = max(0, count - self.max_entries)
+            if overflow:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN"
+                    " (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+        return overflow
+
+    def remaining(self, key: str) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute("SELECT expires FROM cache WHERE key = ?", (key,)).fetchone()
+        return max(0.0, row[0] - time.time()) if row is not None else 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SharedStoreCache:
+    # Tier kept in the shared state store, so every worker sees responses any
+    # of them computed. Bounded by the entry TTL rather than a size limit.
+    # Calls wait on the network or another process's file lock, so async
+    # callers make them on a thread (ResponseCache.aget/aset).
+
+    name = "shared"
+    blocking = True
+    max_entries = None
+    evictions = 0
+    prefix = "cache:"
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, key: str) -> Any:
+        value = self.store.get(self.prefix + key)
+        if value is None:
+            return MISS
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.store.set(self.prefix + key, json.dumps(value), ttl)
+
+    def remaining(self, key: str) -> Optional[float]:
+        # The store does not report expiry times
+        return None
+
+    def clear(self) -> None:
+        self.store.clear(self.prefix)
+
+    def __len__(self) -> int:
+        return self.store.count(self.prefix)
+
+
+class ResponseCache:
+    # Tiered cache for search responses. Lookups go through the tiers in order
+    # and hits in a slower tier are copied into the faster ones. Concurrent
+    # misses on the same key wait on a per-key lock, so only the first one
+    # calls the backend and the rest read its result.
+
+    def __init__(self, tiers: List, ttl: float = config.CACHE_TTL):
+        self.tiers = tiers
+        self.ttl = ttl
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.stats_counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "stampede_waits": 0,
+            "store_errors": 0,
+            **{f"{tier.name}_hits": 0 for tier in tiers},
+        }
+
+    def get(self, key: str) -> Any:
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not MISS:
+                self.stats_counters[f"{tier.name}_hits"] += 1
+                for faster in self.tiers[:i]:
+                    faster.set(key, value, self.ttl)
+                return value
+        return MISS
+
+    def set(self, key: str, value: Any) -> None:
+        for tier in self.tiers:
+            try:
+                tier.set(key, value, self.ttl)
+            except (TypeError, ValueError, sqlite3.Error):
+                self.stats_counters["store_errors"] += 1
+
+    async def _tier_call(self, tier, method: str, *args) -> Any:
+        if tier.blocking:
+            return await asyncio.to_thread(getattr(tier, method), *args)
+        return getattr(tier, method)(*args)
+
+    async def aget(self, key: str) -> Any:
+        # get() for the event loop: blocking tiers are read on a thread
+        for i, tier in enumerate(self.tiers):
+            value = await self._tier_call(tier, "get", key)
+            if value is not MISS:
+                self.stats_counters[f"{tier.name}_hits"] += 1
+                for faster in self.tiers[:i]:
+                    await self._tier_call(faster, "set", key, value, self.ttl)
+                return value
+        return MISS
+
+    async def aset(self, key: str, value: Any) -> None:
+        for tier in self.tiers:
+            try:
+                await self._tier_call(tier, "set", key, value, self.ttl)
+            except (TypeError, ValueError, sqlite3.Error):
+                self.stats_counters["store_errors"] += 1
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        value = await self.aget(key)
+        if value is not MISS:
+            self.stats_counters["hits"] += 1
+            return value, "hit"
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        elif lock.locked():
+            self.stats_counters["stampede_waits"] += 1
+        try:
+            async with lock:
+                value = await self.aget(key)
+                if value is not MISS:
+                    self.stats_counters["hits"] += 1
+                    return value, "hit"
+                self.stats_counters["misses"] += 1
+                value = await compute()
+                await self.aset(key, value)
+                return value, "miss"
+        finally:
+            if not lock.locked() and self._locks.get(key) is lock:
+                del self._locks[key]
+
+    def remaining(self, key: str) -> float:
+        # Seconds the entry can still be served from some tier; 0 when no tier
+        # that reports expiry holds it
+        known = [value for value in (tier.remaining(key) for tier in self.tiers) if value is not None]
+        return max(known, default=0.0)
+
+    def clear(self) -> None:
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.stats_counters["hits"] + self.stats_counters["misses"]
+        return {
+            **self.stats_counters,
+            "hit_ratio": self.stats_counters["hits"] / lookups if lookups else 0.0,
+            "ttl_seconds": self.ttl,
+            "tiers": {
+                tier.name: {"entries": len(tier), "max_entries": tier.max_entries, "evictions": tier.evictions}
+                for tier in self.tiers
+            },
+        }
+
+
+def build_response_cache() -> Optional[ResponseCache]:
+    if not config.CACHE_ENABLED:
+        return None
+    tiers = [MemoryCache(config.CACHE_MAX_ENTRIES)]
+    if config.CACHE_SQLITE_PATH:
+        tiers.append(SqliteCache(config.CACHE_SQLITE_PATH, config.CACHE_SQLITE_MAX_ENTRIES))
+    store = shared_store()
+    if store is not None:
+        tiers.append(SharedStoreCache(store))
+    return ResponseCache(tiers, config.CACHE_TTL)
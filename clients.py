@@ -0,0 +1,117 @@
+import inspect
+import itertools
+import threading
+from typing import Dict, List, Tuple
+
+import config
+
+
+CLIENT_TYPES = {
+    "search": "SearchServiceClient",
+    "conversation": "ConversationalSearchServiceClient",
+    # grpc.aio based clients, must be created and used on a running event loop
+    "search_async": "SearchServiceAsyncClient",
+    "conversation_async": "ConversationalSearchServiceAsyncClient",
+}
+
+
+def discoveryengine_module():
+    # The generated Discovery Engine package takes a noticeable part of a
+    # second to import, so it is loaded on first use instead of at startup
+    from google.cloud import discoveryengine_v1
+
+    return discoveryengine_v1
+
+
+def client_class_for(client_type: str):
+    name = CLIENT_TYPES.get(client_type)
+    return getattr(discoveryengine_module(), name, None) if name else None
+
+
+def async_clients_available() -> bool:
+    if client_class_for("search_async") is None or client_class_for("conversation_async") is None:
+        return False
+    try:
+        import grpc.aio  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def client_options_for(location: str):
+    from google.api_core.client_options import ClientOptions
+
+    #  For more information, refer to:
+    # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
+    return (
+        ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
+        if location != "global"
+        else None
+    )
+
+
+def emulator_client(client_class, client_type: str):
+    # Plaintext channel to a local stand-in server, no credentials involved
+    import grpc
+
+    host = config.DISCOVERYENGINE_EMULATOR_HOST
+    if client_type.endswith("_async"):
+        transport_class = client_class.get_transport_class("grpc_asyncio")
+        channel = grpc.aio.insecure_channel(host)
+    else:
+        transport_class = client_class.get_transport_class("grpc")
+        channel = grpc.insecure_channel(host)
+    return client_class(transport=transport_class(channel=channel))
+
+
+class ClientRegistry:
+    # Process-wide Discovery Engine clients keyed by (location, client type).
+    # Every client owns one gRPC channel, so each key holds a bounded pool of
+    # `pool_size` channels that requests are spread over round-robin. Channel
+    # setup, TLS and credential discovery are paid once per channel instead of
+    # once per request.
+
+    def __init__(self, pool_size: int = config.CLIENT_POOL_SIZE):
+        self.pool_size = max(1, pool_size)
+        self._pools: Dict[Tuple[str, str], Tuple[List, itertools.count]] = {}
+        self._lock = threading.Lock()
+
+    def _create(self, location: str, client_type: str):
+        if config.DISCOVERYENGINE_BACKEND == "fake":
+            import fake_discoveryengine
+
+            return fake_discoveryengine.create_client(client_type)
+
+        client_class = client_class_for(client_type)
+        if client_class is None:
+            raise ValueError(f"Unknown or unavailable client type: {client_type}")
+        if config.DISCOVERYENGINE_EMULATOR_HOST:
+            return emulator_client(client_class, client_type)
+        return client_class(client_options=client_options_for(location))
+
+    def get(self, location: str, client_type: str = "search"):
+        key = (location, client_type)
+        entry = self._pools.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._pools.get(key)
+                if entry is None:
+                    pool = [self._create(location, client_type) for _ in range(self.pool_size)]
+                    entry = self._pools[key] = (pool, itertools.count())
+        pool, cursor = entry
+        return pool[next(cursor) % len(pool)]
+
+    def _drain(self) -> List:
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        return [client for pool, _ in pools.values() for client in pool]
+
+    async def aclose(self) -> None:
+        # Async transports return a coroutine from close(); sync ones don't
+        for client in self._drain():
+            result = client.transport.close()
+            if inspect.isawaitable(result):
+                await result
+
+
+registry = ClientRegistry()
@@ -0,0 +1,187 @@
+import os
+
+
+# Runtime tunables, overridable through environment variables so the same code
+# runs locally, in CI and in production without edits.
+
+def env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Number of gRPC channels kept per (location, client type)
+CLIENT_POOL_SIZE = env_int("DISCOVERYENGINE_CHANNEL_POOL_SIZE", 4)
+
+# Upper bound on concurrent Discovery Engine calls per worker
+BACKEND_MAX_CONCURRENCY = env_int("BACKEND_MAX_CONCURRENCY", 32)
+# Per-call deadline in seconds
+BACKEND_TIMEOUT = env_float("BACKEND_TIMEOUT", 30.0)
+# Use the grpc.aio clients; falls back to a bounded thread pool when disabled
+# or unavailable
+BACKEND_ASYNC_CLIENTS = env_bool("BACKEND_ASYNC_CLIENTS", True)
+
+# Follow-up conversation sessions kept per worker and their idle lifetime
+SESSION_MAX = env_int("SESSION_MAX", 10000)
+SESSION_TTL = env_float("SESSION_TTL", 1800.0)
+
+# Search response cache
+CACHE_ENABLED = env_bool("CACHE_ENABLED", True)
+CACHE_TTL = env_float("CACHE_TTL", 3600.0)
+CACHE_MAX_ENTRIES = env_int("CACHE_MAX_ENTRIES", 1024)
+# Optional second tier on local disk, disabled when empty
+CACHE_SQLITE_PATH = env_str("CACHE_SQLITE_PATH", "")
+CACHE_SQLITE_MAX_ENTRIES = env_int("CACHE_SQLITE_MAX_ENTRIES", 100000)
+
+# Access tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = env_float("TOKEN_REFRESH_MARGIN", 300.0)
+# Keep-alive connections per host for the REST client
+HTTP_POOL_SIZE = env_int("HTTP_POOL_SIZE", 16)
+
+# Batch search fan-out and client-side rate limit against the search quota
+BATCH_MAX_QUERIES = env_int("BATCH_MAX_QUERIES", 10000)
+BATCH_CONCURRENCY = env_int("BATCH_CONCURRENCY", 8)
+BATCH_RATE_PER_SECOND = env_float("BATCH_RATE_PER_SECOND", 10.0)
+BATCH_BURST = env_int("BATCH_BURST", 10)
+
+# Where Discovery Engine calls go: "google" for the real service, "fake" for
+# the in-process stand-in in fake_discoveryengine.py
+DISCOVERYENGINE_BACKEND = env_str("DISCOVERYENGINE_BACKEND", "google")
+# host:port of a stand-in gRPC server (python fake_discoveryengine.py); clients
+# connect over a plaintext channel when set
+DISCOVERYENGINE_EMULATOR_HOST = env_str("DISCOVERYENGINE_EMULATOR_HOST", "")
+# Base URL of the REST API used by app.py
+DISCOVERYENGINE_REST_ROOT = env_str("DISCOVERYENGINE_REST_ROOT", "https://discoveryengine.googleapis.com")
+
+# Behaviour of the stand-in backend
+FAKE_LATENCY_MS = env_float("FAKE_LATENCY_MS", 50.0)
+FAKE_JITTER_MS = env_float("FAKE_JITTER_MS", 10.0)
+# Fraction of calls that take an extra FAKE_TAIL_MS
+FAKE_TAIL_RATE = env_float("FAKE_TAIL_RATE", 0.0)
+FAKE_TAIL_MS = env_float("FAKE_TAIL_MS", 1000.0)
+FAKE_ERROR_RATE = env_float("FAKE_ERROR_RATE", 0.0)
+# unavailable, deadline, internal or resource_exhausted
+FAKE_ERROR_CODE = env_str("FAKE_ERROR_CODE", "unavailable")
+# JSONL of {"query": ..., "response": <SearchResponse JSON>} replayed for matching queries
+FAKE_RECORDINGS = env_str("FAKE_RECORDINGS", "")
+# Multiplies the length of synthetic snippets to vary payload size
+FAKE_SNIPPET_REPEAT = env_int("FAKE_SNIPPET_REPEAT", 1)
+# Extra stand-in latency of searches that request a generated summary
+FAKE_SUMMARY_MS = env_float("FAKE_SUMMARY_MS", 0)
+# Extra stand-in latency of a converse call per message already in the conversation
+FAKE_HISTORY_MS = env_float("FAKE_HISTORY_MS", 0)
+
+# Add a Server-Timing header with per-stage timings to every response.
+# Clients can also ask for it per request with "X-Server-Timing: 1".
+SERVER_TIMING = env_bool("SERVER_TIMING", False)
+
+# Open the Discovery Engine channel pool during startup instead of on the
+# first request
+EAGER_CLIENTS = env_bool("EAGER_CLIENTS", False)
+
+# Store for state shared between workers: conversation mappings and cached
+# responses. memory:// keeps it per process; sqlite:///path/state.db shares it
+# between the processes of one host; redis://host:port (needs the redis
+# package) shares it across hosts.
+STATE_STORE_URL = env_str("STATE_STORE_URL", "memory://")
+
+# Local answer index for FAQ-style queries, built with `python faq_index.py
+# build`. Queries matching an indexed question at FAQ_MIN_SCORE or above (0..1,
+# 1 is an exact repeat) are answered without calling Discovery Engine.
+FAQ_INDEX_PATH = env_str("FAQ_INDEX_PATH", "")
+FAQ_MIN_SCORE = env_float("FAQ_MIN_SCORE", 0.8)
+
+# Search request policies (request_policy.py). Requests without a "mode" get
+# the full summary, as before policies existed; "auto" picks lookup, fast or
+# full from the query.
+SEARCH_POLICY_DEFAULT = env_str("SEARCH_POLICY_DEFAULT", "full")
+# JSON overrides per policy, e.g. {"fast": {"page_size": 3}}
+SEARCH_POLICIES = env_str("SEARCH_POLICIES", "")
+# Queries of at most this many terms without a question word are lookups
+POLICY_LOOKUP_MAX_TERMS = env_int("POLICY_LOOKUP_MAX_TERMS", 3)
+# Other queries up to this many terms use the fast policy
+POLICY_FAST_MAX_TERMS = env_int("POLICY_FAST_MAX_TERMS", 8)
+
+# Deadline, retry, hedging and circuit breaker settings per backend endpoint
+# (search, converse, create_conversation) as JSON overrides of the defaults in
+# resilience.py, e.g. {"search": {"hedge": true}}
+RESILIENCE_POLICIES = env_str("RESILIENCE_POLICIES", "")
+
+# Follow-up sessions roll over to a new conversation after this many turns
+# (0 = never), seeded with the last SESSION_CONTEXT_TURNS exchanges, each
+# reply cut to SESSION_CONTEXT_CHARS characters
+SESSION_MAX_TURNS = env_int("SESSION_MAX_TURNS", 0)
+SESSION_CONTEXT_TURNS = env_int("SESSION_CONTEXT_TURNS", 2)
+SESSION_CONTEXT_CHARS = env_int("SESSION_CONTEXT_CHARS", 500)
+# Response fields requested from converse_conversation (x-goog-fieldmask);
+# leaves out the growing conversation transcript. Empty requests everything.
+CONVERSE_FIELD_MASK = env_str(
+    "CONVERSE_FIELD_MASK", "reply.summary.summary_text,search_results.document.derived_struct_data"
+)
+
+# Structured query log (query_log.py): JSONL file, "-" for stdout. Off unless
+# set, since it records user queries (and follow-up replies). Records beyond
+# QUERY_LOG_QUEUE waiting to be written are dropped.
+QUERY_LOG_PATH = env_str("QUERY_LOG_PATH", "")
+QUERY_LOG_QUEUE = env_int("QUERY_LOG_QUEUE", 10000)
+QUERY_LOG_MAX_BYTES = env_int("QUERY_LOG_MAX_BYTES", 64 * 1024 * 1024)
+QUERY_LOG_BACKUPS = env_int("QUERY_LOG_BACKUPS", 5)
+
+# Admission control for the search endpoints (admission.py): requests running
+# at once per worker (0 disables), requests waiting per lane and how long they
+# may wait before a 503. ADMISSION_LANES (JSON) overrides lane settings.
+ADMISSION_MAX_CONCURRENCY = env_int("ADMISSION_MAX_CONCURRENCY", 64)
+ADMISSION_QUEUE = env_int("ADMISSION_QUEUE", 64)
+ADMISSION_QUEUE_TIMEOUT = env_float("ADMISSION_QUEUE_TIMEOUT", 2.0)
+ADMISSION_LANES = env_str("ADMISSION_LANES", "")
+# Per-client token bucket (X-Client-Id header, else the client address);
+# requests per second, 0 disables, and burst size
+ADMISSION_CLIENT_RATE = env_float("ADMISSION_CLIENT_RATE", 0)
+ADMISSION_CLIENT_BURST = env_int("ADMISSION_CLIENT_BURST", 20)
+
+# Search response encoding (encoding.py): codings offered in order of
+# preference ("br" needs the brotli package; empty disables compression),
+# bodies smaller than this stay uncompressed, and compression levels
+RESPONSE_COMPRESSION = env_str("RESPONSE_COMPRESSION", "br,gzip")
+RESPONSE_COMPRESS_MIN_BYTES = env_int("RESPONSE_COMPRESS_MIN_BYTES", 1024)
+RESPONSE_GZIP_LEVEL = env_int("RESPONSE_GZIP_LEVEL", 5)
+RESPONSE_BROTLI_QUALITY = env_int("RESPONSE_BROTLI_QUALITY", 4)
+# Send ETags and answer a matching If-None-Match with 304
+RESPONSE_ETAGS = env_bool("RESPONSE_ETAGS", True)
+
+# Refresh-ahead cache warmer (warmer.py): every WARMER_INTERVAL seconds
+# re-issue the WARMER_TOP_N most frequent queries whose cached response
+# expires within WARMER_REFRESH_BEFORE seconds, spending at most WARMER_BUDGET
+# backend calls per run at WARMER_CONCURRENCY at once and WARMER_RATE per
+# second. Query counts halve every WARMER_HALF_LIFE seconds.
+WARMER_ENABLED = env_bool("WARMER_ENABLED", False)
+WARMER_INTERVAL = env_float("WARMER_INTERVAL", 600.0)
+WARMER_TOP_N = env_int("WARMER_TOP_N", 200)
+WARMER_REFRESH_BEFORE = env_float("WARMER_REFRESH_BEFORE", 900.0)
+WARMER_BUDGET = env_int("WARMER_BUDGET", 200)
+WARMER_CONCURRENCY = env_int("WARMER_CONCURRENCY", 4)
+WARMER_RATE = env_float("WARMER_RATE", 5.0)
+WARMER_HALF_LIFE = env_float("WARMER_HALF_LIFE", 86400.0)
+WARMER_MAX_QUERIES = env_int("WARMER_MAX_QUERIES", 10000)
+
+# Transport for Discovery Engine searches (backends.py): "grpc" or "rest".
+# Empty keeps each service's own: gRPC for main.py, REST for app.py.
+SEARCH_TRANSPORT = env_str("SEARCH_TRANSPORT", "")
+# Negotiate HTTP/2 for the REST transport (needs httpx[http2]); connections
+# per worker are bounded by HTTP_POOL_SIZE
+REST_HTTP2 = env_bool("REST_HTTP2", True)
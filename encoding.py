@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Response bodies for the search endpoints: JSON encoded in one call (orjson
+# when installed), compressed when the client accepts it and the body is large
+# enough, and tagged with a hash of the JSON so clients can revalidate.
+
+
+def dumps(content: Any) -> bytes:
+    # Same output as Starlette's JSONResponse: compact, UTF-8, no NaN
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def available_codings(preference: str = config.RESPONSE_COMPRESSION) -> List[str]:
+    codings = [coding.strip() for coding in preference.split(",") if coding.strip()]
+    return [coding for coding in codings if coding == "gzip" or (coding == "br" and brotli is not None)]
+
+
+CODINGS = available_codings()
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    # {"gzip": 1.0, "br": 0.5, ...}; a coding with q=0 is refused
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def negotiate(accept_encoding: str, codings: Sequence[str] = CODINGS) -> Optional[str]:
+    # The first of our codings the client accepts; None for identity
+    if not accept_encoding or not codings:
+        return None
+    accepted = parse_accept_encoding(accept_encoding)
+    for coding in codings:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=config.RESPONSE_BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=config.RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+def etag(body: bytes) -> str:
+    # Weak, since the gzip and brotli representations share the tag of the JSON
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, tag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = tag[2:] if tag.startswith("W/") else tag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def encode_json(
+    content: Any,
+    accept_encoding: str = "",
+    if_none_match: str = "",
+    min_bytes: int = config.RESPONSE_COMPRESS_MIN_BYTES,
+    etags: bool = config.RESPONSE_ETAGS,
+) -> Tuple[int, bytes, Dict[str, str]]:
+    # (status, body, headers) for a JSON response: 304 with an empty body when
+    # the client already has this content
+    body = dumps(content)
+    headers = {"content-type": "application/json", "vary": "Accept-Encoding"}
+    if etags:
+        headers["etag"] = tag = etag(body)
+        if etag_matches(if_none_match, tag):
+            return 304, b"", headers
+    coding = negotiate(accept_encoding) if len(body) >= min_bytes else None
+    if coding is not None:
+        body = compress(body, coding)
+        headers["content-encoding"] = coding
+    return 200, body, headers
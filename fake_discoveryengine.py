@@ -0,0 +1,459 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from google.api_core import exceptions
+from google.cloud import discoveryengine_v1 as discoveryengine
+from google.protobuf import json_format
+
+import config
+from cache import normalize_query
+
+
+# Local stand-in for the Discovery Engine SearchService and
+# ConversationalSearchService. It serves recorded or synthetic responses with
+# configurable latency and error injection, either in-process (set
+# DISCOVERYENGINE_BACKEND=fake) or over the network:
+#
+#   python fake_discoveryengine.py --grpc-port 50051 --rest-port 8085
+#
+# and point the services at it with DISCOVERYENGINE_EMULATOR_HOST=localhost:50051
+# (gRPC clients) or DISCOVERYENGINE_REST_ROOT=http://localhost:8085 (app.py).
+
+ERRORS = {
+    "unavailable": exceptions.ServiceUnavailable,
+    "deadline": exceptions.DeadlineExceeded,
+    "internal": exceptions.InternalServerError,
+    "resource_exhausted": exceptions.TooManyRequests,
+}
+
+SNIPPET = (
+    "Sisa kuota adalah jumlah kuota internet yang masih dapat digunakan "
+    "sampai masa berlaku paket berakhir. "
+)
+
+
+class FakeDiscoveryEngine:
+    def __init__(
+        self,
+        latency_ms: float = config.FAKE_LATENCY_MS,
+        jitter_ms: float = config.FAKE_JITTER_MS,
+        tail_rate: float = config.FAKE_TAIL_RATE,
+        tail_ms: float = config.FAKE_TAIL_MS,
+        error_rate: float = config.FAKE_ERROR_RATE,
+        error_code: str = config.FAKE_ERROR_CODE,
+        recordings: str = config.FAKE_RECORDINGS,
+        snippet_repeat: int = config.FAKE_SNIPPET_REPEAT,
+        summary_ms: float = config.FAKE_SUMMARY_MS,
+        history_ms: float = config.FAKE_HISTORY_MS,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self.error_rate = error_rate
+        self.error_class = ERRORS[error_code]
+        # Scales the size of synthetic snippets and answers
+        self.snippet_repeat = max(1, snippet_repeat)
+        # Extra latency of searches that ask for a generated summary
+        self.summary_ms = summary_ms
+        # Extra latency of a converse call per message already in the conversation
+        self.history_ms = history_ms
+        self._random = random.Random(seed)
+        self._recorded: Dict[str, discoveryengine.SearchResponse] = {}
+        self._conversations: Dict[str, discoveryengine.Conversation] = {}
+        self._conversation_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {"search": 0, "create_conversation": 0, "converse_conversation": 0}
+        if recordings:
+            self.load_recordings(recordings)
+
+    def load_recordings(self, path: str) -> None:
+        with open(path, "r") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._recorded[normalize_query(record["query"])] = discoveryengine.SearchResponse.from_json(
+                    json.dumps(record["response"]), ignore_unknown_fields=True
+                )
+
+    def delay(self, extra_ms: float = 0.0) -> float:
+        # Seconds the next call takes
+        with self._lock:
+            latency = self.latency_ms + extra_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            if self._random.random() < self.tail_rate:
+                latency += self.tail_ms
+        return max(0.0, latency) / 1000
+
+    def _fail_or_pass(self, method: str) -> None:
+        with self._lock:
+            self.calls[method] += 1
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise self.error_class(f"Injected failure in fake {method}")
+
+    def summary_ms_for(self, request: discoveryengine.SearchRequest) -> float:
+        return self.summary_ms if request.content_search_spec.summary_spec.summary_result_count else 0.0
+
+    def history_ms_for(self, request: discoveryengine.ConverseConversationRequest) -> float:
+        with self._lock:
+            conversation = self._conversations.get(request.name)
+            return len(conversation.messages) * self.history_ms if conversation is not None else 0.0
+
+    def sleep(self, timeout: Optional[float], extra_ms: float = 0.0) -> None:
+        delay = self.delay(extra_ms)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise exceptions.DeadlineExceeded("Deadline exceeded in fake backend")
+        time.sleep(delay)
+
+    async def async_sleep(self, timeout: Optional[float], extra_ms: float = 0.0) -> None:
+        delay = self.delay(extra_ms)
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise exceptions.DeadlineExceeded("Deadline exceeded in fake backend")
+        await asyncio.sleep(delay)
+
+    # Responses
+
+    def _results(self, query: str, count: int):
+        snippet = SNIPPET * self.snippet_repeat
+        return [
+            {
+                "id": f"doc-{i}",
+                "document": {
+                    "name": f"documents/doc-{i}",
+                    "id": f"doc-{i}",
+                    "derived_struct_data": {
+                        "link": f"gs://fake-datastore/docs/doc-{i}.pdf",
+                        "title": f"{query} ({i})",
+                        "snippets": [
+                            {"snippet": snippet, "snippet_status": "SUCCESS"}
+                        ],
+                        "extractive_answers": [
+                            {"content": snippet * 2, "pageNumber": str(i + 1)}
+                        ],
+                    },
+                },
+            }
+            for i in range(count)
+        ]
+
+    def search(self, request: discoveryengine.SearchRequest) -> discoveryengine.SearchResponse:
+        self._fail_or_pass("search")
+        recorded = self._recorded.get(normalize_query(request.query))
+        if recorded is not None:
+            return discoveryengine.SearchResponse(recorded)
+        summary_spec = request.content_search_spec.summary_spec
+        summary = (
+            f"Ringkasan untuk '{request.query}': {SNIPPET}"
+            if summary_spec.summary_result_count
+            else ""
+        )
+        return discoveryengine.SearchResponse(
+            results=self._results(request.query, request.page_size or 10),
+            summary={"summary_text": summary},
+            total_size=request.page_size or 10,
+        )
+
+    def create_conversation(
+        self, parent: str, conversation: Optional[discoveryengine.Conversation] = None
+    ) -> discoveryengine.Conversation:
+        # Messages of `conversation` seed the new one
+        self._fail_or_pass("create_conversation")
+        with self._lock:
+            name = f"{parent}/conversations/{next(self._conversation_ids)}"
+            conversation = self._conversations[name] = discoveryengine.Conversation(
+                name=name,
+                state=discoveryengine.Conversation.State.IN_PROGRESS,
+                messages=list(conversation.messages) if conversation is not None else [],
+            )
+        return discoveryengine.Conversation(conversation)
+
+    def converse_conversation(
+        self, request: discoveryengine.ConverseConversationRequest, field_mask: str = ""
+    ) -> discoveryengine.ConverseConversationResponse:
+        # `field_mask` is the x-goog-fieldmask value; only its top-level fields
+        # are honoured
+        self._fail_or_pass("converse_conversation")
+        query = request.query.input
+        reply = discoveryengine.Reply(
+            summary={"summary_text": f"Jawaban untuk '{query}': {SNIPPET}"}
+        )
+        with self._lock:
+            conversation = self._conversations.get(request.name)
+            if conversation is None:
+                raise exceptions.NotFound(f"Conversation {request.name} not found")
+            conversation.messages.append(
+                discoveryengine.ConversationMessage(user_input={"input": query})
+            )
+            conversation.messages.append(discoveryengine.ConversationMessage(reply=reply))
+            snapshot = discoveryengine.Conversation(conversation)
+        fields = {
+            "reply": reply,
+            "conversation": snapshot,
+            "search_results": self._results(query, request.summary_spec.summary_result_count or 3),
+        }
+        if field_mask:
+            keep = {path.strip().split(".")[0] for path in field_mask.split(",")}
+            fields = {name: value for name, value in fields.items() if name in keep}
+        return discoveryengine.ConverseConversationResponse(**fields)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "conversations": {
+                    name: len(conversation.messages)
+                    for name, conversation in self._conversations.items()
+                },
+            }
+
+
+_default_fake: Optional[FakeDiscoveryEngine] = None
+
+
+def default_fake() -> FakeDiscoveryEngine:
+    # Shared by every in-process client so conversations outlive a client
+    global _default_fake
+    if _default_fake is None:
+        _default_fake = FakeDiscoveryEngine()
+    return _default_fake
+
+
+# In-process clients with the call signatures of the generated clients
+
+
+class _FakeTransport:
+    def close(self) -> None:
+        pass
+
+
+class _FakeAsyncTransport:
+    async def close(self) -> None:
+        pass
+
+
+class FakeSearchServiceClient:
+    serving_config_path = staticmethod(discoveryengine.SearchServiceClient.serving_config_path)
+
+    def __init__(self, fake: Optional[FakeDiscoveryEngine] = None):
+        self.fake = fake or default_fake()
+        self.transport = _FakeTransport()
+
+    def search(self, request=None, *, retry=None, timeout=None, metadata=()):
+        request = discoveryengine.SearchRequest(request)
+        self.fake.sleep(timeout, self.fake.summary_ms_for(request))
+        return self.fake.search(request)
+
+
+class FakeSearchServiceAsyncClient(FakeSearchServiceClient):
+    def __init__(self, fake: Optional[FakeDiscoveryEngine] = None):
+        super().__init__(fake)
+        self.transport = _FakeAsyncTransport()
+
+    async def search(self, request=None, *, retry=None, timeout=None, metadata=()):
+        request = discoveryengine.SearchRequest(request)
+        await self.fake.async_sleep(timeout, self.fake.summary_ms_for(request))
+        return self.fake.search(request)
+
+
+class FakeConversationalSearchServiceClient:
+    serving_config_path = staticmethod(
+        discoveryengine.ConversationalSearchServiceClient.serving_config_path
+    )
+    data_store_path = staticmethod(discoveryengine.ConversationalSearchServiceClient.data_store_path)
+
+    def __init__(self, fake: Optional[FakeDiscoveryEngine] = None):
+        self.fake = fake or default_fake()
+        self.transport = _FakeTransport()
+
+    def create_conversation(self, request=None, *, parent=None, conversation=None, retry=None, timeout=None, metadata=()):
+        self.fake.sleep(timeout)
+        if request is not None:
+            parent, conversation = request.parent, request.conversation
+        return self.fake.create_conversation(parent, conversation)
+
+    def converse_conversation(self, request=None, *, retry=None, timeout=None, metadata=()):
+        request = discoveryengine.ConverseConversationRequest(request)
+        self.fake.sleep(timeout, self.fake.history_ms_for(request))
+        return self.fake.converse_conversation(request, dict(metadata).get("x-goog-fieldmask", ""))
+
+
+class FakeConversationalSearchServiceAsyncClient(FakeConversationalSearchServiceClient):
+    def __init__(self, fake: Optional[FakeDiscoveryEngine] = None):
+        super().__init__(fake)
+        self.transport = _FakeAsyncTransport()
+
+    async def create_conversation(self, request=None, *, parent=None, conversation=None, retry=None, timeout=None, metadata=()):
+        await self.fake.async_sleep(timeout)
+        if request is not None:
+            parent, conversation = request.parent, request.conversation
+        return self.fake.create_conversation(parent, conversation)
+
+    async def converse_conversation(self, request=None, *, retry=None, timeout=None, metadata=()):
+        request = discoveryengine.ConverseConversationRequest(request)
+        await self.fake.async_sleep(timeout, self.fake.history_ms_for(request))
+        return self.fake.converse_conversation(request, dict(metadata).get("x-goog-fieldmask", ""))
+
+
+FAKE_CLIENT_TYPES = {
+    "search": FakeSearchServiceClient,
+    "search_async": FakeSearchServiceAsyncClient,
+    "conversation": FakeConversationalSearchServiceClient,
+    "conversation_async": FakeConversationalSearchServiceAsyncClient,
+}
+
+
+def create_client(client_type: str, fake: Optional[FakeDiscoveryEngine] = None):
+    try:
+        return FAKE_CLIENT_TYPES[client_type](fake)
+    except KeyError:
+        raise ValueError(f"Unknown client type: {client_type}")
+
+
+# Network servers
+
+
+def serve_grpc(fake: FakeDiscoveryEngine, port: int, max_workers: int = 64):
+    from concurrent import futures
+
+    import grpc
+
+    def handler(method, call, extra_ms=lambda request: 0.0):
+        def handle(request, context):
+            try:
+                fake.sleep(context.time_remaining(), extra_ms(request))
+                return call(request, dict(context.invocation_metadata()))
+            except exceptions.GoogleAPICallError as e:
+                context.abort(e.grpc_status_code or grpc.StatusCode.UNKNOWN, e.message)
+
+        return grpc.unary_unary_rpc_method_handler(
+            handle,
+            request_deserializer=method[0].deserialize,
+            response_serializer=method[1].serialize,
+        )
+
+    search_service = grpc.method_handlers_generic_handler(
+        "google.cloud.discoveryengine.v1.SearchService",
+        {
+            "Search": handler(
+                (discoveryengine.SearchRequest, discoveryengine.SearchResponse),
+                lambda request, metadata: fake.search(request),
+                fake.summary_ms_for,
+            ),
+        },
+    )
+    conversation_service = grpc.method_handlers_generic_handler(
+        "google.cloud.discoveryengine.v1.ConversationalSearchService",
+        {
+            "CreateConversation": handler(
+                (discoveryengine.CreateConversationRequest, discoveryengine.Conversation),
+                lambda request, metadata: fake.create_conversation(request.parent, request.conversation),
+            ),
+            "ConverseConversation": handler(
+                (discoveryengine.ConverseConversationRequest, discoveryengine.ConverseConversationResponse),
+                lambda request, metadata: fake.converse_conversation(
+                    request, metadata.get("x-goog-fieldmask", "")
+                ),
+                fake.history_ms_for,
+            ),
+        },
+    )
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+    server.add_generic_rpc_handlers((search_service, conversation_service))
+    server.add_insecure_port(f"[::]:{port}")
+    server.start()
+    return server
+
+
+def serve_rest(fake: FakeDiscoveryEngine, port: int) -> ThreadingHTTPServer:
+    # Answers POST .../servingConfigs/<id>:search like the REST API does
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            # Call counts and conversation lengths, for checks run against the stand-in
+            if self.path != "/_fake/stats":
+                self._reply(404, {"error": {"code": 404, "message": "Not found"}})
+                return
+            self._reply(200, fake.stats())
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not self.path.endswith(":search"):
+                self._reply(404, {"error": {"code": 404, "message": "Not found"}})
+                return
+            try:
+                request = discoveryengine.SearchRequest.from_json(
+                    (body or b"{}").decode("utf-8"), ignore_unknown_fields=True
+                )
+            except (ValueError, json_format.ParseError) as e:
+                # A body the real API would not parse either
+                self._reply(400, {"error": {"code": 400, "message": str(e), "status": "INVALID_ARGUMENT"}})
+                return
+            try:
+                fake.sleep(None, fake.summary_ms_for(request))
+                response = fake.search(request)
+            except exceptions.GoogleAPICallError as e:
+                self._reply(e.code or 500, {"error": {"code": e.code, "message": e.message}})
+                return
+            self._reply(200, json.loads(discoveryengine.SearchResponse.to_json(response)))
+
+        def _reply(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Discovery Engine stand-in")
+    parser.add_argument("--grpc-port", type=int, default=50051)
+    parser.add_argument("--rest-port", type=int, default=8085)
+    parser.add_argument("--latency-ms", type=float, default=config.FAKE_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=config.FAKE_JITTER_MS)
+    parser.add_argument("--tail-rate", type=float, default=config.FAKE_TAIL_RATE)
+    parser.add_argument("--tail-ms", type=float, default=config.FAKE_TAIL_MS)
+    parser.add_argument("--error-rate", type=float, default=config.FAKE_ERROR_RATE)
+    parser.add_argument("--error-code", choices=sorted(ERRORS), default=config.FAKE_ERROR_CODE)
+    parser.add_argument("--recordings", default=config.FAKE_RECORDINGS)
+    parser.add_argument("--snippet-repeat", type=int, default=config.FAKE_SNIPPET_REPEAT)
+    parser.add_argument("--summary-ms", type=float, default=config.FAKE_SUMMARY_MS)
+    parser.add_argument("--history-ms", type=float, default=config.FAKE_HISTORY_MS)
+    args = parser.parse_args()
+
+    fake = FakeDiscoveryEngine(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tail_rate=args.tail_rate,
+        tail_ms=args.tail_ms,
+        error_rate=args.error_rate,
+        error_code=args.error_code,
+        recordings=args.recordings,
+        snippet_repeat=args.snippet_repeat,
+        summary_ms=args.summary_ms,
+        history_ms=args.history_ms,
+    )
+    grpc_server = serve_grpc(fake, args.grpc_port)
+    serve_rest(fake, args.rest_port)
+    print(f"Fake Discovery Engine on gRPC :{args.grpc_port} and REST :{args.rest_port}")
+    grpc_server.wait_for_termination()
@@ -0,0 +1,274 @@
+import argparse
+import json
+import math
+import mmap
+import struct
+import sys
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from cache import MISS, normalize_query
+
+
+# File layout, all integers little-endian:
+#   magic (8 bytes) | header length (uint32) | JSON header
+#   postings   uint32 pairs (doc id, term frequency), grouped by term
+#   doc_norms  float64 per document: BM25 score of its question against itself
+#   offsets    uint64 per document + 1 into the payload section
+#   payloads   JSON [question, results, summary] per document
+# The header maps every term to the slice of postings that holds it; the
+# sections are read straight from the memory map.
+MAGIC = b"FAQIDX1\0"
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return normalize_query(text).split()
+
+
+def _idf(doc_count: int, doc_freq: int) -> float:
+    return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def _term_weight(tf: int, length: int, avgdl: float) -> float:
+    return tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avgdl))
+
+
+def load_answers(path: str) -> Dict[str, Tuple[str, List[dict], str]]:
+    # Reads the JSONL that POST /search/batch with "stream": true produces:
+    # {"query": ..., "ok": true, "results": [...], "summary": "..."}. The last
+    # answer for a normalized question wins; empty summaries are skipped.
+    answers = {}
+    with open(path, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not record.get("ok", True) or not record.get("summary"):
+                continue
+            key = normalize_query(record["query"])
+            if key:
+                answers[key] = (record["query"], record.get("results", []), record["summary"])
+    return answers
+
+
+def build_index(answers: Iterable[Tuple[str, List[dict], str]], path: str) -> Dict[str, Any]:
+    answers = list(answers)
+    doc_terms = [Counter(tokenize(question)) for question, _, _ in answers]
+    lengths = [sum(terms.values()) for terms in doc_terms]
+    doc_count = len(answers)
+    avgdl = sum(lengths) / doc_count if doc_count else 1.0
+
+    postings_by_term: Dict[str, List[Tuple[int, int]]] = {}
+    for doc_id, terms in enumerate(doc_terms):
+        for term, tf in terms.items():
+            postings_by_term.setdefault(term, []).append((doc_id, tf))
+    idf = {term: _idf(doc_count, len(postings)) for term, postings in postings_by_term.items()}
+
+    postings = array("I")
+    terms_header = {}
+    for term in sorted(postings_by_term):
+        entries = postings_by_term[term]
+        terms_header[term] = [len(postings) // 2, len(entries)]
+        for doc_id, tf in entries:
+            postings.extend((doc_id, tf))
+
+    doc_norms = array("d", (
+        sum(idf[term] * _term_weight(tf, length, avgdl) for term, tf in terms.items())
+        for terms, length in zip(doc_terms, lengths)
+    ))
+    doc_lengths = array("I", lengths)
+    payloads = [
+        json.dumps([question, results, summary], ensure_ascii=False).encode("utf-8")
+        for question, results, summary in answers
+    ]
+    offsets = array("Q", [0])
+    for payload in payloads:
+        offsets.append(offsets[-1] + len(payload))
+
+    for section in (postings, doc_norms, doc_lengths, offsets):
+        if sys.byteorder != "little":
+            section.byteswap()
+
+    header = {
+        "version": 1,
+        "doc_count": doc_count,
+        "avgdl": avgdl,
+        "k1": K1,
+        "b": B,
+        "terms": terms_header,
+        "sections": {},
+    }
+    sections = [
+        ("postings", postings.tobytes()),
+        ("doc_norms", doc_norms.tobytes()),
+        ("doc_lengths", doc_lengths.tobytes()),
+        ("offsets", offsets.tobytes()),
+        ("payloads", b"".join(payloads)),
+    ]
+    # Offsets are relative to the end of the header, so they can be filled in
+    # before the header length is known
+    position = 0
+    for name, data in sections:
+        padding = -position % 8
+        position += padding
+        header["sections"][name] = [position, len(data)]
+        position += len(data)
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    header_bytes += b" " * (-(len(MAGIC) + 4 + len(header_bytes)) % 8)
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<I", len(header_bytes)))
+        file.write(header_bytes)
+        written = 0
+        for name, data in sections:
+            start = header["sections"][name][0]
+            file.write(b"\0" * (start - written))
+            file.write(data)
+            written = start + len(data)
+    return {"documents": doc_count, "terms": len(terms_header), "bytes": len(MAGIC) + 4 + len(header_bytes) + written}
+
+
+class FaqIndex:
+    # BM25 index over previously answered questions, read from a memory map.
+    # A query is answered locally when its best match scores at least
+    # `min_score`, where the score is normalized to 0..1 by the larger of the
+    # query's and the question's score against themselves; an exact repeat
+    # scores 1.
+
+    def __init__(self, path: str, min_score: float = config.FAQ_MIN_SCORE):
+        self.path = path
+        self.min_score = min_score
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an FAQ index")
+        (header_length,) = struct.unpack_from("<I", self._map, len(MAGIC))
+        base = len(MAGIC) + 4
+        header = json.loads(self._map[base:base + header_length])
+        base += header_length
+
+        self.doc_count = header["doc_count"]
+        self.avgdl = header["avgdl"] or 1.0
+        self._terms: Dict[str, List[int]] = header["terms"]
+        view = memoryview(self._map)
+
+        def section(name: str, typecode: str):
+            start, length = header["sections"][name]
+            data = view[base + start:base + start + length]
+            if sys.byteorder != "little":
+                # Rare; copy into a swapped array instead of reading in place
+                values = array(typecode, data.tobytes())
+                values.byteswap()
+                return values
+            return data.cast(typecode)
+
+        self._postings = section("postings", "I")
+        self._doc_norms = section("doc_norms", "d")
+        self._doc_lengths = section("doc_lengths", "I")
+        self._offsets = section("offsets", "Q")
+        payload_start = header["sections"]["payloads"][0]
+        self._payloads = view[base + payload_start:base + payload_start + header["sections"]["payloads"][1]]
+        self.counters: Dict[str, int] = {"lookups": 0, "hits": 0, "below_threshold": 0, "no_match": 0}
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    def _idf(self, term: str) -> float:
+        entry = self._terms.get(term)
+        return _idf(self.doc_count, entry[1] if entry else 0)
+
+    def best_match(self, query: str) -> Tuple[int, float]:
+        # (doc id, normalized score) of the closest question, or (-1, 0.0)
+        terms = Counter(tokenize(query))
+        if not terms or not self.doc_count:
+            return -1, 0.0
+        length = sum(terms.values())
+        query_norm = sum(
+            self._idf(term) * _term_weight(tf, length, self.avgdl) for term, tf in terms.items()
+        )
+        scores: Dict[int, float] = {}
+        postings, doc_lengths, avgdl = self._postings, self._doc_lengths, self.avgdl
+        for term in terms:
+            entry = self._terms.get(term)
+            if entry is None:
+                continue
+            start, count = entry
+            idf = self._idf(term)
+            for i in range(start * 2, (start + count) * 2, 2):
+                doc_id = postings[i]
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * _term_weight(
+                    postings[i + 1], doc_lengths[doc_id], avgdl
+                )
+        if not scores:
+            return -1, 0.0
+        doc_id = max(scores, key=scores.get)
+        return doc_id, scores[doc_id] / max(query_norm, self._doc_norms[doc_id])
+
+    def document(self, doc_id: int) -> Tuple[str, List[dict], str]:
+        payload = self._payloads[self._offsets[doc_id]:self._offsets[doc_id + 1]]
+        question, results, summary = json.loads(bytes(payload))
+        return question, results, summary
+
+    def lookup(self, query: str) -> Any:
+        # The stored (results, summary) answer, or MISS to fall through to the backend
+        self.counters["lookups"] += 1
+        doc_id, score = self.best_match(query)
+        if doc_id < 0:
+            self.counters["no_match"] += 1
+            return MISS
+        if score < self.min_score:
+            self.counters["below_threshold"] += 1
+            return MISS
+        self.counters["hits"] += 1
+        _, results, summary = self.document(doc_id)
+        return results, summary
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["lookups"]
+        return {
+            "path": self.path,
+            "documents": self.doc_count,
+            "min_score": self.min_score,
+            **self.counters,
+            "hit_ratio": self.counters["hits"] / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        for name in ("_postings", "_doc_norms", "_doc_lengths", "_offsets", "_payloads"):
+            value = getattr(self, name)
+            if isinstance(value, memoryview):
+                value.release()
+        self._map.close()
+
+
+def load_faq_index() -> Optional[FaqIndex]:
+    # None unless FAQ_INDEX_PATH points at a built index
+    if not config.FAQ_INDEX_PATH:
+        return None
+    return FaqIndex(config.FAQ_INDEX_PATH, config.FAQ_MIN_SCORE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the local FAQ answer index")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="Index answers saved from POST /search/batch (stream mode)")
+    build.add_argument("answers", help="JSONL with query, results and summary per line")
+    build.add_argument("--output", default="faq.idx")
+    query = subcommands.add_parser("query", help="Show the best match for a question")
+    query.add_argument("index")
+    query.add_argument("question")
+    query.add_argument("--min-score", type=float, default=config.FAQ_MIN_SCORE)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(json.dumps(build_index(load_answers(args.answers).values(), args.output)))
+    else:
+        index = FaqIndex(args.index, args.min_score)
+        doc_id, score = index.best_match(args.question)
+        match = index.document(doc_id)[0] if doc_id >= 0 else None
+        print(json.dumps({"match": match, "score": round(score, 4), "hit": doc_id >= 0 and score >= index.min_score}, ensure_ascii=False))
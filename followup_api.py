@@ -1,132 +1,182 @@
-from fastapi import FastAPI, Form, Request, BackgroundTasks
-from fastapi.responses import HTMLResponse
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, FastAPI, Form, HTTPException, Request, BackgroundTasks
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from typing import Optional
-from google.api_core.client_options import ClientOptions
-from google.cloud import discoveryengine_v1 as discoveryengine
-from typing import List
+from typing import List, Tuple
+
+import metrics
+from admission import AdmissionController, AdmissionMiddleware, register_admission_metrics
+from async_backend import AsyncSearchBackend
+from query_log import query_log
+from resilience import error_status, register_resilience_metrics, retry_headers
+from clients import registry
+from sessions import SessionStore
+from shared_store import close_shared_store, shared_store
 
 from fastapi.middleware.cors import CORSMiddleware
 
 from pydantic import BaseModel
 
-app = FastAPI()
+router = APIRouter()
 
 origins = ["*"]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-def initialize_conversation(project_id: str, location: str, data_store_id: str, client):
-
-    # Initialize Multi-Turn Session
-    return client.create_conversation(
-            # The full resource name of the data store
-            # e.g. projects/{project_id}/locations/{location}/dataStores/{data_store_id}
-            parent=client.data_store_path(
-                project=project_id, location=location, data_store=data_store_id
-            ),
-            conversation=discoveryengine.Conversation(),
-        )
 
-def converse_with_conversation(conversation, current_query: str, client):
-    request = discoveryengine.ConverseConversationRequest(
-            name=conversation.name,
-            query=discoveryengine.TextInput(input=current_query),
-            serving_config=client.serving_config_path(
-                project=project_id,
-                location=location,
-                data_store=data_store_id,
-                serving_config="default_config",
-            ),
-            # Options for the returned summary
-            summary_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
-                # Number of results to include in summary
-                summary_result_count=3,
-                include_citations=True,
-            ),
-        )
-    
-    return client.converse_conversation(request)
-
-def process_response(response):
-    print(f"Reply: {response.reply.summary.summary_text}\n")
-
-    for i, result in enumerate(response.search_results, 1):
-        result_data = result.document.derived_struct_data
-        print(f"[{i}]")
-        print(f"Link: {result_data['link']}")
-        print(f"First Snippet: {result_data['snippets'][0]['snippet']}")
-        print(
-            "First Extractive Answer: \n"
-            # f"\tPage: {result_data['extractive_answers'][0]['pageNumber']}\n"
-            f"\tContent: {result_data['extractive_answers'][0]['content']}\n\n"
+def first_struct_field(fields, list_name: str, field: str) -> str:
+    # fields[list_name][0][field] of a raw Struct, or "" when missing
+    if list_name not in fields:
+        return ""
+    values = fields[list_name].list_value.values
+    if not values:
+        return ""
+    return values[0].struct_value.fields[field].string_value if field in values[0].struct_value.fields else ""
+
+def process_response(response) -> dict:
+    # Reads only the rendered fields, straight from the raw protobuf, instead
+    # of converting every derived_struct_data through proto-plus
+    pb = type(response).pb(response)
+    results = []
+    for result in pb.search_results:
+        fields = result.document.derived_struct_data.fields
+        results.append({
+            "link": fields["link"].string_value if "link" in fields else "",
+            "snippet": first_struct_field(fields, "snippets", "snippet"),
+            "extractive_answer": first_struct_field(fields, "extractive_answers", "content"),
+        })
+    return {"reply": pb.reply.summary.summary_text, "results": results}
+
+async def multi_turn_search(
+    current_query: str,
+    session_id: Optional[str] = None,
+) -> Tuple[str, dict]:
+    # Turns of one session run one at a time against its own conversation.
+    # Returns the session id and the rendered reply and results.
+    start = time.perf_counter()
+    async with sessions.session(session_id) as session:
+        response = await backend.converse(
+            project_id, location, data_store_id, session.conversation_name, current_query
         )
-    print("\n\n")
+        with metrics.timed("converse", "process"):
+            rendered = process_response(response)
+        sessions.remember(session, current_query, rendered["reply"])
+    query_log.log(
+        service="followup",
+        endpoint="/search",
+        session_id=session.session_id,
+        turn=session.turns,
+        query=current_query,
+        latency_ms=round((time.perf_counter() - start) * 1000, 3),
+        status=200,
+        result_count=len(rendered["results"]),
+        reply_chars=len(rendered["reply"]),
+    )
+    return session.session_id, rendered
 
-def multi_turn_search(
-    current_query: str,
-) -> None:
-    
-    response = converse_with_conversation(conversation, current_query, client)
-    process_response(response)
-
-
-html_content = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Follow-Up Question Form</title>
-</head>
-<body>
-    <form action="/search" method="post">
-        Enter your question: <input type="text" name="search_query" value="apa itu sisa kuota?">
-        <input type="submit" value="Submit">
-    </form>
-</body>
-</html>
-"""
 
 project_id = "sea-id-aid-genai"
 location = "global"                    # Values: "global", "us", "eu"
 data_store_id = "kms-agent-datastore"
 
-client_options = (
-    ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-    if location != "global"
-    else None
+backend = AsyncSearchBackend()
+# Bounds the follow-up turns running at once
+admission = AdmissionController()
+# Endpoint paths run through admission control, by lane
+ADMISSION_ROUTES = {"/search": "interactive"}
+
+# One Discovery Engine conversation per user session, created on first use and
+# replaced after SESSION_MAX_TURNS turns. With STATE_STORE_URL set, workers
+# share the session -> conversation mapping.
+sessions = SessionStore(
+    lambda context: backend.create_conversation(project_id, location, data_store_id, context),
+    shared=shared_store(),
 )
 
-# Create a client
-client = discoveryengine.ConversationalSearchServiceClient(
-    client_options=client_options
+register_resilience_metrics(backend.resilience)
+register_admission_metrics(admission)
+metrics.gauge("sessions_active", "Follow-up sessions held by this worker", lambda: len(sessions._sessions))
+metrics.gauge(
+    "session_events_total", "Follow-up sessions created and evicted",
+    lambda: {(event,): sessions.metrics[event] for event in ("created", "evicted_ttl", "evicted_lru")},
+    ("event",), kind="counter",
 )
 
-# Initialize conversation
-conversation = initialize_conversation(project_id, location, data_store_id, client)
-
-@app.get("/", response_class=HTMLResponse)
+@router.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     with open("index.html", "r") as file:
         html_content = file.read()
     return HTMLResponse(content=html_content)
 
+async def close_clients():
+    backend.close()
+    await registry.aclose()
+    close_shared_store()
+    query_log.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        yield
+    finally:
+        await close_clients()
+
 class QueryInput(BaseModel):
     message: str
+    session_id: Optional[str] = None
 
-@app.post("/search")
+@router.post("/search")
 async def search(search_query: QueryInput):
-    print('works')
     if search_query.message.lower() == "exit":
+        await sessions.end(search_query.session_id)
         return {"message": "Goodbye!"}
     else:
-        multi_turn_search(search_query.message)
-        return {"message": "Question received and processed."}
+        try:
+            session_id, rendered = await multi_turn_search(search_query.message, search_query.session_id)
+        except Exception as e:
+            error_msg = f"An error occurred: {str(e)}"
+            status = error_status(e)
+            query_log.log(
+                service="followup", endpoint="/search", session_id=search_query.session_id,
+                query=search_query.message, status=status, error=error_msg,
+            )
+            raise HTTPException(status_code=status, detail=error_msg, headers=retry_headers(e))
+        return {"message": "Question received and processed.", "session_id": session_id, **rendered}
+
+@router.get("/admin/sessions")
+async def session_stats():
+    return sessions.stats()
+
+@router.get("/admin/admission")
+async def admission_stats():
+    return admission.stats()
+
+@router.get("/admin/resilience")
+async def resilience_stats():
+    return {endpoint: wrapper.stats() for endpoint, wrapper in backend.resilience.items()}
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    # Innermost, so rejections still get the CORS headers
+    app.add_middleware(AdmissionMiddleware, controller=admission, routes=ADMISSION_ROUTES)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(metrics.ServerTimingMiddleware)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
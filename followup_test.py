@@ -1,8 +1,9 @@
 from typing import List
 
-from google.api_core.client_options import ClientOptions
 from google.cloud import discoveryengine_v1 as discoveryengine
 
+from clients import registry
+
 
 project_id = "sea-id-aid-genai"
 location = "global"                    # Values: "global", "us", "eu"
@@ -15,16 +16,8 @@ def multi_turn_search(
     data_store_id: str,
     current_query: str,
 ) -> None:
-    client_options = (
-        ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-        if location != "global"
-        else None
-    )
-
-    # Create a client
-    client = discoveryengine.ConversationalSearchServiceClient(
-        client_options=client_options
-    )
+    # Shared client from the process-wide pool
+    client = registry.get(location, "conversation")
 
     # Initialize conversation
     conversation = initialize_conversation(project_id, location, data_store_id, client)
@@ -89,4 +82,6 @@ def process_response(response):
         )
     print("\n\n")
 
-multi_turn_search(project_id, location, data_store_id, initial_query)
+if __name__ == "__main__":
+    multi_turn_search(project_id, location, data_store_id, initial_query)
+
@@ -0,0 +1,24 @@
+import math
+from typing import Dict, Iterable, List
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    # Nearest-rank percentile over an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(values: Iterable[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1],
+    }
@@ -1,156 +1,465 @@
-from typing import List
-from fastapi import FastAPI, HTTPException
-from google.api_core.client_options import ClientOptions
-from google.cloud import discoveryengine_v1 as discoveryengine
-from google.protobuf.json_format import MessageToDict
-from proto.marshal.collections import repeated
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter, FastAPI, Form, HTTPException, Request
 
-from fastapi import FastAPI, Form
-from starlette.responses import HTMLResponse
+import config
+import metrics
+from admission import AdmissionController, AdmissionMiddleware, AdmissionRejected, client_id, register_admission_metrics
+from async_backend import AsyncSearchBackend
+from backends import build_search_backend
+from batch import RateLimiter, iter_search_batch, search_batch
+from cache import MISS, build_response_cache, cache_key
+from clients import registry
+from encoding import encode_json
+from faq_index import load_faq_index
+from query_log import query_log
+from request_policy import POLICIES, choose_policy
+from resilience import error_status, register_resilience_metrics, retry_headers
+from search_pipeline import (
+    DEFAULT_SEARCH_SPEC,
+    search_pipeline,
+    serving_config_name,
+)
+from shared_store import close_shared_store, shared_store
+from singleflight import SingleFlight
+from warmer import CacheWarmer, register_warmer_metrics
+
+from starlette.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 
 from fastapi.middleware.cors import CORSMiddleware
 
 from pydantic import BaseModel
 
 
-app = FastAPI()
+router = APIRouter()
 
 origins = ["*"]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 project_id = "sea-id-aid-genai"
 location = "global"                    # Values: "global", "us", "eu"
 data_store_id = "kms-agent-datastore"
 # search_query = "halo"
 
+backend = AsyncSearchBackend()
+# Searches go over gRPC unless SEARCH_TRANSPORT=rest picks the REST API. Built
+# by open_clients() and closed by close_clients(), so each run of the app gets
+# its own; both transports share backend.resilience.
+search_backend = None
+# None when CACHE_ENABLED is off
+response_cache = build_response_cache()
+# Opened by open_clients(); stays None unless FAQ_INDEX_PATH is set
+faq_index = None
+# Identical in-flight searches share one backend call
+inflight = SingleFlight()
+# Shared by all batch requests so together they stay within the search quota
+batch_rate_limiter = RateLimiter()
+# Bounds the searches running at once; batch requests wait behind chat traffic
+admission = AdmissionController()
+# Endpoint paths run through admission control, by lane. /search/batch is
+# not one of them: each of its queries is admitted in the batch lane instead,
+# so its fan-out counts against the budget like the requests it competes with.
+ADMISSION_ROUTES = {"/search": "interactive", "/search/stream": "interactive"}
+
+if response_cache is not None:
+    metrics.gauge(
+        "search_cache_events_total", "Search response cache lookups by outcome",
+        lambda: {(event,): response_cache.stats_counters[event] for event in ("hits", "misses", "stampede_waits", "store_errors")},
+        ("event",), kind="counter",
+    )
+    metrics.gauge(
+        "search_cache_entries", "Entries held per cache tier",
+        lambda: {(tier.name,): len(tier) for tier in response_cache.tiers},
+        ("tier",),
+    )
+if config.FAQ_INDEX_PATH:
+    metrics.gauge(
+        "faq_index_lookups_total", "Local FAQ index lookups by outcome",
+        lambda: {} if faq_index is None else {
+            (event,): faq_index.counters[event] for event in ("hits", "below_threshold", "no_match")
+        },
+        ("outcome",), kind="counter",
+    )
+POLICY_SECONDS = metrics.histogram(
+    "search_policy_seconds", "Search endpoint latency by request policy", ("policy",),
+)
+POLICY_RESPONSE_BYTES = metrics.histogram(
+    "search_policy_response_bytes", "Search response body size by request policy", ("policy",),
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+register_resilience_metrics(backend.resilience)
+register_admission_metrics(admission)
+metrics.gauge(
+    "singleflight_calls_total", "Search calls by whether they reached the backend or joined one in flight",
+    lambda: {("backend",): inflight.counters["backend_calls"], ("coalesced",): inflight.counters["coalesced"]},
+    ("outcome",), kind="counter",
+)
+
+
+async def open_clients():
+    global search_backend, faq_index
+    search_backend = build_search_backend("grpc", backend, rest_options={"resilience": backend.resilience})
+    faq_index = load_faq_index()
+    # Clients are created on first use unless EAGER_CLIENTS asks for the
+    # channel pool to be opened before the first request arrives
+    if config.EAGER_CLIENTS and search_backend.name == "grpc":
+        registry.get(location, "search_async" if backend.use_async_clients else "search")
+
+
+async def close_clients():
+    global faq_index
+    await search_backend.aclose()
+    await registry.aclose()
+    if faq_index is not None:
+        faq_index.close()
+        faq_index = None
+    close_shared_store()
+    query_log.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_clients()
+    if warmer is not None and config.WARMER_ENABLED:
+        warmer.start()
+    try:
+        yield
+    finally:
+        if warmer is not None:
+            await warmer.stop()
+        await close_clients()
+
 
 def search_sample(
     project_id: str,
     location: str,
     data_store_id: str,
     search_query: str,
-) -> List[discoveryengine.SearchResponse]:
-    #  For more information, refer to:
-    # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
-    client_options = (
-        ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-        if location != "global"
-        else None
-    )
+) -> Tuple[List[dict], str]:
+    # Shared client from the process-wide pool
+    client = registry.get(location, "search")
 
-    # Create a client
-    client = discoveryengine.SearchServiceClient(client_options=client_options)
+    return search_pipeline(client, project_id, location, data_store_id, search_query)
 
-    # The full resource name of the search engine serving config
-    # e.g. projects/{project_id}/locations/{location}/dataStores/{data_store_id}/servingConfigs/{serving_config_id}
-    serving_config = client.serving_config_path(
-        project=project_id,
-        location=location,
-        data_store=data_store_id,
-        serving_config="default_config",
+@router.get("/", response_class=HTMLResponse)
+def read_root():
+    with open("index.html", "r") as file:
+        html_content = file.read()
+    return HTMLResponse(content=html_content)
+
+def search_key(search_query: str, spec: dict = DEFAULT_SEARCH_SPEC) -> str:
+    return cache_key(
+        search_query,
+        serving_config_name(project_id, location, data_store_id),
+        spec,
     )
 
-    # Optional: Configuration options for search
-    # Refer to the `ContentSearchSpec` reference for all supported fields:
-    # https://cloud.google.com/python/docs/reference/discoveryengine/latest/google.cloud.discoveryengine_v1.types.SearchRequest.ContentSearchSpec
-    content_search_spec = discoveryengine.SearchRequest.ContentSearchSpec(
-        # For information about snippets, refer to:
-        # https://cloud.google.com/generative-ai-app-builder/docs/snippets
-        snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(
-            return_snippet=True
-        ),
-        # For information about search summaries, refer to:
-        # https://cloud.google.com/generative-ai-app-builder/docs/get-search-summaries
-        summary_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
-            summary_result_count=5,
-            include_citations=True,
-            ignore_adversarial_query=True,
-            ignore_non_summary_seeking_query=True,
-            # model_prompt_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec.ModelPromptSpec(
-            #     preamble="answer nicely please"
-            # ),
-        ),
+def local_answer(search_query: str):
+    # Near-duplicate FAQ questions are answered from the local index
+    if faq_index is None:
+        return MISS
+    with metrics.timed("search", "faq"):
+        return faq_index.lookup(search_query)
+
+async def cached_search_with_status(search_query: str, spec: dict = DEFAULT_SEARCH_SPEC):
+    # (response, where it came from: "faq", "hit", "miss" or "off" without a cache)
+    answer = local_answer(search_query)
+    if answer is not MISS:
+        return answer, "faq"
+    key = search_key(search_query, spec)
+
+    async def compute():
+        return await inflight.do(
+            key, lambda: search_backend.search(project_id, location, data_store_id, search_query, spec)
+        )
+
+    if response_cache is None:
+        return await compute(), "off"
+    return await response_cache.get_or_compute(key, compute)
+
+async def cached_search(search_query: str, spec: dict = DEFAULT_SEARCH_SPEC):
+    response, _ = await cached_search_with_status(search_query, spec)
+    return response
+
+async def refresh_search(search_query: str, policy: str) -> bool:
+    # Re-runs a search for the cache warmer and stores the fresh response.
+    # False when no backend call was needed: the FAQ index answers the query
+    # or its policy no longer exists.
+    spec = POLICIES.get(policy)
+    if spec is None:
+        return False
+    if faq_index is not None:
+        doc_id, score = faq_index.best_match(search_query)
+        if doc_id >= 0 and score >= faq_index.min_score:
+            return False
+    key = search_key(search_query, spec)
+    response = await inflight.do(
+        key, lambda: search_backend.search(project_id, location, data_store_id, search_query, spec)
     )
+    await response_cache.aset(key, response)
+    return True
+
+def cached_remaining(search_query: str, policy: str) -> float:
+    spec = POLICIES.get(policy)
+    return response_cache.remaining(search_key(search_query, spec)) if spec is not None else 0.0
+
+# Refreshes the most asked queries before their cache entries expire; None
+# without a cache. Runs in the background when WARMER_ENABLED is set.
+warmer = CacheWarmer(refresh_search, cached_remaining, lock_store=shared_store()) if response_cache is not None else None
+if warmer is not None:
+    register_warmer_metrics(warmer)
 
-    # Refer to the `SearchRequest` reference for all supported fields:
-    # https://cloud.google.com/python/docs/reference/discoveryengine/latest/google.cloud.discoveryengine_v1.types.SearchRequest
-    request = discoveryengine.SearchRequest(
-        serving_config=serving_config,
+def track_query(search_query: str, policy: str) -> None:
+    if warmer is not None:
+        warmer.frequency.record(search_query, policy)
+
+def log_search(endpoint: str, search_query: str, policy: str, start: float, **fields) -> None:
+    query_log.log(
+        service="main",
+        endpoint=endpoint,
         query=search_query,
-        page_size=10,
-        content_search_spec=content_search_spec,
-        query_expansion_spec=discoveryengine.SearchRequest.QueryExpansionSpec(
-            condition=discoveryengine.SearchRequest.QueryExpansionSpec.Condition.AUTO,
-        ),
-        spell_correction_spec=discoveryengine.SearchRequest.SpellCorrectionSpec(
-            mode=discoveryengine.SearchRequest.SpellCorrectionSpec.Mode.AUTO
-        ),
+        policy=policy,
+        latency_ms=round((time.perf_counter() - start) * 1000, 3),
+        **fields,
     )
 
-    results = client.search(request).results
-    summary = client.search(request).summary.summary_text
-    
-    # print(type(results))
-    json_list = []
-
-    for item in results:
-        doc = item.document
-        item_dict = {}
-        for key, value in doc.derived_struct_data.items():
-            if isinstance(value, str) or isinstance(value, int):
-                item_dict[key] = value
-            # else:
-            #     item_dict[key] = type(value)
-            elif isinstance(value, repeated.RepeatedComposite):
-                item_dict[key] = type(value)
-                nested_dict = {}
-                for sub_key, sub_value in value[0].items():
-                    nested_dict[sub_key] = sub_value
-                item_dict[key] = nested_dict
-            
-        
-        json_list.append(item_dict)
-
-    # print(json_list)
-    # print(summary.summary_text) 
-
-    return json_list, summary
-
-@app.get("/", response_class=HTMLResponse)
-def read_root():
-    html_content = """
-    <html>
-        <body>
-            <form action="/search" method="post">
-                Enter your query: <input type="text" name="q" value="apakah Prosedur Permintaan Layanan Interkoneksi?">
-                <input type="submit" value="Submit">
-            </form>
-        </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
-
 class QueryInput(BaseModel):
     message: str
+    # Request policy: "fast", "full", "lookup" or "auto" to pick from the
+    # query; None for SEARCH_POLICY_DEFAULT
+    mode: Optional[str] = None
 
-@app.post("/search")
-async def search(query_input: QueryInput):
+# Body of /search: [results, summary], each result the flattened
+# derived_struct_data of one document (link, title, snippets,
+# extractive_answers, ...). Only documents the API; the route returns
+# pre-encoded bytes, so FastAPI does not validate or re-encode it.
+SearchResponse = Tuple[List[Dict[str, Any]], str]
+
+def json_response(content, request: Request) -> Response:
+    # Compressed when the client accepts it. A GET whose ETag still matches
+    # gets a 304; other methods always get the body, since a failed
+    # If-None-Match on them means 412 rather than 304 (RFC 9110 13.1.2).
+    conditional = request.method in ("GET", "HEAD")
+    status, body, headers = encode_json(
+        content,
+        request.headers.get("accept-encoding", ""),
+        request.headers.get("if-none-match", "") if conditional else "",
+    )
+    return Response(content=body, status_code=status, headers=headers)
+
+def resolve_policy(search_query: str, mode: Optional[str]) -> Tuple[str, dict]:
+    try:
+        return choose_policy(search_query, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def run_search(message: str, mode: Optional[str], request: Request) -> Response:
+    policy, spec = resolve_policy(message, mode)
+    track_query(message, policy)
+    start = time.perf_counter()
     try:
-        response = search_sample(
-            project_id,
-            location,
-            data_store_id,
-            search_query = query_input.message
+        response, cache_status = await cached_search_with_status(message, spec)
+        with metrics.timed("search", "encode"):
+            encoded = json_response(response, request)
+        POLICY_SECONDS.observe(time.perf_counter() - start, policy)
+        POLICY_RESPONSE_BYTES.observe(len(encoded.body), policy)
+        log_search(
+            "/search", message, policy, start,
+            status=encoded.status_code, cache=cache_status, result_count=len(response[0]), bytes=len(encoded.body),
         )
-        return response
+        return encoded
+    except Exception as e:
+        error_msg = f"An error occurred: {str(e)}"
+        status = error_status(e)
+        log_search("/search", message, policy, start, status=status, error=error_msg)
+        # 503/504 for transient backend failures, with Retry-After while the circuit is open
+        raise HTTPException(status_code=status, detail=error_msg, headers=retry_headers(e))
+
+@router.post("/search", response_model=SearchResponse)
+async def search(query_input: QueryInput, request: Request):
+    return await run_search(query_input.message, query_input.mode, request)
+
+@router.get("/search", response_model=SearchResponse, responses={304: {"description": "Not modified"}})
+async def search_get(request: Request, q: str, mode: Optional[str] = None):
+    # The same search as a GET, so browsers and HTTP caches can revalidate
+    # it with If-None-Match
+    return await run_search(q, mode, request)
+
+def ndjson_event(**event) -> bytes:
+    return (json.dumps(event, default=str) + "\n").encode("utf-8")
+
+async def stream_search(search_query: str, policy: str = "full", spec: dict = DEFAULT_SEARCH_SPEC):
+    track_query(search_query, policy)
+    start = time.perf_counter()
+    sent = 0
+    outcome = {"status": 200}
+    async for event in stream_search_events(search_query, spec, outcome):
+        sent += len(event)
+        yield event
+    POLICY_SECONDS.observe(time.perf_counter() - start, policy)
+    POLICY_RESPONSE_BYTES.observe(sent, policy)
+    log_search("/search/stream", search_query, policy, start, bytes=sent, **outcome)
+
+async def stream_search_events(search_query: str, spec: dict, outcome: dict):
+    # Results go out one by one as they are flattened, the summary last. A
+    # local or cached answer is replayed in the same shape. `outcome` collects
+    # the cache status, result count or error for the query log.
+    key = search_key(search_query, spec)
+    cached = local_answer(search_query)
+    outcome["cache"] = "faq"
+    if cached is MISS and response_cache is not None:
+        cached = await response_cache.aget(key)
+        outcome["cache"] = "hit"
+    try:
+        if cached is not MISS:
+            results, summary = cached
+            for i, result in enumerate(results):
+                yield ndjson_event(type="result", index=i, result=result)
+        else:
+            outcome["cache"] = "miss" if response_cache is not None else "off"
+            response = await inflight.do(
+                f"{key}:response",
+                lambda: search_backend.search_response(project_id, location, data_store_id, search_query, spec),
+            )
+            results = []
+            for i, result in enumerate(search_backend.iter_results(response)):
+                results.append(result)
+                yield ndjson_event(type="result", index=i, result=result)
+            summary = search_backend.summary(response)
+            if response_cache is not None:
+                await response_cache.aset(key, (results, summary))
+        outcome["result_count"] = len(results)
+        yield ndjson_event(type="summary", summary=summary)
+        yield ndjson_event(type="done", count=len(results))
     except Exception as e:
         error_msg = f"An error occurred: {str(e)}"
-        print(error_msg)  # Log the error message for debugging
-        raise HTTPException(status_code=500, detail=error_msg)
+        outcome.update(status=error_status(e), error=error_msg)
+        yield ndjson_event(type="error", status=outcome["status"], detail=error_msg)
+
+@router.post("/search/stream")
+async def search_stream(query_input: QueryInput):
+    policy, spec = resolve_policy(query_input.message, query_input.mode)
+    return StreamingResponse(
+        stream_search(query_input.message, policy, spec), media_type="application/x-ndjson"
+    )
+
+@router.get("/admin/cache")
+async def cache_stats():
+    if response_cache is None:
+        return {"enabled": False}
+    # Counting the shared tier's entries is a store round-trip
+    return {"enabled": True, **await asyncio.to_thread(response_cache.stats)}
+
+@router.get("/admin/faq")
+async def faq_stats():
+    if faq_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **faq_index.stats()}
+
+@router.get("/admin/resilience")
+async def resilience_stats():
+    return {endpoint: wrapper.stats() for endpoint, wrapper in backend.resilience.items()}
+
+@router.get("/admin/admission")
+async def admission_stats():
+    return admission.stats()
+
+@router.get("/admin/warmer")
+async def warmer_stats():
+    if warmer is None:
+        return {"enabled": False}
+    # Coverage reads entry expiry from the cache tiers
+    return {"enabled": True, **await asyncio.to_thread(warmer.stats)}
+
+@router.post("/admin/warmer/run")
+async def warmer_run():
+    # One refresh pass now, outside the schedule
+    if warmer is None:
+        raise HTTPException(status_code=409, detail="The response cache is disabled")
+    return await warmer.run_once()
+
+@router.get("/admin/query_log")
+async def query_log_stats():
+    return query_log.stats()
+
+@router.get("/admin/singleflight")
+async def singleflight_stats():
+    return inflight.stats()
+
+class BatchInput(BaseModel):
+    queries: List[str]
+    # Stream items as NDJSON in completion order instead of one ordered list
+    stream: bool = False
+    # Request policy for every query; "auto" picks one per query, None uses
+    # SEARCH_POLICY_DEFAULT
+    mode: Optional[str] = None
+
+@router.post("/search/batch")
+async def search_batch_endpoint(batch_input: BatchInput, request: Request):
+    if len(batch_input.queries) > config.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {config.BATCH_MAX_QUERIES} queries per batch",
+        )
+    # Rejects an unknown mode before any query runs
+    resolve_policy("", batch_input.mode)
+    if admission.enabled:
+        # The client's rate is charged once per batch; its queries only take slots
+        try:
+            admission.check_rate("batch", client_id(request.scope))
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=e.status, detail=e.reason, headers=e.headers())
+
+    async def search_one(search_query: str):
+        policy, spec = choose_policy(search_query, batch_input.mode)
+        track_query(search_query, policy)
+        start = time.perf_counter()
+        try:
+            async with admission.admit("batch"):
+                response, cache_status = await cached_search_with_status(search_query, spec)
+        except Exception as e:
+            status = e.status if isinstance(e, AdmissionRejected) else error_status(e)
+            log_search("/search/batch", search_query, policy, start, status=status, error=str(e))
+            raise
+        log_search(
+            "/search/batch", search_query, policy, start,
+            status=200, cache=cache_status, result_count=len(response[0]),
+        )
+        return response
+
+    if batch_input.stream:
+        async def stream():
+            async for item in iter_search_batch(
+                batch_input.queries, search_one, rate_limiter=batch_rate_limiter
+            ):
+                yield ndjson_event(**item)
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    items = await search_batch(batch_input.queries, search_one, rate_limiter=batch_rate_limiter)
+    return json_response(items, request)
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    # The cache entry gauges count the shared tier in the store
+    return PlainTextResponse(await asyncio.to_thread(metrics.render), media_type="text/plain; version=0.0.4")
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    # Innermost, so rejections still get the CORS headers
+    app.add_middleware(AdmissionMiddleware, controller=admission, routes=ADMISSION_ROUTES)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(metrics.ServerTimingMiddleware)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
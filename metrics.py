@@ -0,0 +1,176 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import config
+
+
+# Prometheus text-format metrics kept in process, plus per-stage timing spans
+# for the Server-Timing header.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    # Read at scrape time from a callback returning {label values: value}
+    # or a plain number. kind="counter" exposes monotonic totals kept elsewhere.
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], callback: Callable, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            if not isinstance(labels, tuple):
+                labels = (labels,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {float(value)}")
+        return lines
+
+
+_metrics: Dict[str, object] = {}
+_metrics_lock = threading.Lock()
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    with _metrics_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = Histogram(name, help, labelnames, buckets)
+        return metric
+
+
+def gauge(name: str, help: str, callback: Callable, labelnames: Sequence[str] = (), kind: str = "gauge") -> Gauge:
+    # Re-registering a name replaces the callback, so reloaded apps stay current
+    with _metrics_lock:
+        metric = _metrics[name] = Gauge(name, help, labelnames, callback, kind)
+        return metric
+
+
+def render() -> str:
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = histogram(
+    "pipeline_stage_seconds",
+    "Time spent in each stage of the search and converse pipelines",
+    ("pipeline", "stage"),
+)
+
+# Spans of the current request, or None when Server-Timing is off for it
+_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("server_timing_spans", default=None)
+
+
+class timed:
+    # Context manager recording the duration of a pipeline stage. A class is
+    # cheaper per span than @contextmanager, which builds a generator each time.
+
+    __slots__ = ("pipeline", "stage", "start")
+
+    def __init__(self, pipeline: str, stage: str):
+        self.pipeline = pipeline
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, self.pipeline, self.stage)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((self.stage, elapsed))
+        return False
+
+
+class ServerTimingMiddleware:
+    # ASGI middleware that collects the spans recorded during a request and
+    # sends them as a Server-Timing header, e.g. "rpc;dur=231.4, flatten;dur=0.8"
+
+    def __init__(self, app, enabled: bool = config.SERVER_TIMING):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        requested = self.enabled or (b"x-server-timing", b"1") in scope.get("headers", ())
+        if not requested:
+            await self.app(scope, receive, send)
+            return
+
+        spans: List[Tuple[str, float]] = []
+        token = _spans.set(spans)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                entries = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in spans]
+                entries.append(f"total;dur={(time.perf_counter() - start) * 1000:.1f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", ", ".join(entries).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _spans.reset(token)
@@ -1,8 +1,17 @@
-from typing import List
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List
 
-from google.api_core.client_options import ClientOptions
 from google.cloud import discoveryengine_v1 as discoveryengine
 
+from async_backend import AsyncSearchBackend
+from clients import registry
+from latency_stats import summarize
+from query_log import QueryLog
+
 
 project_id = "sea-id-aid-genai"
 location = "global"                    # Values: "global", "us", "eu"
@@ -16,18 +25,8 @@ def multi_turn_search_sample(
     data_store_id: str,
     search_queries: List[str],
 ) -> List[discoveryengine.ConverseConversationResponse]:
-    #  For more information, refer to:
-    # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
-    client_options = (
-        ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-        if location != "global"
-        else None
-    )
-
-    # Create a client
-    client = discoveryengine.ConversationalSearchServiceClient(
-        client_options=client_options
-    )
+    # Shared client from the process-wide pool
+    client = registry.get(location, "conversation")
 
     # Initialize Multi-Turn Session
     conversation = client.create_conversation(
@@ -83,4 +82,97 @@ def search():
     )
     return response
 
-search()
\ No newline at end of file
+
+def load_dialogs(path: str) -> List[Dict]:
+    # One dialog per line: {"id": "...", "turns": ["first question", "follow-up", ...]}
+    dialogs = []
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            dialog = json.loads(line)
+            if isinstance(dialog, list):
+                dialog = {"turns": dialog}
+            dialog.setdefault("id", str(line_number))
+            dialogs.append(dialog)
+    return dialogs
+
+
+async def replay_dialog(backend: AsyncSearchBackend, dialog: Dict, write) -> None:
+    # Turns of a dialog run in order on their own conversation
+    try:
+        conversation = await backend.create_conversation(project_id, location, data_store_id)
+    except Exception as e:
+        write({"dialog_id": dialog["id"], "turn": 0, "ok": False, "error": f"create_conversation: {e}"})
+        return
+
+    for turn, query in enumerate(dialog["turns"]):
+        record = {"dialog_id": dialog["id"], "turn": turn, "query": query}
+        start = time.perf_counter()
+        try:
+            response = await backend.converse(
+                project_id, location, data_store_id, conversation.name, query
+            )
+            record.update(
+                ok=True,
+                reply=response.reply.summary.summary_text,
+                result_count=len(response.search_results),
+            )
+        except Exception as e:
+            record.update(ok=False, error=f"{type(e).__name__}: {e}")
+        record["latency_ms"] = (time.perf_counter() - start) * 1000
+        write(record)
+        if not record["ok"]:
+            # Later turns depend on this one's context
+            break
+
+
+async def replay_dialogs(
+    dialogs: List[Dict],
+    output_path: str,
+    concurrency: int = 16,
+) -> Dict[str, Dict[str, float]]:
+    # Replays dialogs concurrently, writes one JSONL record per turn and
+    # returns latency percentiles in milliseconds per turn index
+    backend = AsyncSearchBackend(max_concurrency=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = defaultdict(list)
+
+    # Records go through the background writer so slow disks don't stall the
+    # replay; the queue is unbounded so none are dropped
+    open(output_path, "w").close()
+    output = QueryLog(output_path, max_queue=0, max_bytes=0)
+
+    def write(record: Dict) -> None:
+        output.log(**record)
+        if record.get("ok"):
+            latencies[record["turn"]].append(record["latency_ms"])
+
+    async def run(dialog: Dict) -> None:
+        async with semaphore:
+            await replay_dialog(backend, dialog, write)
+
+    try:
+        await asyncio.gather(*(run(dialog) for dialog in dialogs))
+    finally:
+        backend.close()
+        await registry.aclose()
+        output.close()
+
+    return {f"turn_{turn}": summarize(values) for turn, values in sorted(latencies.items())}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded multi-turn dialogs")
+    parser.add_argument("--dialogs", help="JSONL file of dialogs; runs the sample search when omitted")
+    parser.add_argument("--output", default="multisearch_results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.dialogs:
+        summary = asyncio.run(
+            replay_dialogs(load_dialogs(args.dialogs), args.output, args.concurrency)
+        )
+        print(json.dumps(summary, indent=2))
+    else:
+        search()
\ No newline at end of file
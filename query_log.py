@@ -0,0 +1,151 @@
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, TextIO
+
+import config
+import metrics
+
+
+_STOP = object()
+
+
+class QueryLog:
+    # Structured JSONL log of queries and responses. log() only puts the record
+    # on a bounded queue and never blocks: when the queue is full the record is
+    # dropped and counted. A background thread encodes records in batches and
+    # appends them to `path`, rotating it past `max_bytes` and keeping
+    # `backups` old files. `stream` replaces the file (no rotation), "-" as
+    # path means stdout. The thread starts with the first record.
+
+    def __init__(
+        self,
+        path: str = config.QUERY_LOG_PATH,
+        max_queue: int = config.QUERY_LOG_QUEUE,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        max_bytes: int = config.QUERY_LOG_MAX_BYTES,
+        backups: int = config.QUERY_LOG_BACKUPS,
+        stream: Optional[TextIO] = None,
+    ):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.enabled = bool(path) or stream is not None
+        self._stream = stream if stream is not None else (sys.stdout if path == "-" else None)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(0, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+        self._size = 0
+        self.counters: Dict[str, int] = {"logged": 0, "written": 0, "dropped": 0, "write_errors": 0, "rotations": 0}
+
+    def log(self, **record: Any) -> None:
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._start()
+        record.setdefault("ts", time.time())
+        try:
+            self._queue.put_nowait(record)
+            self.counters["logged"] += 1
+        except queue.Full:
+            self.counters["dropped"] += 1
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+                self._thread.start()
+
+    def _open(self) -> TextIO:
+        if self._stream is not None:
+            return self._stream
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._size = self._file.tell()
+        return self._file
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.counters["rotations"] += 1
+
+    def _write(self, records: List[Dict]) -> None:
+        data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        try:
+            output = self._open()
+            output.write(data)
+            output.flush()
+            self.counters["written"] += len(records)
+            if self._stream is None:
+                self._size += len(data)
+                if self.max_bytes and self._size >= self.max_bytes:
+                    self._rotate()
+        except (OSError, ValueError):
+            self.counters["write_errors"] += 1
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            item = first
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self, timeout: float = 5.0) -> None:
+        # Writes what is queued, then stops the thread
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "queued": self._queue.qsize(), **self.counters}
+
+
+# Process-wide log used by the services
+query_log = QueryLog()
+
+metrics.gauge(
+    "query_log_records_total", "Query log records by outcome",
+    lambda: {(event,): query_log.counters[event] for event in ("written", "dropped", "write_errors")},
+    ("outcome",), kind="counter",
+)
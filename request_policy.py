@@ -0,0 +1,57 @@
+import json
+from typing import Dict, Optional, Tuple
+
+import config
+from cache import normalize_query
+from search_pipeline import DEFAULT_SEARCH_SPEC
+
+
+# Search request specs by policy name. "full" is the original request, so its
+# cache keys are unchanged. SEARCH_POLICIES (JSON) overrides fields per policy,
+# e.g. {"fast": {"page_size": 3}}.
+POLICIES: Dict[str, dict] = {
+    # Short lookups ("paket combo sakti"): a few results, no generated summary
+    "lookup": {
+        **DEFAULT_SEARCH_SPEC,
+        "page_size": 5,
+        "include_summary": False,
+        "max_extractive_answer_count": 1,
+    },
+    # Typical questions: fewer results and a summary over the top three
+    "fast": {
+        **DEFAULT_SEARCH_SPEC,
+        "page_size": 5,
+        "summary_result_count": 3,
+    },
+    "full": dict(DEFAULT_SEARCH_SPEC),
+}
+for _name, _overrides in json.loads(config.SEARCH_POLICIES or "{}").items():
+    POLICIES[_name] = {**POLICIES.get(_name, DEFAULT_SEARCH_SPEC), **_overrides}
+
+# Words that make a short query a question rather than a lookup
+QUESTION_WORDS = frozenset((
+    "apa", "apakah", "bagaimana", "gimana", "kenapa", "mengapa", "berapa", "kapan",
+    "dimana", "mana", "siapa", "bisakah", "cara",
+    "what", "how", "why", "when", "where", "who", "which", "can",
+))
+
+
+def classify_query(query: str) -> str:
+    terms = normalize_query(query).split()
+    if len(terms) <= config.POLICY_LOOKUP_MAX_TERMS and not QUESTION_WORDS.intersection(terms):
+        return "lookup"
+    if len(terms) <= config.POLICY_FAST_MAX_TERMS:
+        return "fast"
+    return "full"
+
+
+def choose_policy(query: str, mode: Optional[str] = None) -> Tuple[str, dict]:
+    # An explicit mode from the client wins, then SEARCH_POLICY_DEFAULT;
+    # "auto" picks a policy from the query. Raises ValueError for unknown modes.
+    mode = mode or config.SEARCH_POLICY_DEFAULT
+    if mode == "auto":
+        mode = classify_query(query)
+    spec = POLICIES.get(mode)
+    if spec is None:
+        raise ValueError(f"Unknown search mode {mode!r}; expected auto or one of {sorted(POLICIES)}")
+    return mode, spec
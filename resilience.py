@@ -0,0 +1,286 @@
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import config
+import metrics
+from latency_stats import percentile
+
+
+T = TypeVar("T")
+
+# HTTP status codes of transient backend failures. GoogleAPICallError carries
+# the HTTP equivalent of its gRPC status in `code`.
+RETRYABLE_CODES = frozenset((429, 500, 502, 503, 504))
+
+# Only search can be repeated safely: converse_conversation appends to the
+# conversation and create_conversation makes a new one each time
+IDEMPOTENT_ENDPOINTS = frozenset(("search",))
+
+# Settings per endpoint; RESILIENCE_POLICIES (JSON) overrides fields, e.g.
+# {"search": {"hedge": true, "retries": 1}}. A deadline of None uses the
+# backend timeout.
+DEFAULT_SETTINGS = {
+    # Overall budget for the call, retries and hedges included
+    "deadline": None,
+    # Extra attempts after a retryable failure, with full-jitter backoff
+    "retries": 2,
+    "backoff_base": 0.05,
+    "backoff_max": 1.0,
+    # Send a second request when the first is slower than `hedge_after`
+    # seconds, or than the recent p95 when it is None
+    "hedge": False,
+    "hedge_after": None,
+    "hedge_min_samples": 20,
+    # Open the circuit after this many consecutive transient failures and
+    # probe again after `breaker_reset` seconds
+    "breaker_failures": 5,
+    "breaker_reset": 10.0,
+}
+ENDPOINT_SETTINGS: Dict[str, dict] = {
+    "search": dict(DEFAULT_SETTINGS),
+    "converse": dict(DEFAULT_SETTINGS),
+    "create_conversation": dict(DEFAULT_SETTINGS),
+}
+for _name, _overrides in json.loads(config.RESILIENCE_POLICIES or "{}").items():
+    ENDPOINT_SETTINGS[_name] = {**ENDPOINT_SETTINGS.get(_name, DEFAULT_SETTINGS), **_overrides}
+
+
+class CircuitOpenError(Exception):
+    # Raised without calling the backend while the circuit is open
+
+    code = 503
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"{endpoint} backend is unavailable; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_CODES
+
+
+def error_status(error: BaseException) -> int:
+    # HTTP status for an endpoint to answer with when a backend call failed
+    if isinstance(error, CircuitOpenError):
+        return 503
+    if isinstance(error, asyncio.TimeoutError):
+        return 504
+    code = getattr(error, "code", None)
+    if code in (429, 503, 504):
+        return code
+    return 500
+
+
+def retry_headers(error: BaseException) -> Optional[Dict[str, str]]:
+    if isinstance(error, CircuitOpenError):
+        return {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    return None
+
+
+class LatencyTracker:
+    # Latencies of the most recent successful attempts, for the hedge delay
+
+    def __init__(self, window: int = 512):
+        self._samples = deque(maxlen=window)
+        self._p95: Optional[float] = None
+        self._stale = 0
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._stale += 1
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def p95(self) -> float:
+        # Re-sorted at most every 32 samples
+        if self._p95 is None or self._stale >= 32:
+            self._p95 = percentile(sorted(self._samples), 0.95) if self._samples else 0.0
+            self._stale = 0
+        return self._p95
+
+
+class CircuitBreaker:
+    # closed: calls pass. open: calls fail fast for `reset_timeout` seconds.
+    # half_open: one probe call passes; its outcome closes or reopens.
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = self._clock()
+        if self.state == "open":
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        # A probe that never reported back (e.g. cancelled) is replaced after
+        # another reset period
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (self._clock() - self.opened_at))
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = self._clock()
+            self._probe_started = None
+
+
+class Resilience:
+    # Wraps the backend calls of one endpoint with an overall deadline,
+    # retries, optional hedging and a circuit breaker. `attempt` is called with
+    # the seconds left before the deadline and makes one backend request.
+
+    def __init__(self, endpoint: str, settings: dict, default_deadline: float = config.BACKEND_TIMEOUT):
+        self.endpoint = endpoint
+        self.deadline = settings["deadline"] or default_deadline
+        idempotent = endpoint in IDEMPOTENT_ENDPOINTS
+        self.retries = settings["retries"] if idempotent else 0
+        self.hedge = settings["hedge"] and idempotent
+        self.backoff_base = settings["backoff_base"]
+        self.backoff_max = settings["backoff_max"]
+        self.hedge_after = settings["hedge_after"]
+        self.hedge_min_samples = settings["hedge_min_samples"]
+        self.breaker = CircuitBreaker(settings["breaker_failures"], settings["breaker_reset"])
+        self.latency = LatencyTracker()
+        self._random = random.Random()
+        self.counters: Dict[str, int] = {
+            "calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+            "failures": 0, "short_circuited": 0,
+        }
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        if len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.p95()
+
+    def backoff(self, retry: int) -> float:
+        return self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    async def _timed(self, attempt: Callable[[float], Awaitable[T]], timeout: float) -> T:
+        self.counters["attempts"] += 1
+        start = time.perf_counter()
+        result = await attempt(timeout)
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, attempt: Callable[[float], Awaitable[T]], remaining: float) -> T:
+        delay = self.hedge_delay()
+        if delay is None or delay >= remaining:
+            return await self._timed(attempt, remaining)
+        pending = {asyncio.ensure_future(self._timed(attempt, remaining))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return done.pop().result()
+            self.counters["hedges"] += 1
+            hedge = asyncio.ensure_future(self._timed(attempt, remaining - delay))
+            pending.add(hedge)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, attempt: Callable[[float], Awaitable[T]]) -> T:
+        self.counters["calls"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        retry = 0
+        while True:
+            if not self.breaker.allow():
+                self.counters["short_circuited"] += 1
+                raise CircuitOpenError(self.endpoint, self.breaker.retry_after())
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"{self.endpoint} deadline of {self.deadline}s exceeded")
+                result = await self._hedged(attempt, remaining)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The backend answered; the request itself was bad
+                    self.breaker.record_success()
+                    self.counters["failures"] += 1
+                    raise
+                self.breaker.record_failure()
+                delay = self.backoff(retry + 1)
+                if retry >= self.retries or loop.time() + delay >= deadline:
+                    self.counters["failures"] += 1
+                    raise
+                retry += 1
+                self.counters["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "circuit": self.breaker.state,
+            "deadline_seconds": self.deadline,
+            "retries_allowed": self.retries,
+            "hedge_delay_seconds": self.hedge_delay(),
+            "p95_seconds": self.latency.p95(),
+        }
+
+
+def build_resilience(default_deadline: float = config.BACKEND_TIMEOUT) -> Dict[str, Resilience]:
+    return {
+        endpoint: Resilience(endpoint, settings, default_deadline)
+        for endpoint, settings in ENDPOINT_SETTINGS.items()
+    }
+
+
+def register_resilience_metrics(resilience: Dict[str, Resilience]) -> None:
+    metrics.gauge(
+        "backend_resilience_events_total", "Backend calls, attempts, retries, hedges and failures per endpoint",
+        lambda: {
+            (endpoint, event): value
+            for endpoint, wrapper in resilience.items()
+            for event, value in wrapper.counters.items()
+        },
+        ("endpoint", "event"), kind="counter",
+    )
+    metrics.gauge(
+        "backend_circuit_open", "1 while an endpoint's circuit breaker is not closed",
+        lambda: {(endpoint,): int(wrapper.breaker.state != "closed") for endpoint, wrapper in resilience.items()},
+        ("endpoint",),
+    )
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from clients import discoveryengine_module
+from serializer import result_to_dict, results_to_dicts
+
+if TYPE_CHECKING:
+    from google.cloud import discoveryengine_v1 as discoveryengine
+
+
+# Request parameters that shape the response; part of every cache key.
+# Specs may also set "include_summary" (default True) and
+# "max_extractive_answer_count" (default 0, none requested); see
+# request_policy.py.
+DEFAULT_SEARCH_SPEC = {
+    "page_size": 10,
+    "return_snippet": True,
+    "summary_result_count": 5,
+    "include_citations": True,
+    "ignore_adversarial_query": True,
+    "ignore_non_summary_seeking_query": True,
+    "query_expansion": "AUTO",
+    "spell_correction": "AUTO",
+}
+
+
+def serving_config_name(
+    project_id: str,
+    location: str,
+    data_store_id: str,
+    serving_config: str = "default_config",
+    collection: str = "",
+) -> str:
+    # Same value as client.serving_config_path(), without importing the
+    # client; with `collection`, the data store's path inside that collection
+    parent = f"projects/{project_id}/locations/{location}"
+    if collection:
+        parent += f"/collections/{collection}"
+    return f"{parent}/dataStores/{data_store_id}/servingConfigs/{serving_config}"
+
+
+def build_search_request(
+    client,
+    project_id: str,
+    location: str,
+    data_store_id: str,
+    search_query: str,
+    spec: dict = DEFAULT_SEARCH_SPEC,
+) -> discoveryengine.SearchRequest:
+    discoveryengine = discoveryengine_module()
+
+    # The full resource name of the search engine serving config
+    # e.g. projects/{project_id}/locations/{location}/dataStores/{data_store_id}/servingConfigs/{serving_config_id}
+    serving_config = client.serving_config_path(
+        project=project_id,
+        location=location,
+        data_store=data_store_id,
+        serving_config="default_config",
+    )
+
+    # Optional: Configuration options for search
+    # Refer to the `ContentSearchSpec` reference for all supported fields:
+    # https://cloud.google.com/python/docs/reference/discoveryengine/latest/google.cloud.discoveryengine_v1.types.SearchRequest.ContentSearchSpec
+    content_search_spec = discoveryengine.SearchRequest.ContentSearchSpec(
+        # For information about snippets, refer to:
+        # https://cloud.google.com/generative-ai-app-builder/docs/snippets
+        snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(
+            return_snippet=spec["return_snippet"]
+        ),
+    )
+    if spec.get("include_summary", True):
+        # For information about search summaries, refer to:
+        # https://cloud.google.com/generative-ai-app-builder/docs/get-search-summaries
+        content_search_spec.summary_spec = discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
+            summary_result_count=spec["summary_result_count"],
+            include_citations=spec["include_citations"],
+            ignore_adversarial_query=spec["ignore_adversarial_query"],
+            ignore_non_summary_seeking_query=spec["ignore_non_summary_seeking_query"],
+            # model_prompt_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec.ModelPromptSpec(
+            #     preamble="answer nicely please"
+            # ),
+        )
+    if spec.get("max_extractive_answer_count", 0):
+        content_search_spec.extractive_content_spec = discoveryengine.SearchRequest.ContentSearchSpec.ExtractiveContentSpec(
+            max_extractive_answer_count=spec["max_extractive_answer_count"]
+        )
+
+    # Refer to the `SearchRequest` reference for all supported fields:
+    # https://cloud.google.com/python/docs/reference/discoveryengine/latest/google.cloud.discoveryengine_v1.types.SearchRequest
+    return discoveryengine.SearchRequest(
+        serving_config=serving_config,
+        query=search_query,
+        page_size=spec["page_size"],
+        content_search_spec=content_search_spec,
+        query_expansion_spec=discoveryengine.SearchRequest.QueryExpansionSpec(
+            condition=discoveryengine.SearchRequest.QueryExpansionSpec.Condition[spec["query_expansion"]],
+        ),
+        spell_correction_spec=discoveryengine.SearchRequest.SpellCorrectionSpec(
+            mode=discoveryengine.SearchRequest.SpellCorrectionSpec.Mode[spec["spell_correction"]]
+        ),
+    )
+
+
+def build_search_body(search_query: str, spec: dict = DEFAULT_SEARCH_SPEC) -> dict:
+    # The same request as build_search_request, as the REST API's JSON body
+    content_search_spec = {"snippetSpec": {"returnSnippet": spec["return_snippet"]}}
+    if spec.get("include_summary", True):
+        content_search_spec["summarySpec"] = {
+            "summaryResultCount": spec["summary_result_count"],
+            "includeCitations": spec["include_citations"],
+            "ignoreAdversarialQuery": spec["ignore_adversarial_query"],
+            "ignoreNonSummarySeekingQuery": spec["ignore_non_summary_seeking_query"],
+        }
+    if spec.get("max_extractive_answer_count", 0):
+        content_search_spec["extractiveContentSpec"] = {
+            "maxExtractiveAnswerCount": spec["max_extractive_answer_count"]
+        }
+    return {
+        "query": search_query,
+        "pageSize": spec["page_size"],
+        "contentSearchSpec": content_search_spec,
+        "queryExpansionSpec": {"condition": spec["query_expansion"]},
+        "spellCorrectionSpec": {"mode": spec["spell_correction"]},
+    }
+
+
+def first_page(pager) -> discoveryengine.SearchResponse:
+    # client.search() returns a pager. Its first page is the SearchResponse of
+    # the RPC we already made; iterating further pages would issue new calls.
+    pages = getattr(pager, "pages", None)
+    if pages is None:
+        return pager
+    return next(iter(pages))
+
+
+async def first_page_async(pager) -> discoveryengine.SearchResponse:
+    pages = getattr(pager, "pages", None)
+    if pages is None:
+        return pager
+    return await pages.__anext__()
+
+
+def execute_search(
+    client,
+    request: discoveryengine.SearchRequest,
+    timeout: Optional[float] = None,
+) -> discoveryengine.SearchResponse:
+    # Exactly one backend round-trip per request
+    return first_page(client.search(request, timeout=timeout))
+
+
+async def execute_search_async(
+    client,
+    request: discoveryengine.SearchRequest,
+    timeout: Optional[float] = None,
+) -> discoveryengine.SearchResponse:
+    return await first_page_async(await client.search(request, timeout=timeout))
+
+
+def flatten_result(item: discoveryengine.SearchResponse.SearchResult) -> dict:
+    return result_to_dict(item)
+
+
+def flatten_results(response: discoveryengine.SearchResponse) -> List[dict]:
+    return results_to_dicts(response)
+
+
+def extract_summary(response: discoveryengine.SearchResponse) -> str:
+    return response.summary.summary_text
+
+
+def search_pipeline(
+    client,
+    project_id: str,
+    location: str,
+    data_store_id: str,
+    search_query: str,
+) -> Tuple[List[dict], str]:
+    request = build_search_request(client, project_id, location, data_store_id, search_query)
+    response = execute_search(client, request)
+    return flatten_results(response), extract_summary(response)
+
+
+def build_converse_request(
+    client,
+    project_id: str,
+    location: str,
+    data_store_id: str,
+    conversation_name: str,
+    current_query: str,
+) -> discoveryengine.ConverseConversationRequest:
+    discoveryengine = discoveryengine_module()
+    return discoveryengine.ConverseConversationRequest(
+        name=conversation_name,
+        query=discoveryengine.TextInput(input=current_query),
+        serving_config=client.serving_config_path(
+            project=project_id,
+            location=location,
+            data_store=data_store_id,
+            serving_config="default_config",
+        ),
+        # Options for the returned summary
+        summary_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
+            # Number of results to include in summary
+            summary_result_count=3,
+            include_citations=True,
+        ),
+    )
+
+
+def seed_conversation(context: Iterable[Tuple[str, str]]) -> discoveryengine.Conversation:
+    # A new conversation that starts with earlier (question, reply) exchanges
+    discoveryengine = discoveryengine_module()
+    messages = []
+    for question, reply in context:
+        messages.append(discoveryengine.ConversationMessage(user_input=discoveryengine.TextInput(input=question)))
+        messages.append(discoveryengine.ConversationMessage(reply=discoveryengine.Reply(summary={"summary_text": reply})))
+    return discoveryengine.Conversation(messages=messages)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from google.cloud import discoveryengine_v1 as discoveryengine
+    from google.protobuf import struct_pb2
+
+
+# One-pass conversion of search results into plain dict/list/str/float/bool
+# values. Works on the raw protobuf messages behind the proto-plus wrappers, so
+# no marshal objects are created per key, and keeps every nested list element
+# (all snippets and extractive answers). The output is directly encodable by
+# json or orjson.
+
+
+def _raw(message):
+    # proto-plus messages wrap a protobuf message; .pb() returns it without copying
+    message_type = type(message)
+    return message_type.pb(message) if hasattr(message_type, "pb") else message
+
+
+def value_to_python(value: struct_pb2.Value) -> Any:
+    kind = value.WhichOneof("kind")
+    if kind == "string_value":
+        return value.string_value
+    if kind == "struct_value":
+        return struct_to_dict(value.struct_value)
+    if kind == "list_value":
+        return [value_to_python(item) for item in value.list_value.values]
+    if kind == "number_value":
+        return value.number_value
+    if kind == "bool_value":
+        return value.bool_value
+    return None
+
+
+def struct_to_dict(struct: struct_pb2.Struct) -> Dict[str, Any]:
+    return {key: value_to_python(value) for key, value in struct.fields.items()}
+
+
+def result_to_dict(result: discoveryengine.SearchResponse.SearchResult) -> Dict[str, Any]:
+    return struct_to_dict(_raw(result).document.derived_struct_data)
+
+
+def results_to_dicts(response: discoveryengine.SearchResponse) -> List[Dict[str, Any]]:
+    return [struct_to_dict(result.document.derived_struct_data) for result in _raw(response).results]
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import config
+from shared_store import KeyValueStore
+
+
+# Client-supplied ids are only accepted if they look like ids we would issue
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+
+
+class Session:
+    __slots__ = (
+        "session_id", "conversation_name", "conversation_turns", "history",
+        "created_at", "last_used", "turns", "lock",
+    )
+
+    def __init__(self, session_id: str, history_size: int = config.SESSION_CONTEXT_TURNS):
+        self.session_id = session_id
+        self.conversation_name: Optional[str] = None
+        # Turns sent to the current conversation
+        self.conversation_turns = 0
+        # Latest (question, reply) exchanges, condensed, to seed a rollover
+        self.history: "deque[Tuple[str, str]]" = deque(maxlen=max(1, history_size))
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.turns = 0
+        # Serializes the turns of one conversation
+        self.lock = asyncio.Lock()
+
+
+class SessionStore:
+    # Maps session ids to Discovery Engine conversation names. Conversations are
+    # created lazily on the first turn of a session. The store holds at most
+    # `max_sessions` entries per worker: idle sessions expire after `ttl`
+    # seconds and the least recently used one is evicted when full.
+    #
+    # With `max_turns`, a session moves to a new conversation after that many
+    # turns, seeded with its last `context_turns` exchanges (replies cut to
+    # `context_chars`), so the history the backend carries stays bounded.
+    #
+    # With a `shared` store the mapping also lives there, so a follow-up that
+    # lands on another worker continues the same conversation. The per-session
+    # lock is still per worker: turns of one session sent to two workers at the
+    # same time are not serialized against each other. Shared-store calls run
+    # on a thread, since they can wait on the network or a file lock.
+
+    def __init__(
+        self,
+        create_conversation: Callable[[Optional[List[Tuple[str, str]]]], Awaitable],
+        max_sessions: int = config.SESSION_MAX,
+        ttl: float = config.SESSION_TTL,
+        shared: Optional[KeyValueStore] = None,
+        max_turns: int = config.SESSION_MAX_TURNS,
+        context_turns: int = config.SESSION_CONTEXT_TURNS,
+        context_chars: int = config.SESSION_CONTEXT_CHARS,
+    ):
+        # create_conversation(context) gets the exchanges to seed, or None
+        self._create_conversation = create_conversation
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self.shared = shared
+        self.max_turns = max_turns
+        self.context_turns = context_turns
+        self.context_chars = context_chars
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.metrics: Dict[str, float] = {
+            "created": 0,
+            "shared_hits": 0,
+            "create_races": 0,
+            "rollovers": 0,
+            "evicted_ttl": 0,
+            "evicted_lru": 0,
+            "creation_seconds_total": 0.0,
+            "creation_seconds_max": 0.0,
+        }
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def _evict(self, now: float) -> None:
+        # Entries are ordered by last use, so expired ones sit at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.metrics["evicted_ttl"] += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.metrics["evicted_lru"] += 1
+
+    def _get_or_add(self, session_id: Optional[str]) -> Session:
+        now = time.monotonic()
+        if not session_id or not SESSION_ID_PATTERN.match(session_id):
+            session_id = self.new_session_id()
+        session = self._sessions.get(session_id)
+        if session is not None and now - session.last_used >= self.ttl:
+            del self._sessions[session_id]
+            self.metrics["evicted_ttl"] += 1
+            session = None
+        if session is None:
+            session = self._sessions[session_id] = Session(session_id, self.context_turns)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_used = now
+        self._evict(now)
+        return session
+
+    @staticmethod
+    def _shared_key(session_id: str) -> str:
+        return f"session:{session_id}"
+
+    def _load_shared(self, session: Session) -> None:
+        # The shared store is the source of truth when there is one, so a
+        # session ended or expired on another worker is not resumed here
+        state = self.shared.get(self._shared_key(session.session_id))
+        if state is None:
+            session.conversation_name = None
+            session.conversation_turns = 0
+            session.history.clear()
+            return
+        state = json.loads(state)
+        if state["conversation"] != session.conversation_name:
+            self.metrics["shared_hits"] += 1
+        session.conversation_name = state["conversation"]
+        session.conversation_turns = state["turns"]
+        session.history.clear()
+        session.history.extend(tuple(exchange) for exchange in state["history"])
+
+    def _save_shared(self, session: Session, only_if_absent: bool = False) -> bool:
+        state = json.dumps({
+            "conversation": session.conversation_name,
+            "turns": session.conversation_turns,
+            "history": list(session.history),
+        })
+        key = self._shared_key(session.session_id)
+        if only_if_absent:
+            return self.shared.set_if_absent(key, state, self.ttl)
+        # Sliding expiry, like the local idle TTL
+        self.shared.set(key, state, self.ttl)
+        return True
+
+    async def _ensure_conversation(self, session: Session) -> None:
+        if self.shared is not None:
+            await asyncio.to_thread(self._load_shared, session)
+        if session.conversation_name is not None:
+            if not self.max_turns or session.conversation_turns < self.max_turns:
+                return
+            self.metrics["rollovers"] += 1
+            context = list(session.history)
+        else:
+            context = None
+        first = session.conversation_name is None
+
+        start = time.perf_counter()
+        conversation = await self._create_conversation(context)
+        elapsed = time.perf_counter() - start
+        self.metrics["created"] += 1
+        self.metrics["creation_seconds_total"] += elapsed
+        self.metrics["creation_seconds_max"] = max(self.metrics["creation_seconds_max"], elapsed)
+        session.conversation_name = conversation.name
+        session.conversation_turns = 0
+        if (
+            self.shared is not None
+            and first
+            and not await asyncio.to_thread(self._save_shared, session, True)
+        ):
+            # Another worker started this session first; continue its
+            # conversation and leave ours unused
+            self.metrics["create_races"] += 1
+            await asyncio.to_thread(self._load_shared, session)
+
+    def remember(self, session: Session, question: str, reply: str) -> None:
+        # Keeps a condensed copy of the exchange for seeding a rollover
+        if self.max_turns:
+            session.history.append((question[:self.context_chars], reply[:self.context_chars]))
+
+    @asynccontextmanager
+    async def session(self, session_id: Optional[str] = None):
+        session = self._get_or_add(session_id)
+        async with session.lock:
+            await self._ensure_conversation(session)
+            yield session
+            session.turns += 1
+            session.conversation_turns += 1
+            session.last_used = time.monotonic()
+            if self.shared is not None:
+                await asyncio.to_thread(self._save_shared, session)
+
+    async def end(self, session_id: Optional[str]) -> None:
+        if session_id:
+            self._sessions.pop(session_id, None)
+            if self.shared is not None:
+                await asyncio.to_thread(self.shared.delete, self._shared_key(session_id))
+
+    def stats(self) -> Dict[str, float]:
+        created = self.metrics["created"]
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            "max_turns": self.max_turns,
+            "shared_store": self.shared.name if self.shared is not None else None,
+            **self.metrics,
+            "creation_seconds_avg": self.metrics["creation_seconds_total"] / created if created else 0.0,
+        }
@@ -0,0 +1,250 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+import config
+
+
+# SqliteStore drops expired rows once every this many writes
+PURGE_EVERY = 1000
+
+
+class KeyValueStore(ABC):
+    # Minimal string key/value interface for state shared between workers.
+    # Implementations must be safe to use from several threads; ttl is in
+    # seconds and None means no expiry.
+
+    name = "abstract"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def set_if_absent(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        # Atomic across every worker sharing the store; True if the value was written
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self, prefix: str = "") -> None:
+        ...
+
+    @abstractmethod
+    def count(self, prefix: str = "") -> int:
+        ...
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStore(KeyValueStore):
+    # Per-process store, the default for a single worker
+
+    name = "memory"
+
+    def __init__(self):
+        self._items: Dict[str, Tuple[Optional[float], str]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires is not None and expires <= time.time():
+            del self._items[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._items[key] = (time.time() + ttl if ttl is not None else None, value)
+
+    def set_if_absent(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._items[key] = (time.time() + ttl if ttl is not None else None, value)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            for key in [key for key in self._items if key.startswith(prefix)]:
+                del self._items[key]
+
+    def count(self, prefix: str = "") -> int:
+        with self._lock:
+            return sum(1 for key in self._items if key.startswith(prefix))
+
+
+class SqliteStore(KeyValueStore):
+    # Shared between the worker processes of one host through a WAL-mode
+    # SQLite file; SQLite's own locking makes set_if_absent atomic.
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, expires),
+            )
+            self._writes += 1
+            purge = self._writes % PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def set_if_absent(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        with self._lock:
+            # An expired row counts as absent and is replaced
+            cursor = self._conn.execute(
+                "INSERT INTO kv (key, value, expires) VALUES (?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires"
+                " WHERE kv.expires IS NOT NULL AND kv.expires <= ?",
+                (key, value, expires, now),
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)
+            ).rowcount
+
+    def count(self, prefix: str = "") -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ExternalStore(KeyValueStore):
+    # Adapter for an external KV service with a redis-py style client
+    # (get, set with px/nx, delete). Any client with that surface works.
+
+    name = "external"
+
+    def __init__(self, client, prefix: str = "tselchatbot:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    @staticmethod
+    def _px(ttl: Optional[float]) -> Optional[int]:
+        # Milliseconds, at least 1: whole seconds would turn a sub-second TTL
+        # into ex=0, which the server rejects
+        return max(1, int(ttl * 1000)) if ttl is not None else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.client.set(self.prefix + key, value, px=self._px(ttl))
+
+    def set_if_absent(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return bool(self.client.set(self.prefix + key, value, px=self._px(ttl), nx=True))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def clear(self, prefix: str = "") -> None:
+        for key in self.client.scan_iter(match=self.prefix + prefix + "*"):
+            self.client.delete(key)
+
+    def count(self, prefix: str = "") -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + prefix + "*"))
+
+    def close(self) -> None:
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            close()
+
+
+def build_store(url: str = config.STATE_STORE_URL) -> KeyValueStore:
+    if url in ("", "memory://"):
+        return MemoryStore()
+    if url.startswith("sqlite:///"):
+        return SqliteStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(f"STATE_STORE_URL={url} needs the redis package")
+        return ExternalStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported STATE_STORE_URL: {url}")
+
+
+_shared_store: Optional[KeyValueStore] = None
+
+
+def shared_store() -> Optional[KeyValueStore]:
+    # The process-wide store configured by STATE_STORE_URL, or None when state
+    # stays in each worker's own memory
+    global _shared_store
+    if config.STATE_STORE_URL in ("", "memory://"):
+        return None
+    if _shared_store is None:
+        _shared_store = build_store(config.STATE_STORE_URL)
+    return _shared_store
+
+
+def close_shared_store() -> None:
+    # On shutdown; a later shared_store() call opens a new store
+    global _shared_store
+    if _shared_store is not None:
+        _shared_store.close()
+        _shared_store = None
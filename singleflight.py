@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    __slots__ = ("task", "waiters", "joined")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+        self.joined = 0
+
+
+class SingleFlight:
+    # Coalesces concurrent identical calls: while a call for `key` is in
+    # flight, later callers with the same key await the same task instead of
+    # starting their own. Nothing is kept once the call finishes; persistence
+    # is the response cache's job.
+    #
+    # A caller being cancelled does not cancel the shared call while others
+    # still wait on it; the call is only cancelled when its last waiter goes
+    # away, and it is forgotten at that moment so an identical request arriving
+    # next starts a fresh call instead of joining the cancelled one.
+    # Exceptions are propagated to every waiter.
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.counters: Dict[str, int] = {
+            "calls": 0,
+            "backend_calls": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "abandoned": 0,
+            # Backend calls avoided by joining an in-flight call that completed
+            "saved": 0,
+        }
+
+    def _finished(self, key: str, call: _Call, task: asyncio.Task) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if task.cancelled():
+            return
+        self.counters["saved"] += call.joined
+        if task.exception() is not None:
+            self.counters["errors"] += 1
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.counters["calls"] += 1
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda task: self._finished(key, call, task))
+            self.counters["backend_calls"] += 1
+        else:
+            call.joined += 1
+            self.counters["coalesced"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+                self.counters["abandoned"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "in_flight": len(self._calls)}
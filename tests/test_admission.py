@@ -0,0 +1,75 @@
+import asyncio
+
+from admission import AdmissionController
+from batch import search_batch
+
+
+LANES = {
+    "interactive": {"priority": 0, "share": 1.0, "queue": 8, "queue_timeout": 5.0},
+    "batch": {"priority": 1, "share": 0.5, "queue": 8, "queue_timeout": 5.0},
+}
+
+
+def batch_search(controller, started, release):
+    # Like main.py's batch search_one: every query is admitted in the batch lane
+    async def search(query):
+        async with controller.admit("batch"):
+            started.append(query)
+            await release.wait()
+            return [], query
+
+    return search
+
+
+def test_interactive_request_runs_while_batch_queries_are_queued():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=4, lanes=LANES)
+        started, release = [], asyncio.Event()
+        batch = asyncio.ensure_future(
+            search_batch([f"q{i}" for i in range(6)], batch_search(controller, started, release), max_concurrency=6)
+        )
+        await asyncio.sleep(0.01)
+        lanes = controller.stats()["lanes"]
+        # The batch holds its half of the slots; the rest of its queries wait
+        assert lanes["batch"]["in_flight"] == 2
+        assert lanes["batch"]["waiting"] == 4
+
+        async with controller.admit("interactive"):
+            assert controller.lane_in_flight["interactive"] == 1
+            assert controller.stats()["lanes"]["batch"]["waiting"] == 4
+
+        release.set()
+        items = await batch
+        return items, started
+
+    items, started = asyncio.run(scenario())
+    assert all(item["ok"] for item in items)
+    assert sorted(started) == [f"q{i}" for i in range(6)]
+
+
+def test_released_slot_goes_to_interactive_before_queued_batch_queries():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=2, lanes={**LANES, "batch": {**LANES["batch"], "share": 1.0}})
+        started, release = [], asyncio.Event()
+        batch = asyncio.ensure_future(
+            search_batch([f"q{i}" for i in range(4)], batch_search(controller, started, release), max_concurrency=4)
+        )
+        await asyncio.sleep(0.01)
+        # Both slots are taken by batch queries and two more wait
+        assert started == ["q0", "q1"]
+        assert controller.stats()["lanes"]["batch"]["waiting"] == 2
+
+        async def interactive():
+            async with controller.admit("interactive"):
+                started.append("interactive")
+
+        chat = asyncio.ensure_future(interactive())
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(chat, batch)
+        return started
+
+    started = asyncio.run(scenario())
+    # The first slot freed went to the chat request, ahead of q2 and q3
+    assert started[:3] == ["q0", "q1", "interactive"]
+    assert sorted(started[3:]) == ["q2", "q3"]
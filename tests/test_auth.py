@@ -0,0 +1,92 @@
+import asyncio
+import datetime
+import threading
+import time
+
+from auth import TokenProvider
+
+
+NOW = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+class FakeCredentials:
+    # google-auth credentials stand-in: refresh() issues a token valid for an hour
+    def __init__(self, token=None, expiry=None, refresh_delay=0.0):
+        self.token = token
+        self.expiry = expiry
+        self.refresh_delay = refresh_delay
+        self.refresh_calls = 0
+        self.on_refresh = None
+
+    def refresh(self, request):
+        self.refresh_calls += 1
+        if self.on_refresh is not None:
+            self.on_refresh()
+        time.sleep(self.refresh_delay)
+        self.token = f"token-{self.refresh_calls}"
+        self.expiry = NOW + datetime.timedelta(hours=1)
+
+
+def provider(credentials, margin=300):
+    return TokenProvider(credentials, refresh_margin=margin, transport_request=lambda: None, now=lambda: NOW)
+
+
+def test_concurrent_callers_trigger_one_refresh():
+    credentials = FakeCredentials(refresh_delay=0.05)
+    tokens = provider(credentials)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tokens.token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["token-1"] * 8
+    assert credentials.refresh_calls == 1
+    assert tokens.refreshes == 1
+
+
+def test_concurrent_async_callers_trigger_one_refresh():
+    credentials = FakeCredentials(refresh_delay=0.05)
+    tokens = provider(credentials)
+
+    async def scenario():
+        return await asyncio.gather(*(tokens.token_async() for _ in range(8)))
+
+    assert asyncio.run(scenario()) == ["token-1"] * 8
+    assert credentials.refresh_calls == 1
+
+
+def test_token_inside_margin_is_refreshed_ahead_of_expiry():
+    credentials = FakeCredentials("old", NOW + datetime.timedelta(seconds=100))
+    assert provider(credentials, margin=300).token() == "token-1"
+    assert credentials.refresh_calls == 1
+
+
+def test_token_outside_margin_is_reused():
+    credentials = FakeCredentials("current", NOW + datetime.timedelta(seconds=1000))
+    tokens = provider(credentials, margin=300)
+    assert tokens.token() == "current"
+    assert asyncio.run(tokens.token_async()) == "current"
+    assert credentials.refresh_calls == 0
+
+
+def test_token_async_refreshes_off_the_event_loop():
+    credentials = FakeCredentials()
+    loop_ran = threading.Event()
+    # The refresh only finishes once the loop has run another coroutine; a
+    # refresh blocking the loop would time out instead
+    waited = []
+    credentials.on_refresh = lambda: waited.append(loop_ran.wait(2))
+    tokens = provider(credentials)
+
+    async def tick():
+        await asyncio.sleep(0.01)
+        loop_ran.set()
+
+    async def scenario():
+        return await asyncio.gather(tokens.token_async(), tick())
+
+    token, _ = asyncio.run(scenario())
+    assert token == "token-1"
+    assert waited == [True]
+    assert credentials.refresh_calls == 1
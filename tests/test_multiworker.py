@@ -0,0 +1,120 @@
+# Several worker processes sharing one SQLite state store, as uvicorn workers
+# do with STATE_STORE_URL=sqlite:///... Each worker is a fresh spawned process
+# with its own SessionStore, ResponseCache and store connection.
+# benchmarks/check_multiworker.py runs the same check end to end against
+# followup_api workers and the stand-in backend.
+
+import asyncio
+import multiprocessing
+import os
+import queue
+from types import SimpleNamespace
+
+from cache import MemoryCache, ResponseCache, SharedStoreCache
+from sessions import SessionStore
+from shared_store import SqliteStore
+
+
+SESSION_ID = "session-multiworker-0001"
+CONTEXT = multiprocessing.get_context("spawn")
+
+
+def start_session(path, worker):
+    # The first turn of SESSION_ID on this worker
+    async def create_conversation(context):
+        return SimpleNamespace(name=f"conversation-{worker}")
+
+    async def turn():
+        sessions = SessionStore(create_conversation, shared=SqliteStore(path))
+        async with sessions.session(SESSION_ID) as session:
+            name = session.conversation_name
+        return {"pid": os.getpid(), "conversation": name, **sessions.metrics}
+
+    return asyncio.run(turn())
+
+
+def cached_search(path, worker):
+    async def search():
+        cache = ResponseCache([MemoryCache(10), SharedStoreCache(SqliteStore(path))], ttl=60)
+        calls = []
+
+        async def compute():
+            calls.append(worker)
+            return [[{"link": f"https://example.com/{worker}"}], f"summary from {worker}"]
+
+        value, status = await cache.get_or_compute("apa itu sisa kuota", compute)
+        return {"pid": os.getpid(), "value": value, "status": status, "calls": len(calls),
+                "shared_hits": cache.stats_counters["shared_hits"]}
+
+    return asyncio.run(search())
+
+
+def take_lock(path, worker, barrier):
+    store = SqliteStore(path)
+    barrier.wait()
+    return {"pid": os.getpid(), "won": store.set_if_absent("warmer:lock", worker, 30)}
+
+
+def _worker_main(results, index, target, args):
+    try:
+        results.put((index, target(*args), None))
+    except BaseException as e:
+        results.put((index, None, f"{type(e).__name__}: {e}"))
+
+
+def run_workers(target, *args_per_worker, timeout=30):
+    # Runs target(*args) in one spawned process per entry, all at once
+    results = CONTEXT.Queue()
+    processes = [
+        CONTEXT.Process(target=_worker_main, args=(results, index, target, args))
+        for index, args in enumerate(args_per_worker)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = {}
+    try:
+        for _ in processes:
+            index, result, error = results.get(timeout=timeout)
+            assert error is None, error
+            outcomes[index] = result
+    except queue.Empty:
+        raise AssertionError("a worker did not answer in time")
+    finally:
+        for process in processes:
+            process.join(timeout)
+    return [outcomes[index] for index in range(len(processes))]
+
+
+def test_session_started_on_one_worker_continues_on_another(tmp_path):
+    path = str(tmp_path / "state.db")
+    [worker_a] = run_workers(start_session, (path, "a"))
+    [worker_b] = run_workers(start_session, (path, "b"))
+    assert worker_a["pid"] != worker_b["pid"]
+    assert worker_a["conversation"] == "conversation-a"
+    assert worker_a["created"] == 1
+    # Worker B resolves A's conversation instead of creating its own
+    assert worker_b["conversation"] == "conversation-a"
+    assert worker_b["created"] == 0
+    assert worker_b["shared_hits"] == 1
+
+
+def test_response_cached_on_one_worker_is_a_shared_hit_on_another(tmp_path):
+    path = str(tmp_path / "state.db")
+    [worker_a] = run_workers(cached_search, (path, "a"))
+    [worker_b] = run_workers(cached_search, (path, "b"))
+    assert worker_a["pid"] != worker_b["pid"]
+    assert (worker_a["status"], worker_a["calls"]) == ("miss", 1)
+    assert (worker_b["status"], worker_b["calls"]) == ("hit", 0)
+    assert worker_b["shared_hits"] == 1
+    assert worker_b["value"] == worker_a["value"]
+
+
+def test_set_if_absent_admits_exactly_one_worker(tmp_path):
+    path = str(tmp_path / "state.db")
+    # Creates the table before the race, as the first worker to boot would
+    SqliteStore(path).close()
+    workers = 4
+    barrier = CONTEXT.Barrier(workers)
+    outcomes = run_workers(take_lock, *((path, f"worker-{i}", barrier) for i in range(workers)))
+    assert len({outcome["pid"] for outcome in outcomes}) == workers
+    assert sum(outcome["won"] for outcome in outcomes) == 1
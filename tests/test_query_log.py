@@ -0,0 +1,20 @@
+import json
+
+from query_log import QueryLog
+
+
+def test_off_by_default():
+    log = QueryLog()
+    log.log(query="apa itu sisa kuota")
+    assert not log.enabled
+    assert log.counters["logged"] == 0
+    log.close()
+
+
+def test_writes_records_when_a_path_is_set(tmp_path):
+    path = tmp_path / "query_log.jsonl"
+    log = QueryLog(str(path))
+    log.log(query="apa itu sisa kuota", status=200)
+    log.close()
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["query"] for record in records] == ["apa itu sisa kuota"]
@@ -0,0 +1,19 @@
+import pytest
+
+from request_policy import POLICIES, choose_policy
+
+
+def test_requests_without_mode_keep_the_full_summary():
+    policy, spec = choose_policy("kuota")
+    assert policy == "full"
+    assert spec is POLICIES["full"]
+
+
+def test_auto_is_opt_in():
+    assert choose_policy("kuota", "auto")[0] == "lookup"
+    assert choose_policy("kuota", "fast")[0] == "fast"
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        choose_policy("kuota", "fastest")
@@ -0,0 +1,62 @@
+import search_pipeline
+
+
+class FakePager:
+    # Like the client's SearchPager: every page after the first is another
+    # backend call
+    def __init__(self, client, request):
+        self.client = client
+        self.request = request
+
+    @property
+    def pages(self):
+        yield {"query": self.request, "page": 0}
+        while True:
+            self.client.calls.append(self.request)
+            yield {"query": self.request, "page": len(self.client.calls)}
+
+
+class FakeSearchClient:
+    def __init__(self):
+        self.calls = []
+
+    def search(self, request, timeout=None):
+        self.calls.append(request)
+        return FakePager(self, request)
+
+
+def test_execute_search_makes_one_call():
+    client = FakeSearchClient()
+    response = search_pipeline.execute_search(client, "apa itu sisa kuota")
+    assert response == {"query": "apa itu sisa kuota", "page": 0}
+    assert client.calls == ["apa itu sisa kuota"]
+
+
+def test_first_page_accepts_plain_response():
+    response = {"results": []}
+    assert search_pipeline.first_page(response) is response
+
+
+def test_search_pipeline_one_call_per_query(monkeypatch):
+    # Results and summary both come from the one response
+    monkeypatch.setattr(search_pipeline, "build_search_request", lambda client, p, l, d, query: query)
+    monkeypatch.setattr(search_pipeline, "flatten_results", lambda response: [response["query"]])
+    monkeypatch.setattr(search_pipeline, "extract_summary", lambda response: f"summary of {response['query']}")
+    client = FakeSearchClient()
+    queries = ["apa itu sisa kuota", "cara cek pulsa", "paket combo sakti"]
+
+    for query in queries:
+        results, summary = search_pipeline.search_pipeline(client, "project", "global", "data-store", query)
+        assert results == [query]
+        assert summary == f"summary of {query}"
+
+    assert client.calls == queries
+
+
+def test_serving_config_name():
+    assert search_pipeline.serving_config_name("p", "global", "d") == (
+        "projects/p/locations/global/dataStores/d/servingConfigs/default_config"
+    )
+    assert search_pipeline.serving_config_name("p", "global", "d", "default_search", "default_collection") == (
+        "projects/p/locations/global/collections/default_collection/dataStores/d/servingConfigs/default_search"
+    )
@@ -0,0 +1,158 @@
+import asyncio
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import shared_store
+from cache import MISS, TRIM_EVERY, MemoryCache, ResponseCache, SharedStoreCache, SqliteCache
+from sessions import SessionStore
+from shared_store import ExternalStore, KeyValueStore, MemoryStore, SqliteStore
+
+
+class RecordingStore(MemoryStore):
+    # Records the thread each store call ran on
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key, value, ttl=None):
+        self.threads.append(threading.get_ident())
+        super().set(key, value, ttl)
+
+    def set_if_absent(self, key, value, ttl=None):
+        self.threads.append(threading.get_ident())
+        return super().set_if_absent(key, value, ttl)
+
+    def delete(self, key):
+        self.threads.append(threading.get_ident())
+        super().delete(key)
+
+
+def test_response_cache_reads_shared_tier_off_the_event_loop():
+    store = RecordingStore()
+    cache = ResponseCache([MemoryCache(10), SharedStoreCache(store)], ttl=60)
+
+    async def scenario():
+        async def compute():
+            return [[{"link": "https://example.com"}], "summary"]
+
+        first = await cache.get_or_compute("key", compute)
+        cache.tiers[0].clear()
+        second = await cache.get_or_compute("key", compute)
+        return first, second, await cache.aget("other"), threading.get_ident()
+
+    first, second, missing, loop_thread = asyncio.run(scenario())
+    assert first[1] == "miss"
+    assert second == (first[0], "hit")
+    assert missing is MISS
+    assert cache.stats_counters["shared_hits"] == 1
+    assert store.threads and loop_thread not in store.threads
+
+
+def test_session_store_calls_shared_store_off_the_event_loop():
+    store = RecordingStore()
+    conversations = iter(range(100))
+
+    async def create_conversation(context):
+        return SimpleNamespace(name=f"conversation-{next(conversations)}")
+
+    sessions = SessionStore(create_conversation, shared=store)
+
+    async def scenario():
+        async with sessions.session("session-0001") as session:
+            name = session.conversation_name
+        await sessions.end("session-0001")
+        return name, threading.get_ident()
+
+    name, loop_thread = asyncio.run(scenario())
+    assert name == "conversation-0"
+    assert len(store) == 0
+    assert store.threads and loop_thread not in store.threads
+
+
+class FakeRedis:
+    def __init__(self):
+        self.calls = []
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        self.calls.append((key, ex, px, nx))
+        return True
+
+
+def test_external_store_keeps_sub_second_ttls():
+    client = FakeRedis()
+    store = ExternalStore(client, prefix="")
+    store.set("a", "1", 0.25)
+    store.set_if_absent("b", "1", 0.0001)
+    store.set("c", "1", 30)
+    store.set("d", "1")
+    assert client.calls == [
+        ("a", None, 250, False),
+        ("b", None, 1, True),
+        ("c", None, 30000, False),
+        ("d", None, None, False),
+    ]
+
+
+def test_store_interface_is_abstract():
+    class PartialStore(KeyValueStore):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        KeyValueStore()
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_response_cache_reads_sqlite_tier_off_the_event_loop(tmp_path, monkeypatch):
+    tier = SqliteCache(str(tmp_path / "cache.db"), max_entries=10)
+    threads = []
+    get = tier.get
+    monkeypatch.setattr(tier, "get", lambda key: threads.append(threading.get_ident()) or get(key))
+    cache = ResponseCache([MemoryCache(10), tier], ttl=60)
+
+    async def scenario():
+        await cache.aset("key", [[], "summary"])
+        cache.tiers[0].clear()
+        return await cache.aget("key"), threading.get_ident()
+
+    value, loop_thread = asyncio.run(scenario())
+    assert value == [[], "summary"]
+    assert threads and loop_thread not in threads
+    tier.close()
+
+
+def test_sqlite_tier_trims_to_max_entries(tmp_path):
+    tier = SqliteCache(str(tmp_path / "cache.db"), max_entries=10)
+    for i in range(TRIM_EVERY):
+        tier.set(f"key-{i}", i, 60)
+    assert len(tier) == 10
+    assert tier.evictions == TRIM_EVERY - 10
+    # The most recently written entries are kept
+    assert tier.get(f"key-{TRIM_EVERY - 1}") == TRIM_EVERY - 1
+    assert tier.get("key-0") is MISS
+    tier.close()
+
+
+def test_shared_store_is_closed_on_shutdown(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "STATE_STORE_URL", f"sqlite:///{tmp_path / 'state.db'}")
+    monkeypatch.setattr(shared_store, "_shared_store", None)
+    store = shared_store.shared_store()
+    assert isinstance(store, SqliteStore)
+    assert shared_store.shared_store() is store
+    shared_store.close_shared_store()
+    with pytest.raises(sqlite3.ProgrammingError):
+        store.get("key")
+    # The next caller opens a new store
+    reopened = shared_store.shared_store()
+    assert reopened is not store
+    assert reopened.get("key") is None
+    shared_store.close_shared_store()
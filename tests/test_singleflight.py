@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_backend_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("q", fetch) for _ in range(5)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert stats["coalesced"] == 4
+    assert stats["saved"] == 4
+    assert stats["in_flight"] == 0
+
+
+def test_rejoin_after_last_waiter_cancelled_starts_fresh_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return f"answer {len(calls)}"
+
+        first = asyncio.ensure_future(flight.do("q", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        # The cancelled call's done callback has not necessarily run yet
+        second = await flight.do("q", fetch)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return second, calls, flight.stats()
+
+    second, calls, stats = asyncio.run(scenario())
+    assert second == "answer 2"
+    assert len(calls) == 2
+    assert stats["abandoned"] == 1
+    assert stats["coalesced"] == 0
+    assert stats["saved"] == 0
+
+
+def test_abandoned_call_is_not_counted_as_saved():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(1)
+
+        waiters = [asyncio.ensure_future(flight.do("q", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flight.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["coalesced"] == 2
+    assert stats["saved"] == 0
+    assert stats["abandoned"] == 1
+    assert stats["in_flight"] == 0
@@ -1,9 +1,11 @@
-from typing import List
+import asyncio
+from typing import Dict, List, Sequence, Tuple
 
-from google.api_core.client_options import ClientOptions
-from google.cloud import discoveryengine_v1 as discoveryengine
-from proto.marshal.collections import repeated
-import google.protobuf.message
+import config
+from async_backend import AsyncSearchBackend
+from batch import RateLimiter, search_batch
+from clients import registry
+from search_pipeline import search_pipeline
 
 
 # TODO(developer): Uncomment these variables before running the sample.
@@ -18,94 +20,44 @@ def search_sample(
     location: str,
     data_store_id: str,
     search_query: str,
-) -> List[discoveryengine.SearchResponse]:
-    #  For more information, refer to:
-    # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
-    client_options = (
-        ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-        if location != "global"
-        else None
-    )
-
-    # Create a client
-    client = discoveryengine.SearchServiceClient(client_options=client_options)
+) -> Tuple[List[dict], str]:
+    # Shared client from the process-wide pool
+    client = registry.get(location, "search")
 
-    # The full resource name of the search engine serving config
-    # e.g. projects/{project_id}/locations/{location}/dataStores/{data_store_id}/servingConfigs/{serving_config_id}
-    serving_config = client.serving_config_path(
-        project=project_id,
-        location=location,
-        data_store=data_store_id,
-        serving_config="default_config",
-    )
+    return search_pipeline(client, project_id, location, data_store_id, search_query)
 
-    # Optional: Configuration options for search
-    # Refer to the `ContentSearchSpec` reference for all supported fields:
-    # https://cloud.google.com/python/docs/reference/discoveryengine/latest/google.cloud.discoveryengine_v1.types.SearchRequest.ContentSearchSpec
-    content_search_spec = discoveryengine.SearchRequest.ContentSearchSpec(
-        # For information about snippets, refer to:
-        # https://cloud.google.com/generative-ai-app-builder/docs/snippets
-        snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(
-            return_snippet=True
-        ),
-        # For information about search summaries, refer to:
-        # https://cloud.google.com/generative-ai-app-builder/docs/get-search-summaries
-        summary_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
-            summary_result_count=5,
-            include_citations=True,
-            ignore_adversarial_query=True,
-            ignore_non_summary_seeking_query=True,
-        ),
-    )
 
-    # Refer to the `SearchRequest` reference for all supported fields:
-    # https://cloud.google.com/python/docs/reference/discoveryengine/latest/google.cloud.discoveryengine_v1.types.SearchRequest
-    request = discoveryengine.SearchRequest(
-        serving_config=serving_config,
-        query=search_query,
-        page_size=10,
-        content_search_spec=content_search_spec,
-        query_expansion_spec=discoveryengine.SearchRequest.QueryExpansionSpec(
-            condition=discoveryengine.SearchRequest.QueryExpansionSpec.Condition.AUTO,
-        ),
-        spell_correction_spec=discoveryengine.SearchRequest.SpellCorrectionSpec(
-            mode=discoveryengine.SearchRequest.SpellCorrectionSpec.Mode.AUTO
-        ),
+def search_batch_sample(
+    project_id: str,
+    location: str,
+    data_store_id: str,
+    search_queries: Sequence[str],
+    max_concurrency: int = config.BATCH_CONCURRENCY,
+    rate_per_second: float = config.BATCH_RATE_PER_SECOND,
+) -> List[Dict]:
+    # Runs the queries concurrently with pooled clients, within the rate limit.
+    # Items come back in input order; failed queries carry "error" instead of
+    # aborting the batch.
+    async def run():
+        backend = AsyncSearchBackend(max_concurrency=max_concurrency)
+        try:
+            return await search_batch(
+                search_queries,
+                lambda query: backend.search(project_id, location, data_store_id, query),
+                max_concurrency=max_concurrency,
+                rate_limiter=RateLimiter(rate_per_second, max_concurrency),
+            )
+        finally:
+            backend.close()
+            await registry.aclose()
+
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    search_sample(
+        project_id,
+        location,
+        data_store_id,
+        search_query
     )
-
-    results = client.search(request).results
-    summary = client.search(request).summary.summary_text
-    
-    # print(type(results))
-    json_list = []
-
-    for item in results:
-        doc = item.document
-        item_dict = {}
-        for key, value in doc.derived_struct_data.items():
-            if isinstance(value, str) or isinstance(value, int):
-                item_dict[key] = value
-            # else:
-            #     item_dict[key] = type(value)
-            elif isinstance(value, repeated.RepeatedComposite):
-                item_dict[key] = type(value)
-                nested_dict = {}
-                for sub_key, sub_value in value[0].items():
-                    nested_dict[sub_key] = sub_value
-                item_dict[key] = nested_dict
-            
-        
-        json_list.append(item_dict)
-
-    # print(json_list)
-    # print(summary.summary_text) 
-
-    return json_list, summary
-
-
-search_sample(
-    project_id,
-    location,
-    data_store_id,
-    search_query
-)
\ No newline at end of file
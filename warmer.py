@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import config
+import metrics
+from batch import RateLimiter
+from cache import normalize_query
+
+
+class QueryFrequency:
+    # Decayed request counts per (normalized query, policy): every count halves
+    # after `half_life` seconds, so today's popular questions outrank last
+    # month's. Keeps the `max_queries` highest scores.
+
+    def __init__(self, half_life: float = config.WARMER_HALF_LIFE, max_queries: int = config.WARMER_MAX_QUERIES):
+        self.half_life = half_life
+        self.max_queries = max(1, max_queries)
+        # (normalized query, policy) -> [score at `updated`, updated, query as asked]
+        self._entries: Dict[Tuple[str, str], List] = {}
+
+    def _decayed(self, entry: List, now: float) -> float:
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+    def record(self, query: str, policy: str, weight: float = 1.0, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        key = (normalize_query(query), policy)
+        if not key[0]:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [weight, now, query]
+            if len(self._entries) > self.max_queries:
+                self._prune(now)
+        else:
+            entry[0] = self._decayed(entry, now) + weight
+            entry[1] = now
+
+    def _prune(self, now: float) -> None:
+        # Drops the lowest tenth at once rather than one entry per insert
+        keep = int(self.max_queries * 0.9)
+        ranked = sorted(self._entries.items(), key=lambda item: self._decayed(item[1], now), reverse=True)
+        self._entries = dict(ranked[:keep])
+
+    def top(self, n: int, now: Optional[float] = None) -> List[Tuple[str, str, float]]:
+        # [(query, policy, score)], most frequent first
+        now = time.time() if now is None else now
+        ranked = sorted(
+            ((entry[2], policy, self._decayed(entry, now)) for (_, policy), entry in self._entries.items()),
+            key=lambda item: item[2],
+            reverse=True,
+        )
+        return ranked[:n]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CacheWarmer:
+    # Refresh-ahead for the search cache. Each run takes the `top_n` most
+    # frequent queries, skips those whose cached response outlives
+    # `refresh_before`, and re-issues the rest through `refresh(query, policy)`
+    # (which returns whether it called the backend), within `budget` backend
+    # calls, `concurrency` at a time and `rate` per second. With a shared
+    # `lock_store`, one worker warms per interval.
+
+    def __init__(
+        self,
+        refresh: Callable[[str, str], Awaitable[bool]],
+        remaining: Callable[[str, str], float],
+        frequency: Optional[QueryFrequency] = None,
+        top_n: int = config.WARMER_TOP_N,
+        interval: float = config.WARMER_INTERVAL,
+        refresh_before: float = config.WARMER_REFRESH_BEFORE,
+        budget: int = config.WARMER_BUDGET,
+        concurrency: int = config.WARMER_CONCURRENCY,
+        rate: float = config.WARMER_RATE,
+        lock_store=None,
+    ):
+        self.refresh = refresh
+        self.remaining = remaining
+        self.frequency = frequency if frequency is not None else QueryFrequency()
+        self.top_n = top_n
+        self.interval = interval
+        self.refresh_before = refresh_before
+        self.budget = budget
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rate, self.concurrency)
+        self.lock_store = lock_store
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Dict[str, Any] = {}
+        self.counters: Dict[str, int] = {
+            "runs": 0, "runs_skipped": 0, "refreshed": 0, "fresh": 0, "local": 0,
+            "failed": 0, "over_budget": 0, "backend_calls": 0,
+        }
+
+    def due(self) -> Tuple[List[Tuple[str, str, float]], int]:
+        # (top queries to refresh now, how many of the top are still fresh)
+        due, fresh = [], 0
+        for query, policy, score in self.frequency.top(self.top_n):
+            if self.remaining(query, policy) > self.refresh_before:
+                fresh += 1
+            else:
+                due.append((query, policy, score))
+        return due, fresh
+
+    async def run_once(self) -> Dict[str, Any]:
+        if self.lock_store is not None and not await asyncio.to_thread(
+            self.lock_store.set_if_absent, "warmer:lock", str(os.getpid()), max(1.0, self.interval * 0.9)
+        ):
+            # Another worker warms the shared cache this interval
+            self.counters["runs_skipped"] += 1
+            return self.last_run
+        self.counters["runs"] += 1
+        start = time.perf_counter()
+        # Expiry lookups may read a disk tier
+        due, fresh = await asyncio.to_thread(self.due)
+        selected, over_budget = due[:self.budget], len(due) - min(len(due), self.budget)
+        run = {"top": len(due) + fresh, "fresh": fresh, "due": len(due), "over_budget": over_budget,
+               "refreshed": 0, "local": 0, "failed": 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh_one(query: str, policy: str) -> None:
+            async with semaphore:
+                await self.rate_limiter.acquire()
+                try:
+                    called = await self.refresh(query, policy)
+                except Exception:
+                    run["failed"] += 1
+                    self.counters["backend_calls"] += 1
+                    return
+                if called:
+                    run["refreshed"] += 1
+                    self.counters["backend_calls"] += 1
+                else:
+                    run["local"] += 1
+
+        await asyncio.gather(*(refresh_one(query, policy) for query, policy, _ in selected))
+        for event in ("fresh", "refreshed", "local", "failed", "over_budget"):
+            self.counters[event] += run[event]
+        run["started_at"] = time.time()
+        run["duration_seconds"] = round(time.perf_counter() - start, 3)
+        self.last_run = run
+        return run
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                # A failed run must not stop later ones
+                self.counters["failed"] += 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def coverage(self) -> float:
+        # Share of the top queries answerable from the cache right now
+        top = self.frequency.top(self.top_n)
+        if not top:
+            return 0.0
+        return sum(1 for query, policy, _ in top if self.remaining(query, policy) > 0) / len(top)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "tracked_queries": len(self.frequency),
+            "top_n": self.top_n,
+            "coverage": round(self.coverage(), 4),
+            "interval_seconds": self.interval,
+            "budget": self.budget,
+            "last_run": self.last_run,
+            **self.counters,
+        }
+
+
+def register_warmer_metrics(warmer: CacheWarmer) -> None:
+    metrics.gauge(
+        "cache_warmer_events_total", "Cache warmer runs, refreshes and backend calls",
+        lambda: {(event,): value for event, value in warmer.counters.items()},
+        ("event",), kind="counter",
+    )
+    metrics.gauge("cache_warmer_coverage", "Share of the top queries currently cached", warmer.coverage)
+
+
+def queries_from_log(paths: Iterable[str], service: str = "main") -> Iterable[Tuple[str, str, float]]:
+    # (query, policy, timestamp) of the successful searches in query log files
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("service") == service and record.get("status") == 200 and record.get("query"):
+                    yield record["query"], record.get("policy") or "full", record.get("ts", time.time())
+
+
+def queries_from_list(paths: Iterable[str], policy: str) -> Iterable[Tuple[str, str, float]]:
+    # One query per line, e.g. the questions to have answered at launch
+    now = time.time()
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield line.strip(), policy, now
+
+
+async def warm(args) -> Dict[str, Any]:
+    # Imported here so the module can be used without the FastAPI app
+    import main
+    from shared_store import shared_store
+
+    if main.warmer is None:
+        raise SystemExit("CACHE_ENABLED is off; nothing to warm")
+    if not (config.CACHE_SQLITE_PATH or shared_store() is not None):
+        print("warning: only the in-memory cache is configured, warmed entries end with this process")
+    frequency = QueryFrequency(max_queries=max(config.WARMER_MAX_QUERIES, args.top))
+    records = queries_from_log(args.log) if args.log else queries_from_list(args.queries, args.policy)
+    for query, policy, ts in records:
+        frequency.record(query, policy, now=min(ts, time.time()))
+    warmer = CacheWarmer(
+        main.refresh_search,
+        main.cached_remaining,
+        frequency,
+        top_n=args.top,
+        refresh_before=args.refresh_before,
+        budget=args.budget,
+        concurrency=args.concurrency,
+        rate=args.rate,
+    )
+    await main.open_clients()
+    try:
+        run = await warmer.run_once()
+        return {**run, "coverage": warmer.coverage(), "tracked_queries": len(frequency)}
+    finally:
+        await main.close_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Warm the search cache with the most frequent queries, e.g. before a deploy. "
+        "Use CACHE_SQLITE_PATH or STATE_STORE_URL so the entries outlive this process."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--log", nargs="+", help="Query log files (QUERY_LOG_PATH and its backups)")
+    source.add_argument("--queries", nargs="+", help="Text files with one query per line")
+    parser.add_argument("--policy", default="full", help="Request policy for --queries")
+    parser.add_argument("--top", type=int, default=config.WARMER_TOP_N)
+    parser.add_argument("--budget", type=int, default=config.WARMER_BUDGET)
+    parser.add_argument("--concurrency", type=int, default=config.WARMER_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=config.WARMER_RATE)
+    parser.add_argument(
+        "--refresh-before", type=float, default=math.inf,
+        help="Only refresh entries expiring within this many seconds (default: all)",
+    )
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(warm(args)), indent=2, default=str))